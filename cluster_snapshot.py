@@ -0,0 +1,146 @@
+import time
+from datetime import datetime
+from druid_conf import DEFAULT_POOL, DruidConfig
+from typing import Dict, List, Optional, Union
+
+DISABLED_WORKER_VERSION = ""
+
+
+def parse_druid_time(value: Union[str, None]) -> Union[float, None]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class WorkerState:
+    def __init__(self, payload: dict, default_capacity: int):
+        worker = payload.get("worker") or {}
+        self.host: str = worker.get("host", "")
+        self.category: str = worker.get("category", "")
+        self.version: Optional[str] = worker.get("version")
+        self.capacity: int = worker.get("capacity") or default_capacity
+        self.curr_capacity_used: int = payload.get("currCapacityUsed", 0)
+        self.running_task_ids: List[str] = payload.get("runningTasks") or []
+
+    @property
+    def is_disabled(self) -> bool:
+        # The overlord announces a disabled middle-manager with an empty version.
+        return self.version == DISABLED_WORKER_VERSION
+
+    @property
+    def free_workers(self) -> int:
+        return max(0, self.capacity - self.curr_capacity_used)
+
+
+def route_task_to_pool(task: dict, pools: List[DruidConfig]) -> str:
+    for pool_conf in pools:
+        if task.get("type") in pool_conf.pool_task_types or task.get("dataSource") in pool_conf.pool_datasources:
+            return pool_conf.pool
+    for pool_conf in pools:
+        if not pool_conf.pool_task_types and not pool_conf.pool_datasources:
+            return pool_conf.pool
+    return pools[0].pool
+
+
+class ClusterSnapshot:
+    """Druid state fetched once per autoscaler tick from the overlord."""
+
+    def __init__(self, workers: List[dict], pending_tasks: List[dict], running_tasks: List[dict], taken_at: Optional[float] = None,
+                 pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.pool = pool
+        self.taken_at = taken_at if taken_at is not None else time.time()
+        self.raw_workers = workers
+        self.pending_tasks = pending_tasks
+        self.running_tasks = running_tasks
+        self.workers: List[WorkerState] = [WorkerState(worker, self.conf.workers_per_mm) for worker in workers]
+        self.__workers_by_mm_id: Dict[int, WorkerState] = {}
+        for worker in self.workers:
+            mm_id = self._parse_mm_id(worker.host)
+            if mm_id is not None:
+                self.__workers_by_mm_id[mm_id] = worker
+
+    def for_pool(self, pool: str) -> "ClusterSnapshot":
+        """Returns the view of this snapshot holding only the given pool's workers and tasks."""
+        if len(self.conf.pool_names) == 1:
+            return ClusterSnapshot(self.raw_workers, self.pending_tasks, self.running_tasks, self.taken_at, pool)
+        pool_view = ClusterSnapshot([], [], [], self.taken_at, pool)
+        if pool_view.conf.pool_category:
+            workers = [worker for worker in self.raw_workers if (worker.get("worker") or {}).get("category") == pool_view.conf.pool_category]
+        else:
+            workers = [worker for worker in self.raw_workers if pool_view._parse_mm_id((worker.get("worker") or {}).get("host", "")) is not None]
+        running_task_ids = {task_id for worker in workers for task_id in worker.get("runningTasks") or []}
+        pools = [DruidConfig(pool_name) for pool_name in self.conf.pool_names]
+        pending_tasks = [task for task in self.pending_tasks if route_task_to_pool(task, pools) == pool]
+        running_tasks = [task for task in self.running_tasks if task.get("id") in running_task_ids]
+        return ClusterSnapshot(workers, pending_tasks, running_tasks, self.taken_at, pool)
+
+    def _parse_mm_id(self, host: str) -> Union[int, None]:
+        pod_name = host.split(":")[0].split(".")[0]
+        prefix = f"{self.conf.middle_manager}-"
+        if not pod_name.startswith(prefix):
+            return None
+        ordinal = pod_name[len(prefix):]
+        if not ordinal.isdigit():
+            return None
+        return int(ordinal)
+
+    @property
+    def pending_tasks_count(self) -> int:
+        return len(self.pending_tasks)
+
+    @property
+    def running_tasks_count(self) -> int:
+        return len(self.running_tasks)
+
+    @property
+    def running_mm_count(self) -> int:
+        return len(self.workers)
+
+    def get_worker(self, mm_id: int) -> Union[WorkerState, None]:
+        return self.__workers_by_mm_id.get(mm_id)
+
+    def get_running_tasks_on_mm(self, mm_id: int) -> Union[int, None]:
+        worker = self.get_worker(mm_id)
+        if worker is None:
+            return None
+        return worker.curr_capacity_used
+
+    def get_free_workers_on_mm(self, mm_id: int) -> Union[int, None]:
+        worker = self.get_worker(mm_id)
+        if worker is None:
+            return None
+        return worker.free_workers
+
+    def is_mm_idle(self, mm_id: int) -> Union[bool, None]:
+        worker = self.get_worker(mm_id)
+        if worker is None:
+            return None
+        return worker.curr_capacity_used == 0
+
+    def is_mm_disable(self, mm_id: int) -> Union[bool, None]:
+        worker = self.get_worker(mm_id)
+        if worker is None:
+            return None
+        return worker.is_disabled
+
+    def get_task_start_times_on_mm(self, mm_id: int) -> Union[List[float], None]:
+        worker = self.get_worker(mm_id)
+        if worker is None:
+            return None
+        created_at_by_task_id = {task.get("id"): parse_druid_time(task.get("createdTime")) for task in self.running_tasks}
+        start_times = [created_at_by_task_id.get(task_id) for task_id in worker.running_task_ids]
+        return [start_time if start_time is not None else self.taken_at for start_time in start_times]
+
+    def mark_mm_enabled(self, mm_id: int) -> None:
+        worker = self.get_worker(mm_id)
+        if worker is not None:
+            worker.version = None
+
+    def mark_mm_disabled(self, mm_id: int) -> None:
+        worker = self.get_worker(mm_id)
+        if worker is not None:
+            worker.version = DISABLED_WORKER_VERSION
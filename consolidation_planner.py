@@ -0,0 +1,46 @@
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DruidConfig
+from typing import Dict, List
+
+
+class ConsolidationPlan:
+    def __init__(self, drain_mm_ids: List[int], drain_times: Dict[int, float]):
+        # Middle-managers to disable, top ordinal first, so new tasks land on the lower ones.
+        self.drain_mm_ids = drain_mm_ids
+        self.drain_times = drain_times
+
+    def __str__(self) -> str:
+        drain_times = ", ".join(f"MM-{mm_id}: {self.drain_times[mm_id]:.0f}s" for mm_id in self.drain_mm_ids)
+        return f"drain {self.drain_mm_ids} (estimated drain time {drain_times})"
+
+
+class ConsolidationPlanner:
+    """Plans which top-ordinal middle-managers to drain and remove.
+
+    A StatefulSet can only shed its highest ordinals, so the planner drains a
+    contiguous block from the top and stops at the first lower middle-manager
+    whose tasks are not expected to finish within scale_down.max_drain_time.
+    """
+
+    def __init__(self):
+        self.conf = DruidConfig()
+
+    def estimate_drain_time(self, mm_id: int, snapshot: ClusterSnapshot) -> float:
+        start_times = snapshot.get_task_start_times_on_mm(mm_id)
+        if start_times is None:
+            return float("inf")
+        if not start_times:
+            return 0.0
+        return max(max(0.0, self.conf.expected_task_duration - (snapshot.taken_at - start_time)) for start_time in start_times)
+
+    def plan(self, snapshot: ClusterSnapshot, target_mm_count: int) -> ConsolidationPlan:
+        running_mm_count = snapshot.running_mm_count
+        drain_mm_ids = []
+        drain_times = {}
+        for mm_id in range(running_mm_count - 1, target_mm_count - 1, -1):
+            drain_time = self.estimate_drain_time(mm_id, snapshot)
+            if drain_mm_ids and drain_time > self.conf.max_drain_time:
+                break
+            drain_mm_ids.append(mm_id)
+            drain_times[mm_id] = drain_time
+        return ConsolidationPlan(drain_mm_ids, drain_times)
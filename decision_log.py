@@ -0,0 +1,62 @@
+import json
+import os
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DEFAULT_POOL, DruidConfig
+from logging_config import logger
+from tick_trace import TickTracer
+from typing import List, Union
+
+
+class DecisionRecorder:
+    """Appends one JSON line per pool and tick to shadow.decision_log with the actions taken or, in shadow mode, intended.
+
+    Ticks with actions also carry the snapshot that led to them, so a decision
+    can be replayed; quiet ticks only keep the counts needed to line two
+    decision streams up in shadow_diff.py.
+    """
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.pool = pool
+        self.path = self.conf.decision_log
+        self.__snapshot: Union[ClusterSnapshot, None] = None
+        self.__actions: List[dict] = []
+
+    def begin(self, snapshot: ClusterSnapshot) -> None:
+        self.__snapshot = snapshot
+        self.__actions = []
+
+    def record(self, action: str, **details) -> None:
+        self.__actions.append({"action": action, **details})
+        TickTracer.action(action, **details)
+        if self.conf.shadow_enabled:
+            logger.info(f"Shadow mode, not acting on {action} {details}")
+
+    def end(self, disable_mm_count: int) -> None:
+        snapshot = self.__snapshot
+        if not self.path or snapshot is None:
+            return
+        entry = {
+            "taken_at": snapshot.taken_at,
+            "pool": self.pool,
+            "shadow": self.conf.shadow_enabled,
+            "workers_per_mm": self.conf.workers_per_mm,
+            "running_mm_count": snapshot.running_mm_count,
+            "disable_mm_count": disable_mm_count,
+            "pending_tasks_count": snapshot.pending_tasks_count,
+            "running_tasks_count": snapshot.running_tasks_count,
+            "actions": self.__actions,
+        }
+        if self.__actions:
+            entry["snapshot"] = {
+                "workers": snapshot.raw_workers,
+                "pending_tasks": snapshot.pending_tasks,
+                "running_tasks": snapshot.running_tasks,
+            }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as fp:
+                fp.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except OSError as err:
+            logger.error(f"Couldn't append decisions to {self.path}: {err}")
+        self.__snapshot = None
@@ -0,0 +1,131 @@
+import time
+from cluster_snapshot import ClusterSnapshot
+from decision_log import DecisionRecorder
+from druid_api_helper import DruidApiHelper
+from druid_conf import DEFAULT_POOL, DruidConfig
+from leader_election import LeaderElector
+from logging_config import logger
+from metrics import DRAIN_DURATION, DRAINING_MMS
+from state_store import get_state_store
+from typing import Dict, List, Union
+
+DRAINING = "draining"
+SHUTTING_DOWN = "shutting_down"
+OVERDUE = "overdue"
+DRAINED = "drained"
+DRAIN_PHASES = (DRAINING, SHUTTING_DOWN, OVERDUE, DRAINED)
+
+
+class DrainState:
+    def __init__(self, mm_id: int, disabled_at: float, phase: str = DRAINING, shutdown_at: Union[float, None] = None):
+        self.mm_id = mm_id
+        self.disabled_at = disabled_at
+        self.phase = phase
+        self.shutdown_at = shutdown_at
+
+    def to_dict(self) -> dict:
+        return {"disabled_at": self.disabled_at, "phase": self.phase, "shutdown_at": self.shutdown_at}
+
+    def __str__(self) -> str:
+        return f"MM-{self.mm_id} {self.phase}"
+
+
+class DrainTracker:
+    """Follows every disabled middle-manager of a pool from disable until its tasks are gone and it can be removed.
+
+    draining -> drained once the middle-manager runs no task. A middle-manager
+    still busy drain.deadline after it was disabled either gets its tasks of
+    drain.shutdown_task_types shut down through the overlord (shutting_down),
+    so their supervisors restart them on an enabled middle-manager, or is
+    flagged overdue and left to finish. The states are persisted, so a restart
+    or a new leader picks up the drains where they were.
+    """
+
+    def __init__(self, pool: str = DEFAULT_POOL, druid_api_helper: Union[DruidApiHelper, None] = None,
+                 recorder: Union[DecisionRecorder, None] = None):
+        self.conf = DruidConfig(pool)
+        self.pool = pool
+        self.druid_api_helper = druid_api_helper or DruidApiHelper(pool)
+        self.recorder = recorder or DecisionRecorder(pool)
+        self.store = get_state_store(pool, "drains")
+        self.drains: Dict[int, DrainState] = {}
+        self.load()
+
+    def load(self) -> None:
+        state = self.store.load()
+        if state is None:
+            return
+        self.drains = {int(mm_id): DrainState(int(mm_id), drain["disabled_at"], drain["phase"], drain.get("shutdown_at"))
+                       for mm_id, drain in state.get("drains", {}).items()}
+        if self.drains:
+            logger.info(f"Resuming middle-manager drains: {', '.join(str(drain) for drain in self.drains.values())}")
+
+    def _save(self) -> None:
+        for phase in DRAIN_PHASES:
+            DRAINING_MMS.labels(self.pool, phase).set(len([drain for drain in self.drains.values() if drain.phase == phase]))
+        if not LeaderElector.can_act():
+            logger.warning("Lost the leader lease, not persisting middle-manager drain state")
+            return
+        state = {"drains": {str(mm_id): drain.to_dict() for mm_id, drain in self.drains.items()}, "updated_at": time.time()}
+        if not self.store.save(state):
+            logger.error("Failed to persist middle-manager drain state")
+
+    def _set_phase(self, drain: DrainState, phase: str, reason: str) -> None:
+        logger.info(f"MM-{drain.mm_id} drain moved from {drain.phase} to {phase}: {reason}")
+        drain.phase = phase
+
+    def sync(self, snapshot: ClusterSnapshot) -> None:
+        """Drops drains of middle-managers that were removed or enabled again since the last tick."""
+        dropped = []
+        for mm_id in list(self.drains):
+            if mm_id >= snapshot.running_mm_count or snapshot.is_mm_disable(mm_id) is False:
+                dropped.append(self.drains.pop(mm_id))
+        if dropped:
+            logger.info(f"Stopped tracking drains that were removed or enabled again: {', '.join(str(drain) for drain in dropped)}")
+            self._save()
+
+    def start(self, mm_ids: List[int], snapshot: ClusterSnapshot) -> None:
+        started = [mm_id for mm_id in mm_ids if mm_id not in self.drains]
+        for mm_id in started:
+            self.drains[mm_id] = DrainState(mm_id, snapshot.taken_at)
+        if started:
+            logger.info(f"Started draining middle-managers: {started}")
+            self._save()
+
+    def _shutdown_tasks(self, drain: DrainState, snapshot: ClusterSnapshot) -> None:
+        worker = snapshot.get_worker(drain.mm_id)
+        task_types = {task.get("id"): task.get("type") for task in snapshot.running_tasks}
+        task_ids = [task_id for task_id in (worker.running_task_ids if worker is not None else [])
+                    if task_types.get(task_id) in self.conf.drain_shutdown_task_types]
+        for task_id in task_ids:
+            if self.druid_api_helper.shutdown_task(task_id) is None:
+                logger.error(f"Failed to shut down task {task_id} on MM-{drain.mm_id}")
+                continue
+            self.recorder.record("shutdown_task", mm_id=drain.mm_id, task_id=task_id)
+        drain.shutdown_at = snapshot.taken_at
+        self._set_phase(drain, SHUTTING_DOWN, f"deadline passed, asked the overlord to shut down {task_ids}")
+
+    def update(self, snapshot: ClusterSnapshot) -> List[int]:
+        """Advances every drain by one tick and returns the drained middle-managers, top ordinal first."""
+        is_changed = False
+        for drain in self.drains.values():
+            if drain.phase == DRAINED:
+                continue
+            if snapshot.is_mm_idle(drain.mm_id):
+                DRAIN_DURATION.observe(snapshot.taken_at - drain.disabled_at)
+                self._set_phase(drain, DRAINED, f"no tasks left after {snapshot.taken_at - drain.disabled_at:.0f}s")
+                is_changed = True
+            elif drain.phase == DRAINING and snapshot.taken_at - drain.disabled_at > self.conf.drain_deadline:
+                if self.conf.drain_shutdown_task_types:
+                    self._shutdown_tasks(drain, snapshot)
+                else:
+                    self._set_phase(drain, OVERDUE, f"still running {snapshot.get_running_tasks_on_mm(drain.mm_id)} tasks after {self.conf.drain_deadline}s")
+                is_changed = True
+        if is_changed:
+            self._save()
+        return sorted((mm_id for mm_id, drain in self.drains.items() if drain.phase == DRAINED), reverse=True)
+
+    def forget(self, mm_ids: List[int]) -> None:
+        for mm_id in mm_ids:
+            self.drains.pop(mm_id, None)
+        self._save()
@@ -1,16 +1,101 @@
-from druid_conf import DruidConfig
+from druid_conf import DEFAULT_POOL, DruidConfig
+from leader_election import LeaderElector
+from cluster_snapshot import ClusterSnapshot
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, RequestException
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
 from logging_config import logger
-from typing import Union
+from metrics import DRUID_API_DURATION, DRUID_API_FAILURES
+from tick_trace import TickTracer
+from typing import Callable, Dict, List, Tuple, TypeVar, Union
+
+T = TypeVar("T")
 
 
 class HttpRequest:
+    _session = None
+    _deadline = None
 
-    @staticmethod
-    def get(url):
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        if cls._session is None:
+            conf = DruidConfig()
+            retry = Retry(
+                total=conf.http_retries,
+                backoff_factor=conf.http_backoff_factor,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=conf.http_pool_connections, pool_maxsize=conf.http_pool_maxsize, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            cls._session = session
+        return cls._session
+
+    @classmethod
+    def start_deadline(cls, seconds: float) -> None:
+        cls._deadline = time.monotonic() + seconds
+
+    @classmethod
+    def clear_deadline(cls) -> None:
+        cls._deadline = None
+
+    @classmethod
+    def _get_timeout(cls) -> Union[Tuple[float, float], None]:
+        conf = DruidConfig()
+        connect_timeout, read_timeout = conf.http_connect_timeout, conf.http_read_timeout
+        if cls._deadline is None:
+            return connect_timeout, read_timeout
+        remaining = cls._deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    @classmethod
+    def _is_snapshot_route(cls, route: str) -> bool:
+        conf = DruidConfig()
+        return route in (conf.workers_route, conf.pending_tasks_route, conf.all_running_tasks_route)
+
+    @classmethod
+    def get(cls, url):
+        route = urlparse(url).path
+        started_at = time.monotonic()
+        data = cls._get(url)
+        seconds = time.monotonic() - started_at
+        DRUID_API_DURATION.labels("GET", route).observe(seconds)
+        if data is None:
+            DRUID_API_FAILURES.labels("GET", route).inc()
+        # The overlord lists are already in the trace record's snapshot.
+        TickTracer.api_call("druid", "GET", route, url, seconds, data is not None, None if cls._is_snapshot_route(route) else data)
+        return data
+
+    @classmethod
+    def post(cls, url, json={}, route=None):
+        # Routes carrying an id pass their template, so metric labels stay bounded.
+        route = route or urlparse(url).path
+        started_at = time.monotonic()
+        data = cls._post(url, json=json)
+        seconds = time.monotonic() - started_at
+        DRUID_API_DURATION.labels("POST", route).observe(seconds)
+        if data is None:
+            DRUID_API_FAILURES.labels("POST", route).inc()
+        TickTracer.api_call("druid", "POST", route, url, seconds, data is not None, data)
+        return data
+
+    @classmethod
+    def _get(cls, url):
+        timeout = cls._get_timeout()
+        if timeout is None:
+            logger.error(f"Tick deadline exceeded, skipping request. API: {url}")
+            return None
         try:
-            response = requests.get(url)
+            response = cls._get_session().get(url, timeout=timeout)
             response.raise_for_status()
             data = {}
             try:
@@ -26,10 +111,14 @@ class HttpRequest:
             logger.error(f"Request error occurred: {req_err}. API: {url}")
             return None
 
-    @staticmethod
-    def post(url, json={}):
+    @classmethod
+    def _post(cls, url, json={}):
+        timeout = cls._get_timeout()
+        if timeout is None:
+            logger.error(f"Tick deadline exceeded, skipping request. API: {url}")
+            return None
         try:
-            response = requests.post(url, json=json)
+            response = cls._get_session().post(url, json=json, timeout=timeout)
             response.raise_for_status()
             data = {}
             try:
@@ -47,49 +136,56 @@ class HttpRequest:
 
 class DruidApiHelper:
 
-    def __init__(self):
-        self.druid_conf = DruidConfig()      
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.druid_conf = DruidConfig(pool)
         self.http_requester = HttpRequest()
 
-    def get_count_of_pending_tasks(self) -> Union[int, None]:
-        url = f"http://{self.druid_conf.overlord_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.overlord_port}{self.druid_conf.pending_tasks_route}"
-        pending_tasks = self.http_requester.get(url)
-        if pending_tasks is not None:
-            pending_tasks_count = len(pending_tasks)
-            return pending_tasks_count
-        return None  
-    
-    def get_count_of_running_mm(self) -> Union[int, None]:
-        url = f"http://{self.druid_conf.overlord_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.overlord_port}{self.druid_conf.workers_route}"
-        workers = self.http_requester.get(url)
-        if workers is not None:
-            running_mm_count = len(workers)
-            return running_mm_count
-        return None
-    
-    def get_running_tasks_count(self) -> Union[int, None]:
-        url = f"http://{self.druid_conf.overlord_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.overlord_port}{self.druid_conf.all_running_tasks_route}"
-        running_tasks = self.http_requester.get(url)
-        if running_tasks is not None:
-            return len(running_tasks)
-        return None
-    
+    def start_tick(self) -> None:
+        self.http_requester.start_deadline(self.druid_conf.tick_deadline)
+
+    def end_tick(self) -> None:
+        self.http_requester.clear_deadline()
+
+    def get_pending_tasks(self) -> Union[List[dict], None]:
+        url = self.druid_conf.endpoints.pending_tasks
+        return self.http_requester.get(url)
+
+    def get_workers(self) -> Union[List[dict], None]:
+        url = self.druid_conf.endpoints.workers
+        return self.http_requester.get(url)
+
+    def get_running_tasks(self) -> Union[List[dict], None]:
+        url = self.druid_conf.endpoints.all_running_tasks
+        return self.http_requester.get(url)
+
+    def get_cluster_snapshot(self) -> Union[ClusterSnapshot, None]:
+        workers = self.get_workers()
+        if workers is None:
+            return None
+        pending_tasks = self.get_pending_tasks()
+        if pending_tasks is None:
+            return None
+        running_tasks = self.get_running_tasks()
+        if running_tasks is None:
+            return None
+        return ClusterSnapshot(workers, pending_tasks, running_tasks)
+
     def get_running_tasks_on_mm(self, mm_id: int) -> Union[int, None]:
-        url = f"http://{self.druid_conf.middle_manager}-{mm_id}.{self.druid_conf.mm_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.mm_port}{self.druid_conf.running_tasks_route}"
+        url = self.druid_conf.endpoints.running_tasks.format(mm_id=mm_id)
         running_tasks = self.http_requester.get(url)
         if running_tasks is not None:
             return len(running_tasks)
         return None    
     
     def get_free_workers_on_mm(self, mm_id: int) -> Union[int, None]:
-        url = f"http://{self.druid_conf.middle_manager}-{mm_id}.{self.druid_conf.mm_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.mm_port}{self.druid_conf.running_tasks_route}"
+        url = self.druid_conf.endpoints.running_tasks.format(mm_id=mm_id)
         running_tasks = self.http_requester.get(url)
         if running_tasks is not None:
             return self.druid_conf.workers_per_mm - len(running_tasks)
         return None
         
     def is_mm_idle(self, mm_id: int) -> Union[bool, None]:
-        url = f"http://{self.druid_conf.middle_manager}-{mm_id}.{self.druid_conf.mm_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.mm_port}{self.druid_conf.running_tasks_route}"
+        url = self.druid_conf.endpoints.running_tasks.format(mm_id=mm_id)
         running_tasks = self.http_requester.get(url)
         if running_tasks is not None and len(running_tasks) == 0:
             return True
@@ -98,7 +194,7 @@ class DruidApiHelper:
         return None
     
     def is_mm_disable(self, mm_id: int) -> Union[bool, None]:
-        url = f"http://{self.druid_conf.middle_manager}-{mm_id}.{self.druid_conf.mm_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.mm_port}{self.druid_conf.worker_status_route}"
+        url = self.druid_conf.endpoints.worker_status.format(mm_id=mm_id)
         resp = self.http_requester.get(url)
         if resp is not None:
             if not list(resp.values())[0]:
@@ -106,16 +202,56 @@ class DruidApiHelper:
             return False
         return None 
 
+    @staticmethod
+    def _can_write(action: str) -> bool:
+        if LeaderElector.can_act():
+            return True
+        logger.warning(f"Lost the leader lease, not {action}")
+        return False
+
     def disable_idle_mm(self, mm_id: int) -> Union[bool, None]:
-        url = f"http://{self.druid_conf.middle_manager}-{mm_id}.{self.druid_conf.mm_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.mm_port}{self.druid_conf.disable_worker_route}"
+        if not self._can_write(f"disabling middle-manager id: {mm_id}"):
+            return None
+        url = self.druid_conf.endpoints.disable_worker.format(mm_id=mm_id)
         resp = self.http_requester.post(url)
         if resp is not None:
             return True
         return None
     
     def enable_mm(self, mm_id: int) -> Union[bool, None]:
-        url = f"http://{self.druid_conf.middle_manager}-{mm_id}.{self.druid_conf.mm_service}.{self.druid_conf.namespace}.{self.druid_conf.suffix_domain}:{self.druid_conf.mm_port}{self.druid_conf.enable_worker_route}"
+        if not self._can_write(f"enabling middle-manager id: {mm_id}"):
+            return None
+        url = self.druid_conf.endpoints.enable_worker.format(mm_id=mm_id)
         resp = self.http_requester.post(url)
         if resp is not None:
             return True
         return None
+
+    def shutdown_task(self, task_id: str) -> Union[bool, None]:
+        if not self._can_write(f"shutting down task {task_id}"):
+            return None
+        url = self.druid_conf.endpoints.shutdown_task.format(task_id=task_id)
+        resp = self.http_requester.post(url, route=self.druid_conf.shutdown_task_route)
+        if resp is not None:
+            return True
+        return None
+
+    def _fan_out(self, fn: Callable[[int], T], mm_ids: List[int]) -> Dict[int, T]:
+        if not mm_ids:
+            return {}
+        max_workers = min(self.druid_conf.max_concurrent_mm_requests, len(mm_ids))
+        with ThreadPoolExecutor(max_workers=max_workers, initializer=TickTracer.join_tick) as executor:
+            results = list(executor.map(fn, mm_ids))
+        return dict(zip(mm_ids, results))
+
+    def get_free_workers_on_mms(self, mm_ids: List[int]) -> Dict[int, Union[int, None]]:
+        return self._fan_out(self.get_free_workers_on_mm, mm_ids)
+
+    def are_mms_idle(self, mm_ids: List[int]) -> Dict[int, Union[bool, None]]:
+        return self._fan_out(self.is_mm_idle, mm_ids)
+
+    def enable_mms(self, mm_ids: List[int]) -> Dict[int, Union[bool, None]]:
+        return self._fan_out(self.enable_mm, mm_ids)
+
+    def disable_mms(self, mm_ids: List[int]) -> Dict[int, Union[bool, None]]:
+        return self._fan_out(self.disable_idle_mm, mm_ids)
@@ -1,112 +1,255 @@
+import math
+import time
 from druid_api_helper import DruidApiHelper
 from kubectl_executer import KubectlExecuter
-from druid_conf import DruidConfig
+from druid_conf import DEFAULT_POOL, DruidConfig
+from cluster_snapshot import ClusterSnapshot
+from consolidation_planner import ConsolidationPlanner
+from decision_log import DecisionRecorder
+from drain_tracker import DrainTracker
+from forecaster import DemandForecaster
+from leader_election import LeaderElector
+from prewarm import PrewarmSchedule
+from shadow import ShadowDruidApiHelper, ShadowKubectlExecuter
+from slo_policy import SloPolicy
+from stabilizer import ScaleStabilizer
+from task_demand import TaskDemandModel
 from logging_config import logger
-from typing import List, Union
+from metrics import DISABLED_MMS, FORECAST_DEMAND, FORECAST_ERROR, SCALE_EVENTS, TICK_DURATION, observe_snapshot
+from state_store import get_state_store
+from tick_trace import TickTracer
+from typing import Dict, List, Union
 
 
 class ReplicaCalculator:
-    def __init__(self):
-        self.conf = DruidConfig()
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.forecaster = DemandForecaster()
+        self.task_demand = TaskDemandModel()
+        self.prewarm = PrewarmSchedule(pool)
+        self.slo = SloPolicy(pool)
+
+    def observe(self, snapshot: ClusterSnapshot, is_acting: bool = True) -> None:
+        if self.conf.forecast_enabled:
+            self.forecaster.observe(snapshot)
+        if self.conf.task_demand_enabled:
+            self.task_demand.observe(snapshot)
+        self.prewarm.observe(snapshot)
+        self.slo.observe(snapshot, is_acting)
+
+    def calc_pending_demand(self, snapshot: ClusterSnapshot) -> int:
+        if not self.conf.task_demand_enabled:
+            return snapshot.pending_tasks_count
+        return TickTracer.record_derived("pending_demand", self.task_demand.calc_pending_demand(snapshot))
+
+    def calc_forecast_demand(self, snapshot: ClusterSnapshot) -> float:
+        forecast_demand = self.forecaster.forecast_demand(snapshot)
+        FORECAST_DEMAND.labels(self.conf.pool).set(forecast_demand)
+        if self.forecaster.last_error is not None:
+            FORECAST_ERROR.labels(self.conf.pool).set(self.forecaster.last_error)
+        return TickTracer.record_derived("forecast_demand", forecast_demand)
+
+    def calc_predicted_mm_count(self, snapshot: ClusterSnapshot) -> int:
+        if not self.conf.forecast_enabled:
+            return 0
+        predicted_mm_count = math.ceil(self.calc_forecast_demand(snapshot) / self.conf.workers_per_mm)
+        return min(predicted_mm_count, snapshot.running_mm_count + self.conf.forecast_max_step)
 
-    def calc_scale_up_to(self, waiting_tasks: int, running_mm_count: int) -> int:
-        needed_mm_count = (waiting_tasks / self.conf.workers_per_mm) + running_mm_count
-        if waiting_tasks % self.conf.workers_per_mm > 0:
-            needed_mm_count = needed_mm_count + 1
+    def calc_completion_rate(self, snapshot: ClusterSnapshot) -> float:
+        return TickTracer.record_derived("completion_rate", self.slo.calc_completion_rate(snapshot))
+
+    def calc_scale_up_to(self, waiting_tasks: int, snapshot: ClusterSnapshot) -> int:
+        running_mm_count = snapshot.running_mm_count
+        if self.conf.slo_enabled:
+            # Waiting tasks may queue as long as the wait target allows, instead of all starting at once.
+            needed_mm_count = self.slo.calc_mm_count(snapshot, self.calc_completion_rate(snapshot))
+        else:
+            needed_mm_count = (waiting_tasks / self.conf.workers_per_mm) + running_mm_count
+            if waiting_tasks % self.conf.workers_per_mm > 0:
+                needed_mm_count = needed_mm_count + 1
+        needed_mm_count = max(needed_mm_count, self.calc_predicted_mm_count(snapshot), self.get_min_workers(snapshot))
         final_mm_count = min(self.conf.max_mm_count, needed_mm_count)
         return int(final_mm_count)
 
-    def calc_scale_down_to(self, count_idle_mm: int, running_mm_count: int) -> int:
-        needed_mm_count = running_mm_count - count_idle_mm
-        final_mm_count = max(self.conf.min_mm_count, needed_mm_count)
+    def calc_scale_down_to(self, count_idle_mm: int, snapshot: ClusterSnapshot) -> int:
+        needed_mm_count = snapshot.running_mm_count - count_idle_mm
+        final_mm_count = max(self.get_min_workers(snapshot), needed_mm_count)
         return int(final_mm_count)
     
-    def get_worker_cap_to_check_against_to_disable_mm(self, mm_id: int) -> int:
-        return int(0.9*((mm_id)* self.conf.workers_per_mm))
+    def calc_consolidation_target(self, snapshot: ClusterSnapshot) -> int:
+        demand = snapshot.running_tasks_count + self.calc_pending_demand(snapshot)
+        needed_mm_count = math.ceil(demand / (self.conf.workers_per_mm * self.conf.scale_down_target_utilisation))
+        return max(self.get_min_workers(snapshot), needed_mm_count)
     
-    def get_min_workers(self) -> int:
-        return self.conf.min_mm_count
+    def calc_prewarm_mm_count(self, snapshot: ClusterSnapshot) -> int:
+        return TickTracer.record_derived("prewarm_mm_count", self.prewarm.calc_min_mm_count(snapshot))
+
+    def get_min_workers(self, snapshot: ClusterSnapshot) -> int:
+        return min(self.conf.max_mm_count, max(self.conf.min_mm_count, self.calc_prewarm_mm_count(snapshot)))
         
     
 class AutoscalerMeta:
-    _instance = None
+    _instances: Dict[str, "AutoscalerMeta"] = {}
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(AutoscalerMeta, cls).__new__(cls)
-        return cls._instance
+    def __new__(cls, pool: str = DEFAULT_POOL):
+        if pool not in cls._instances:
+            cls._instances[pool] = super(AutoscalerMeta, cls).__new__(cls)
+        return cls._instances[pool]
     
-    def __init__(self) -> None:
+    def __init__(self, pool: str = DEFAULT_POOL) -> None:
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
+        self.pool = pool
+        self.store = get_state_store(pool)
         self.__disable_mm_count  = 0
         self.__prev_scale_up_mm_count = 0
+        self.__stray_mm_ids: List[int] = []
+        self.load()
+
+    def load(self) -> None:
+        state = self.store.load()
+        if state is None:
+            logger.info("No persisted autoscaler state found, starting fresh")
+            return
+        self.__disable_mm_count = state.get("disable_mm_count", 0)
+        self.__prev_scale_up_mm_count = state.get("prev_scale_up_mm_count", 0)
+        self.__stray_mm_ids = state.get("stray_mm_ids", [])
+        logger.info(f"Loaded autoscaler state, disabled mm count: {self.__disable_mm_count}, prev scale up mm count: {self.__prev_scale_up_mm_count}")
+
+    def _save(self) -> None:
+        DISABLED_MMS.labels(self.pool).set(self.__disable_mm_count)
+        if not LeaderElector.can_act():
+            logger.warning("Lost the leader lease, not persisting autoscaler state")
+            return
+        state = {
+            "disable_mm_count": self.__disable_mm_count,
+            "prev_scale_up_mm_count": self.__prev_scale_up_mm_count,
+            "stray_mm_ids": self.__stray_mm_ids,
+            "updated_at": time.time(),
+        }
+        if not self.store.save(state):
+            logger.error("Failed to persist autoscaler state")
+
+    def reconcile(self, snapshot: ClusterSnapshot) -> None:
+        """Rebuilds the disabled mm count from the disabled top ordinals the overlord reports."""
+        disable_mm_count = 0
+        for mm_id in range(snapshot.running_mm_count - 1, -1, -1):
+            is_disabled = snapshot.is_mm_disable(mm_id)
+            if is_disabled is None:
+                logger.warning(f"MM-{mm_id} is missing from the overlord workers, keeping disabled mm count at {self.__disable_mm_count}")
+                return
+            if not is_disabled:
+                break
+            disable_mm_count += 1
+        if disable_mm_count != self.__disable_mm_count:
+            logger.info(f"Reconciled disabled mm count with the overlord from {self.__disable_mm_count} to {disable_mm_count}")
+            self.__disable_mm_count = disable_mm_count
+            self._save()
 
     def set_prev_scale_state(self, node_count: int) -> None:
+         if node_count == self.__prev_scale_up_mm_count:
+             return
          logger.info(f"Changing prev scale up mm count state, current is : {self.__prev_scale_up_mm_count}")
          self.__prev_scale_up_mm_count = node_count
+         self._save()
          logger.info(f"Changed prev scale up mm count state, current is : {self.__prev_scale_up_mm_count}")
 
     def inc_disable_mm_count(self) -> None:
         logger.info(f"Changing disable mm count, current is : {self.__disable_mm_count}")
         self.__disable_mm_count += 1
+        self._save()
         logger.info(f"Changed disabled mm count, current is : {self.__disable_mm_count}")
     
     def dec_disable_mm_count(self) -> None:
         if self.__disable_mm_count > 0:
             logger.info(f"Changing disable mm count, current is : {self.__disable_mm_count}")
             self.__disable_mm_count -= 1
+            self._save()
             logger.info(f"Changed disabled mm count, current is : {self.__disable_mm_count}")
     
+    def set_stray_mm_ids(self, mm_ids: List[int]) -> None:
+        mm_ids = sorted(set(mm_ids))
+        if mm_ids == self.__stray_mm_ids:
+            return
+        logger.info(f"Changing stray disabled middle-managers from {self.__stray_mm_ids} to {mm_ids}")
+        self.__stray_mm_ids = mm_ids
+        self._save()
+
     def get_prev_scale_state(self) -> int:
         return self.__prev_scale_up_mm_count
     
     def get_disable_mm_count(self) -> int:
         return self.__disable_mm_count
+
+    def get_stray_mm_ids(self) -> List[int]:
+        """Returns the middle-managers left disabled below an enabled one, which the disabled count can't cover."""
+        return list(self.__stray_mm_ids)
         
      
     
 class Autoscaler:
-     def __init__(self):
-        self.druid_api_helper = DruidApiHelper()
-        self.replica_calculator = ReplicaCalculator()
-        self.kubectl_executor = KubectlExecuter()
-        self.meta = AutoscalerMeta()
+     def __init__(self, pool: str = DEFAULT_POOL, druid_api_helper: Union[DruidApiHelper, None] = None,
+                  kubectl_executor: Union[KubectlExecuter, None] = None, stabilizer: Union[ScaleStabilizer, None] = None,
+                  recorder: Union[DecisionRecorder, None] = None, replica_calculator: Union[ReplicaCalculator, None] = None):
+        self.pool = pool
+        self.druid_api_helper = druid_api_helper or DruidApiHelper(pool)
+        self.replica_calculator = replica_calculator or ReplicaCalculator(pool)
+        self.kubectl_executor = kubectl_executor or KubectlExecuter(pool)
+        self.stabilizer = stabilizer or ScaleStabilizer(pool)
+        self.recorder = recorder or DecisionRecorder(pool)
+        self.meta = AutoscalerMeta(pool)
      
-     def execute(self) -> Union[bool, None]:
+     def _try_enable_mms(self, mm_ids_to_enable: List[int], snapshot: ClusterSnapshot) -> Dict[int, bool]:
+         retries = 3
+         results = {mm_id: False for mm_id in mm_ids_to_enable}
+         pending_mm_ids = list(mm_ids_to_enable)
+
+         for _ in range(retries):
+             if not pending_mm_ids:
+                 break
+             logger.info(f"Enabling middle-managers : {pending_mm_ids}")
+             for mm_id, is_enabled in self.druid_api_helper.enable_mms(pending_mm_ids).items():
+                 if is_enabled is None:
+                     logger.error(f"Failed to enable middle-manager id: {mm_id}")
+                     continue
+                 logger.info(f"Successfully enabled middle-manager id: {mm_id}")
+                 SCALE_EVENTS.labels(self.pool, "enable_mm").inc()
+                 self.recorder.record("enable_mm", mm_id=mm_id)
+                 snapshot.mark_mm_enabled(mm_id)
+                 results[mm_id] = True
+             pending_mm_ids = [mm_id for mm_id in pending_mm_ids if not results[mm_id]]
+         return results
+
+     def execute(self, snapshot: ClusterSnapshot) -> Union[bool, None]:
          raise NotImplementedError
 
     
 class ScaleUp(Autoscaler):
-    def _get_free_workers_in_disable_mm(self, running_mm_count: int) -> List[int]:
-        res = []
+    def _get_free_workers_in_disable_mm(self, snapshot: ClusterSnapshot) -> List[int]:
+        running_mm_count = snapshot.running_mm_count
         disable_mm_count = self.meta.get_disable_mm_count()
-        for i in range(disable_mm_count, 0, -1):
-          free_workers_on_mm = self.druid_api_helper.get_free_workers_on_mm(running_mm_count - i)
-          if free_workers_on_mm is None:
-              free_workers_on_mm = 0
-          res.append(free_workers_on_mm)
-        return res
-    
-    def _try_enable_mm(self, mm_id_to_enable: int) -> bool:
-        retries = 3
-
-        for _ in range(retries):
-            logger.info(f"Enabling middle-manager : {mm_id_to_enable}")
-            is_enabled = self.druid_api_helper.enable_mm(mm_id_to_enable)
-            if is_enabled is None:
-                logger.error(f"Failed to enable middle-manager id: {mm_id_to_enable}")
-                continue
-            logger.info("Successfully enabled middle-manager")
-            return True         
-        return False
+        disabled_mm_ids = [running_mm_count - i for i in range(disable_mm_count, 0, -1)]
+        free_workers_per_mm = {mm_id: snapshot.get_free_workers_on_mm(mm_id) for mm_id in disabled_mm_ids}
+        mm_ids_to_probe = [mm_id for mm_id, free_workers in free_workers_per_mm.items() if free_workers is None]
+        free_workers_per_mm.update(self.druid_api_helper.get_free_workers_on_mms(mm_ids_to_probe))
+        return [free_workers_per_mm[mm_id] or 0 for mm_id in disabled_mm_ids]
     
-    def _scale_up_mm_pods(self, pending_tasks: int, running_mm_count: int) -> bool:
-        mm_count = self.replica_calculator.calc_scale_up_to(pending_tasks, running_mm_count)
+    def _scale_up_mm_pods(self, pending_tasks: int, snapshot: ClusterSnapshot) -> bool:
+        running_mm_count = snapshot.running_mm_count
+        target_mm_count = self.replica_calculator.calc_scale_up_to(pending_tasks, snapshot)
+        mm_count = self.stabilizer.stabilize_scale_up(target_mm_count, snapshot)
+        TickTracer.branch("add_pods" if mm_count > running_mm_count else "at_max", pending_tasks=pending_tasks, target_mm_count=target_mm_count,
+                          stabilized_mm_count=mm_count)
         if mm_count > running_mm_count:
             logger.info(f"Current number of pending tasks: {pending_tasks}")
             logger.info(f"Triggering mm scale-up, replica change from {running_mm_count} to {mm_count}")
             is_done = self.kubectl_executor.change_replicas(mm_count)
             if is_done:
                 logger.info(f"Successfully scaled up from {running_mm_count} to {mm_count}")
+                SCALE_EVENTS.labels(self.pool, "scale_up").inc()
+                self.recorder.record("scale_up", from_replicas=running_mm_count, to_replicas=mm_count)
+                self.stabilizer.record_change(running_mm_count, mm_count, snapshot)
                 self.meta.set_prev_scale_state(mm_count)
                 return True
             else:
@@ -114,130 +257,343 @@ class ScaleUp(Autoscaler):
         self.meta.set_prev_scale_state(0)
         return False
     
-    def _fill_disabled_mm(self, pending_tasks: int, running_mm_count: int) -> int:
-        free_workers_per_mm: List[int] = self._get_free_workers_in_disable_mm(running_mm_count)
-        for free_workers in free_workers_per_mm:
-            if pending_tasks <= 0:
-                return 0
-            disable_mm_count = self.meta.get_disable_mm_count()
-            mm_id_to_enable = running_mm_count - disable_mm_count
-            if not self._try_enable_mm(mm_id_to_enable):
+    def _fill_disabled_mm(self, pending_tasks: int, snapshot: ClusterSnapshot, min_mm_count: int = 0) -> int:
+        """Enables disabled middle-managers, lowest first, until the pending tasks fit and at least min_mm_count are enabled."""
+        running_mm_count = snapshot.running_mm_count
+        disable_mm_count = self.meta.get_disable_mm_count()
+        free_workers_per_mm: List[int] = self._get_free_workers_in_disable_mm(snapshot)
+        mm_ids_to_enable = []
+        tasks_to_fill = pending_tasks
+        for i, free_workers in enumerate(free_workers_per_mm):
+            if tasks_to_fill <= 0 and i >= min_mm_count:
+                break
+            mm_ids_to_enable.append(running_mm_count - disable_mm_count + i)
+            tasks_to_fill = tasks_to_fill - free_workers
+
+        results = self._try_enable_mms(mm_ids_to_enable, snapshot)
+        # Disabled middle-managers are the top ordinals, so only an unbroken run of
+        # enables from the lowest one can be taken off the disabled count.
+        for i, mm_id in enumerate(mm_ids_to_enable):
+            if not results[mm_id]:
+                failed_mm_ids = [mm_id for mm_id, is_enabled in results.items() if not is_enabled]
+                logger.error(f"Failed to enable middle-managers: {failed_mm_ids}")
+                skipped_mm_ids = [mm_id for mm_id in mm_ids_to_enable[i:] if results[mm_id]]
+                if skipped_mm_ids:
+                    logger.warning(f"Middle-managers {skipped_mm_ids} were enabled above a failed one and stay counted as disabled")
                 break
             self.meta.dec_disable_mm_count()
-            pending_tasks = pending_tasks - free_workers
+            pending_tasks = pending_tasks - free_workers_per_mm[i]
 
         return max(0,pending_tasks)
     
-    def execute(self) -> Union[bool, None]:
-        pending_tasks = self.druid_api_helper.get_count_of_pending_tasks()
-        if pending_tasks is None:
-            logger.error("Couldn't fetch pending tasks from druid, will check again in next cycle")
-            return None
-        
-        running_mm_count = self.druid_api_helper.get_count_of_running_mm()
-        if running_mm_count is None:
-            logger.error("Couldn't get current MM replica count from druid, will check again in next cycle")
-            return None
-        
+    def _is_scale_up_in_flight(self, prev_scale_state: int, running_mm_count: int) -> bool:
+        replica_state = self.kubectl_executor.get_replica_state()
+        TickTracer.record_derived("replica_state", None if replica_state is None else vars(replica_state))
+        if replica_state is None:
+            return True
+        logger.info(f"StatefulSet replicas: {replica_state.replicas}, ready replicas: {replica_state.ready_replicas}")
+        if replica_state.replicas == prev_scale_state:
+            return True
+        if replica_state.replicas > running_mm_count:
+            logger.warning(f"StatefulSet replicas changed to {replica_state.replicas} outside the last scale-up to {prev_scale_state}, waiting for that rollout instead")
+            self.meta.set_prev_scale_state(replica_state.replicas)
+            return True
+        logger.warning(f"StatefulSet replicas are {replica_state.replicas} but last scale-up asked for {prev_scale_state}, dropping stale scale-up state")
+        self.meta.set_prev_scale_state(0)
+        return False
+
+    def execute(self, snapshot: ClusterSnapshot) -> Union[bool, None]:
+        pending_tasks = self.replica_calculator.calc_pending_demand(snapshot)
+        running_mm_count = snapshot.running_mm_count
         prev_scale_state = self.meta.get_prev_scale_state()
-        if prev_scale_state > 0 and not prev_scale_state == running_mm_count:
+        if prev_scale_state > 0 and not prev_scale_state == running_mm_count and self._is_scale_up_in_flight(prev_scale_state, running_mm_count):
             logger.info(f"Prev scaleup has not completed so not scaling further till scale up gets complete, Running mm count: {running_mm_count}, Prev scaled count: {prev_scale_state}")
+            TickTracer.branch("in_flight", prev_scale_state=prev_scale_state, running_mm_count=running_mm_count)
             return None
   
-        if pending_tasks == 0:
+        # Forecast growth and a pre-warm minimum both ask for pods before any task is pending.
+        expected_mm_count = max(self.replica_calculator.calc_predicted_mm_count(snapshot), self.replica_calculator.get_min_workers(snapshot))
+        disable_mm_count = self.meta.get_disable_mm_count()
+        # Disabled middle-managers still run as pods but take no tasks, so growth is measured against the enabled ones.
+        enabled_mm_count = running_mm_count - disable_mm_count
+        is_growth_forecast = expected_mm_count > enabled_mm_count
+        if pending_tasks == 0 and not is_growth_forecast:
+            TickTracer.branch("no_demand", expected_mm_count=expected_mm_count)
             return False
         
         logger.info(f"Current Pending Tasks: {pending_tasks}, Prev scale up state: {prev_scale_state}, Running MM count: {running_mm_count}")
-        disable_mm_count = self.meta.get_disable_mm_count()
         logger.info(f"Current disabled mm count is {disable_mm_count}")
         if disable_mm_count > 0:
             logger.info(f"Found disabled middle managers enabling them to fullfill workers request, no of disabled mm: {disable_mm_count}")
-            pending_tasks = self._fill_disabled_mm(pending_tasks, running_mm_count)
+            mm_count_to_enable = max(0, expected_mm_count - enabled_mm_count)
+            remaining_tasks = self._fill_disabled_mm(pending_tasks, snapshot, mm_count_to_enable)
+            TickTracer.branch("fill_disabled", disable_mm_count=disable_mm_count, pending_tasks=pending_tasks, remaining_tasks=remaining_tasks,
+                              mm_count_to_enable=mm_count_to_enable)
+            pending_tasks = remaining_tasks
             logger.info(f"Number of pending tasks after enabling disabled middle-managers: {pending_tasks}")
-        self._scale_up_mm_pods(pending_tasks, running_mm_count) if pending_tasks else None  
+            disable_mm_count = self.meta.get_disable_mm_count()
+            if disable_mm_count > 0:
+                # New pods take the ordinals above the disabled block, which the disabled count would then point at.
+                logger.info(f"Not adding pods while {disable_mm_count} middle-managers stay disabled")
+                return True
+        self._scale_up_mm_pods(pending_tasks, snapshot) if pending_tasks or expected_mm_count > running_mm_count else None
         return True
         
     
 class ScaleDown(Autoscaler):
+    def __init__(self, pool: str = DEFAULT_POOL, druid_api_helper: Union[DruidApiHelper, None] = None,
+                 kubectl_executor: Union[KubectlExecuter, None] = None, stabilizer: Union[ScaleStabilizer, None] = None,
+                 recorder: Union[DecisionRecorder, None] = None, replica_calculator: Union[ReplicaCalculator, None] = None):
+        super().__init__(pool, druid_api_helper, kubectl_executor, stabilizer, recorder, replica_calculator)
+        self.conf = DruidConfig(pool)
+        self.planner = ConsolidationPlanner()
+        self.drain_tracker = DrainTracker(pool, self.druid_api_helper, self.recorder)
 
-    def _disable_mm_handler(self, mm_id: int) -> Union[bool, None]:
-        is_disabled = self.druid_api_helper.is_mm_disable(mm_id)
-        if is_disabled is None:
-            return None
-        if is_disabled:
-            logger.info(f"MM-{mm_id} is already disabled")
-            return True
-        is_disabled = self.druid_api_helper.disable_idle_mm(mm_id)
-        if not is_disabled:
-            logger.error(f"Failed to disable idle middle-manager id: {mm_id}")
-            return False
-        logger.info(f"Successfully Disabled idle middle-manager id : {mm_id}")
-        self.meta.inc_disable_mm_count()
-        return True
-    
-    def _can_mm_be_idle(self, mm_id: int) -> Union[bool, None]:
-        cap_to_check_against = self.replica_calculator.get_worker_cap_to_check_against_to_disable_mm(mm_id)
-        tot_running_tasks = self.druid_api_helper.get_running_tasks_count()
-        running_tasks_mm = self.druid_api_helper.get_running_tasks_on_mm(mm_id)
-        if tot_running_tasks is None or running_tasks_mm is None:
-            return None
-        running_tasks_to_check_against = tot_running_tasks - running_tasks_mm
-        if cap_to_check_against > running_tasks_to_check_against:
-            return True
-        return False
-    
-    def _idle_mm_handler(self, mm_id: int) -> Union[bool, None]:
-        is_mm_idle = self.druid_api_helper.is_mm_idle(mm_id)
-        if is_mm_idle is None:
-            logger.error("Couldn't check if MM is idle or not due to API failure")
-            return None
-        return is_mm_idle
+    def _disable_mm_handler(self, mm_ids: List[int], snapshot: ClusterSnapshot) -> int:
+        """Disables the given top-down middle-managers and returns how many of them, from the top, are now disabled."""
+        mm_ids_to_disable = []
+        for mm_id in mm_ids:
+            is_disabled = snapshot.is_mm_disable(mm_id)
+            if is_disabled is None:
+                is_disabled = self.druid_api_helper.is_mm_disable(mm_id)
+            if is_disabled is None:
+                mm_ids = mm_ids[:mm_ids.index(mm_id)]
+                break
+            if is_disabled:
+                logger.info(f"MM-{mm_id} is already disabled")
+            else:
+                mm_ids_to_disable.append(mm_id)
+
+        results = self.druid_api_helper.disable_mms(mm_ids_to_disable)
+        for i, mm_id in enumerate(mm_ids):
+            if mm_id not in results:
+                continue
+            if not results[mm_id]:
+                logger.error(f"Failed to disable middle-manager id: {mm_id}")
+                # Disabled middle-managers must stay a contiguous block of top ordinals,
+                # so anything disabled below a failure is enabled again.
+                stray_mm_ids = [mm_id for mm_id in mm_ids[i + 1:] if results.get(mm_id)]
+                if stray_mm_ids:
+                    self.meta.set_stray_mm_ids(self.meta.get_stray_mm_ids() + stray_mm_ids)
+                    self.enable_stray_mms(snapshot)
+                return i
+            logger.info(f"Successfully Disabled middle-manager id : {mm_id}")
+            SCALE_EVENTS.labels(self.pool, "disable_mm").inc()
+            self.recorder.record("disable_mm", mm_id=mm_id)
+            snapshot.mark_mm_disabled(mm_id)
+            self.meta.inc_disable_mm_count()
+        return len(mm_ids)
+
+    def enable_stray_mms(self, snapshot: ClusterSnapshot) -> None:
+        """Re-enables middle-managers left disabled below a failed disable, until it succeeds, so their slots aren't stranded."""
+        stray_mm_ids = [mm_id for mm_id in self.meta.get_stray_mm_ids() if mm_id < snapshot.running_mm_count]
+        if stray_mm_ids:
+            logger.warning(f"Re-enabling middle-managers {stray_mm_ids} disabled below a failed one")
+            results = self._try_enable_mms(stray_mm_ids, snapshot)
+            stray_mm_ids = [mm_id for mm_id, is_enabled in results.items() if not is_enabled]
+            if stray_mm_ids:
+                logger.error(f"Middle-managers {stray_mm_ids} stay disabled below an enabled one, retrying next tick")
+        self.meta.set_stray_mm_ids(stray_mm_ids)
+
+    def _idle_mm_handler(self, mm_ids: List[int], snapshot: ClusterSnapshot) -> Dict[int, Union[bool, None]]:
+        # The overlord view may lag the middle-manager, so idle candidates are
+        # confirmed against the middle-managers themselves before removal.
+        results = {mm_id: snapshot.is_mm_idle(mm_id) for mm_id in mm_ids}
+        mm_ids_to_probe = [mm_id for mm_id, is_mm_idle in results.items() if is_mm_idle is not False]
+        results.update(self.druid_api_helper.are_mms_idle(mm_ids_to_probe))
+        for mm_id, is_mm_idle in results.items():
+            if is_mm_idle is None:
+                logger.error(f"Couldn't check if MM-{mm_id} is idle or not due to API failure")
+        return results
     
-    def _scale_down_mm_pod(self, running_mm_count: int) -> bool:     
-        mm_count = self.replica_calculator.calc_scale_down_to(1, running_mm_count)
+    def _scale_down_mm_pods(self, remove_mm_count: int, snapshot: ClusterSnapshot) -> bool:
+        running_mm_count = snapshot.running_mm_count
+        mm_count = self.replica_calculator.calc_scale_down_to(remove_mm_count, snapshot)
         logger.info(f"Triggering mm scale-down, replica change from {running_mm_count} to {mm_count}")
         is_done = self.kubectl_executor.change_replicas(mm_count)
         if is_done:
             logger.info(f"Successfully scaled down from {running_mm_count} to {mm_count}")
+            SCALE_EVENTS.labels(self.pool, "scale_down").inc()
+            self.recorder.record("scale_down", from_replicas=running_mm_count, to_replicas=mm_count)
+            self.stabilizer.record_change(running_mm_count, mm_count, snapshot)
         else:
             logger.error(f"Failed to scale down from {running_mm_count} to {mm_count}")
             return False
         self.meta.set_prev_scale_state(0)
-        self.meta.dec_disable_mm_count()
+        for _ in range(running_mm_count - mm_count):
+            self.meta.dec_disable_mm_count()
         return True
     
-    def execute(self) -> Union[bool, None]:
-        running_mm_count = self.druid_api_helper.get_count_of_running_mm()
-        if running_mm_count is None:
-            logger.error("Couldn't get current MM replica count from druid, will check again in next cycle")
-            return None
-        if running_mm_count <= self.replica_calculator.get_min_workers():
+    def execute(self, snapshot: ClusterSnapshot) -> Union[bool, None]:
+        running_mm_count = snapshot.running_mm_count
+        if running_mm_count <= self.replica_calculator.get_min_workers(snapshot):
+            TickTracer.branch("at_min", running_mm_count=running_mm_count)
+            self.stabilizer.hold(snapshot)
             return None
-        mm_id = running_mm_count - 1
-        is_idle = self._idle_mm_handler(mm_id)
-        if is_idle:
-            logger.info(f"Found idle middle manager. Disabling idle middle-manager id: {mm_id}")
-            is_disable =self._disable_mm_handler(mm_id)
-            if is_disable:
-                self._scale_down_mm_pod(running_mm_count) 
-                return True
-        disable_mm_count = self.meta.get_disable_mm_count()
-        mm_id = mm_id - disable_mm_count
-        can_be_idle = self._can_mm_be_idle(mm_id)
-        if can_be_idle:
-            logger.info(f"Middle-Manager-{mm_id} can be downscaled as cluster has enough resources, Disabling it")
-            self._disable_mm_handler(mm_id) 
-            return True
-        return False
+        consolidation_target = self.replica_calculator.calc_consolidation_target(snapshot)
+        # Draining is gated too, disabling middle-managers that are then kept would only strand their slots.
+        target_mm_count = self.stabilizer.stabilize_scale_down(consolidation_target, snapshot)
+        plan = self.planner.plan(snapshot, target_mm_count)
+        if not plan.drain_mm_ids:
+            TickTracer.branch("nothing_to_drain", consolidation_target=consolidation_target, target_mm_count=target_mm_count)
+            return False
+        TickTracer.branch("drain", consolidation_target=consolidation_target, target_mm_count=target_mm_count, drain_mm_ids=plan.drain_mm_ids)
+        logger.info(f"Cluster needs {target_mm_count} middle-managers for {snapshot.running_tasks_count} running tasks, consolidation plan: {plan}")
 
-class AutoScalerFacade:
+        disabled_count = self._disable_mm_handler(plan.drain_mm_ids, snapshot)
+        self.drain_tracker.start(plan.drain_mm_ids[:disabled_count], snapshot)
+        # Advances only the drains started just now, the others moved at the start of the tick.
+        drained_mm_ids = self.drain_tracker.update(snapshot)
+        # The StatefulSet sheds its top ordinals, so only an unbroken run of drained middle-managers from the top goes.
+        remove_mm_ids = []
+        for mm_id in plan.drain_mm_ids[:min(disabled_count, self.conf.scale_down_max_step)]:
+            if mm_id not in drained_mm_ids:
+                break
+            remove_mm_ids.append(mm_id)
+        idle_mms = self._idle_mm_handler(remove_mm_ids, snapshot)
+        remove_mm_count = 0
+        for mm_id in remove_mm_ids:
+            if not idle_mms[mm_id]:
+                break
+            remove_mm_count += 1
+        if remove_mm_count:
+            logger.info(f"Removing drained middle-managers: {remove_mm_ids[:remove_mm_count]}")
+            TickTracer.branch("remove", mm_ids=remove_mm_ids[:remove_mm_count])
+            if self._scale_down_mm_pods(remove_mm_count, snapshot):
+                self.drain_tracker.forget(remove_mm_ids[:remove_mm_count])
+        return True
+
+class PoolAutoscaler:
+    def __init__(self, pool: str = DEFAULT_POOL, druid_api_helper: Union[DruidApiHelper, None] = None,
+                 kubectl_executor: Union[KubectlExecuter, None] = None):
+        self.pool = pool
+        self.conf = DruidConfig(pool)
+        self.shadow_druid_api_helper = None
+        if self.conf.shadow_enabled:
+            logger.warning(f"Shadow mode is on, decisions for pool {pool} are only recorded to '{self.conf.decision_log}'")
+            self.shadow_druid_api_helper = ShadowDruidApiHelper(pool)
+            druid_api_helper = self.shadow_druid_api_helper
+            kubectl_executor = ShadowKubectlExecuter(pool)
+        self.stabilizer = ScaleStabilizer(pool)
+        self.recorder = DecisionRecorder(pool)
+        # One calculator per pool, so scale-up and scale-down share the demand models it keeps.
+        self.replica_calculator = ReplicaCalculator(pool)
+        self.scale_up = ScaleUp(pool, druid_api_helper, kubectl_executor, self.stabilizer, self.recorder, self.replica_calculator)
+        self.scale_down = ScaleDown(pool, druid_api_helper, kubectl_executor, self.stabilizer, self.recorder, self.replica_calculator)
+        self.meta = AutoscalerMeta(pool)
+        self.__is_meta_reconciled = False
+
+    def on_elected(self) -> None:
+        """Picks up the state the previous leader persisted and reconciles it against the cluster on the next tick."""
+        self.meta.load()
+        self.scale_down.drain_tracker.load()
+        self.__is_meta_reconciled = False
+
+    def get_trace_inputs(self, snapshot: ClusterSnapshot, is_meta_reconciled: bool) -> dict:
+        workers = {mm_id: snapshot.get_worker(mm_id) for mm_id in range(snapshot.running_mm_count)}
+        return {
+            "shadow": self.shadow_druid_api_helper is not None,
+            "meta_reconciled": is_meta_reconciled,
+            "running_mm_count": snapshot.running_mm_count,
+            "pending_tasks_count": snapshot.pending_tasks_count,
+            "running_tasks_count": snapshot.running_tasks_count,
+            "mm_tasks": {str(mm_id): None if worker is None else worker.curr_capacity_used for mm_id, worker in workers.items()},
+            "disabled_mm_ids": [mm_id for mm_id, worker in workers.items() if worker is not None and worker.is_disabled],
+            "meta": {"disable_mm_count": self.meta.get_disable_mm_count(), "prev_scale_up_mm_count": self.meta.get_prev_scale_state(),
+                     "stray_mm_ids": self.meta.get_stray_mm_ids()},
+            "stabilizer": self.stabilizer.get_state(),
+            "drains": {str(mm_id): drain.to_dict() for mm_id, drain in self.scale_down.drain_tracker.drains.items()},
+        }
 
-    def __init__(self):
-        self.scale_up = ScaleUp()
-        self.scale_down = ScaleDown()
+    def restore_trace_inputs(self, inputs: dict) -> None:
+        """Puts back the state a traced tick started from, for tick_replay.py."""
+        self.meta.store.save(inputs["meta"])
+        self.meta.load()
+        self.stabilizer.set_state(inputs["stabilizer"])
+        self.scale_down.drain_tracker.store.save({"drains": inputs["drains"]})
+        self.scale_down.drain_tracker.load()
+        # The meta was traced after this tick's reconcile, redoing it only matters if the tick did it too.
+        self.__is_meta_reconciled = not inputs["meta_reconciled"]
 
-    def execute(self) -> None:
-        is_scale_up = self.scale_up.execute()
+    def observe(self, snapshot: ClusterSnapshot) -> bool:
+        """Keeps the demand models and the scale-down window warm on a standby and returns whether this pool is busy."""
+        snapshot = snapshot.for_pool(self.pool)
+        self.replica_calculator.observe(snapshot, is_acting=False)
+        self.stabilizer.hold(snapshot)
+        return snapshot.pending_tasks_count > 0
+
+    def execute(self, snapshot: ClusterSnapshot) -> bool:
+        """Runs one tick for this pool and returns whether it is busy (pending tasks or a scale-up in flight)."""
+        snapshot = snapshot.for_pool(self.pool)
+        self.replica_calculator.observe(snapshot)
+        if self.shadow_druid_api_helper is not None:
+            # The live cluster only reflects the other autoscaler's disables, so the shadow's own are laid over it and reconciled every tick.
+            self.shadow_druid_api_helper.overlay(snapshot)
+            self.__is_meta_reconciled = False
+        is_meta_reconciled = not self.__is_meta_reconciled
+        if is_meta_reconciled:
+            self.meta.reconcile(snapshot)
+            self.__is_meta_reconciled = True
+        self.scale_down.drain_tracker.sync(snapshot)
+        TickTracer.start_pool(self.pool, self.get_trace_inputs(snapshot, is_meta_reconciled))
+        self.recorder.begin(snapshot)
+        # Drains move on every tick, also while scale-up or the stabilizer keeps scale-down from planning.
+        self.scale_down.drain_tracker.update(snapshot)
+        self.scale_down.enable_stray_mms(snapshot)
+        is_scale_up = self.scale_up.execute(snapshot)
         if is_scale_up is False and not is_scale_up is None:
-            self.scale_down.execute()
-        
\ No newline at end of file
+            self.scale_down.execute(snapshot)
+        else:
+            self.stabilizer.hold(snapshot)
+        self.recorder.end(self.meta.get_disable_mm_count())
+        prev_scale_state = self.meta.get_prev_scale_state()
+        # The last scale-up target stays recorded after its pods are up, so it is only in flight until they all run.
+        is_scale_up_in_flight = prev_scale_state > 0 and prev_scale_state != snapshot.running_mm_count
+        return snapshot.pending_tasks_count > 0 or is_scale_up_in_flight
+
+
+class AutoScalerFacade:
+
+    def __init__(self, druid_api_helper: Union[DruidApiHelper, None] = None, kubectl_executor: Union[KubectlExecuter, None] = None):
+        self.conf = DruidConfig()
+        self.druid_api_helper = druid_api_helper or DruidApiHelper()
+        self.pools = [PoolAutoscaler(pool, druid_api_helper, kubectl_executor) for pool in self.conf.pool_names]
+        self.leader_elector = LeaderElector()
+        self.__leader_term = 0
+        self.leader_elector.start()
+
+    @TICK_DURATION.time()
+    def execute(self) -> bool:
+        """Runs one autoscaler tick over all pools and returns whether any pool is busy."""
+        # Reloading between ticks keeps every tick on one configuration, while all autoscaler state is kept.
+        DruidConfig.reload_if_changed()
+        started_at = time.monotonic()
+        TickTracer.start(time.time())
+        self.druid_api_helper.start_tick()
+        try:
+            snapshot = self.druid_api_helper.get_cluster_snapshot()
+            if snapshot is None:
+                logger.error("Couldn't fetch cluster state from druid, will check again in next cycle")
+                return False
+            TickTracer.set_snapshot(snapshot)
+            observe_snapshot(snapshot)
+            if not self.leader_elector.is_acting():
+                # Standbys keep fetching snapshots so their connections and models are warm when they take over.
+                return any([pool.observe(snapshot) for pool in self.pools])
+            if self.leader_elector.term != self.__leader_term:
+                # Another replica may have acted since this one last led.
+                self.__leader_term = self.leader_elector.term
+                for pool in self.pools:
+                    pool.on_elected()
+            is_busy = False
+            for pool in self.pools:
+                if len(self.pools) > 1:
+                    logger.info(f"Evaluating middle-manager pool: {pool.pool}")
+                try:
+                    is_busy = pool.execute(snapshot) or is_busy
+                except Exception:
+                    logger.exception(f"Autoscaler tick failed for pool {pool.pool}")
+            return is_busy
+        finally:
+            self.druid_api_helper.end_tick()
+            TickTracer.finish(time.monotonic() - started_at, self.leader_elector.is_acting())
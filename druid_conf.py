@@ -1,19 +1,366 @@
 import os
 import yaml
-from munch import munchify
+from logging_config import logger
+from munch import Munch, munchify, unmunchify
+from typing import List, Tuple, Union
+
+DEFAULT_POOL = "default"
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'druid_conf.yaml')
+# A ConfigMap mounted here overrides druid_conf.yaml; kubelet updates the file in place, so edits are picked up live.
+OVERLAY_PATH = os.environ.get("MIDAS_CONFIG_OVERLAY", "/etc/midas/druid_conf.override.yaml")
+# MIDAS_<SECTION>__<KEY>=<yaml value> overrides a single setting, e.g. MIDAS_SCALE_DOWN__MAX_STEP=2.
+ENV_PREFIX = "MIDAS_"
+
+NUMBER = (int, float)
+SCHEMA = {
+    "ports.overlord": int,
+    "ports.middle_manager": int,
+    "http.pool_connections": int,
+    "http.pool_maxsize": int,
+    "http.connect_timeout": NUMBER,
+    "http.read_timeout": NUMBER,
+    "http.retries": int,
+    "http.backoff_factor": NUMBER,
+    "http.tick_deadline": NUMBER,
+    "http.max_concurrent_mm_requests": int,
+    "kubernetes.scaler_mode": str,
+    "kubernetes.service_account_dir": str,
+    "scheduler.fast_interval": NUMBER,
+    "scheduler.slow_interval": NUMBER,
+    "scheduler.late_tick_tolerance": NUMBER,
+    "scheduler.watch_statefulset": bool,
+    "scheduler.watch_timeout": int,
+    "forecast.enabled": bool,
+    "forecast.horizon": NUMBER,
+    "forecast.window": NUMBER,
+    "forecast.smoothing": NUMBER,
+    "forecast.max_step": int,
+    "scale_down.target_utilisation": NUMBER,
+    "scale_down.max_step": int,
+    "scale_down.expected_task_duration": NUMBER,
+    "scale_down.max_drain_time": NUMBER,
+    "state.backend": str,
+    "state.configmap": str,
+    "state.path": str,
+    "metrics.enabled": bool,
+    "metrics.port": int,
+    "stabilization.scale_up_cooldown": NUMBER,
+    "stabilization.scale_down_cooldown": NUMBER,
+    "stabilization.scale_down_window": NUMBER,
+    "stabilization.scale_up_max_delta": int,
+    "stabilization.scale_down_max_delta": int,
+    "stabilization.period": NUMBER,
+    "prewarm.schedules": list,
+    "prewarm.learn_profile": bool,
+    "prewarm.profile_smoothing": NUMBER,
+    "prewarm.profile_lead_time": NUMBER,
+    "drain.deadline": NUMBER,
+    "drain.shutdown_task_types": list,
+    "leader_election.enabled": bool,
+    "leader_election.lease_name": str,
+    "leader_election.lease_duration": NUMBER,
+    "leader_election.renew_deadline": NUMBER,
+    "shadow.enabled": bool,
+    "shadow.decision_log": str,
+    "shadow.assumed_startup_time": NUMBER,
+    "trace.enabled": bool,
+    "trace.path": str,
+    "trace.max_bytes": int,
+    "trace.files": int,
+    "trace.include_snapshot": bool,
+    "slo.enabled": bool,
+    "slo.target_wait_p95": NUMBER,
+    "slo.mm_hour_cost": NUMBER,
+    "slo.startup_time": NUMBER,
+    "slo.rate_window": NUMBER,
+    "slo.report_window": NUMBER,
+    "task_demand.enabled": bool,
+    "task_demand.weights": dict,
+    "task_demand.parallel_task_types": list,
+    "task_demand.history_window": NUMBER,
+    "task_demand.default_fan_out": NUMBER,
+    "routes.get_workers": str,
+    "routes.disable_worker": str,
+    "routes.enable_worker": str,
+    "routes.worker_status": str,
+    "routes.pending_tasks": str,
+    "routes.running_tasks": str,
+    "routes.all_running_tasks": str,
+    "routes.shutdown_task": str,
+    "min_mm_count": int,
+    "max_mm_count": int,
+    "workers_per_mm": int,
+}
+ENV_SCHEMA = {
+    "mm_service": str,
+    "overlord_service": str,
+    "suffix_domain": str,
+    "namespace": str,
+    "middle_manager": str,
+}
+POOL_SCHEMA = {
+    "name": str,
+    "middle_manager": str,
+    "mm_service": str,
+    "category": str,
+    "task_types": list,
+    "datasources": list,
+    "min_mm_count": int,
+    "max_mm_count": int,
+    "workers_per_mm": int,
+    "prewarm_schedules": list,
+    "slo_target_wait_p95": NUMBER,
+    "mm_hour_cost": NUMBER,
+}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def merge_config(config: Munch, values: dict) -> None:
+    for key, value in values.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            merge_config(config[key], value)
+        else:
+            config[key] = munchify(value)
+
+
+def read_env_overlay() -> dict:
+    overlay = {}
+    for name, value in os.environ.items():
+        if not name.startswith(ENV_PREFIX) or name == "MIDAS_CONFIG_OVERLAY":
+            continue
+        *sections, key = name[len(ENV_PREFIX):].lower().split("__")
+        target = overlay
+        for section in sections:
+            target = target.setdefault(section, {})
+        target[key] = yaml.safe_load(value)
+    return overlay
+
+
+def _check_types(config: dict, schema: dict, prefix: str = "") -> List[str]:
+    errors = []
+    for path, expected_type in schema.items():
+        value = config
+        for key in path.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            continue
+        # bool is an int subclass, so a flag must not pass for a count.
+        if not isinstance(value, expected_type) or (isinstance(value, bool) and expected_type is not bool):
+            errors.append(f"{prefix}{path} must be {getattr(expected_type, '__name__', 'a number')}, got {value!r}")
+    return errors
+
+
+def read_pool_names(config: Munch, env: str) -> List[str]:
+    return [pool_config.name for pool_config in config[env].get("pools") or []] or [DEFAULT_POOL]
+
+
+def validate_config(config: Munch, env: str) -> List[str]:
+    """Returns everything wrong with a merged configuration, empty when it can be used."""
+    if not isinstance(config.get(env), dict):
+        return [f"No configuration block for env '{env}'"]
+    # Settings are read as config.<section>.<key>, so a section set to anything but a mapping, e.g. null, breaks them all.
+    sections = sorted({path.split(".")[0] for path in SCHEMA if "." in path})
+    errors = [f"{section} must be a mapping, got {config.get(section)!r}" for section in sections if not isinstance(config.get(section), dict)]
+    errors += _check_types(config, SCHEMA) + _check_types(config[env], ENV_SCHEMA, f"{env}.")
+    errors += [f"{path} is missing" for path in ("min_mm_count", "max_mm_count", "workers_per_mm") if config.get(path) is None]
+    errors += [f"{env}.{key} is missing" for key in ENV_SCHEMA if config[env].get(key) is None]
+    if not isinstance(config[env].get("pools") or [], list):
+        errors.append(f"{env}.pools must be a list")
+    if errors:
+        return errors
+
+    limits = [("", config)]
+    pool_names = []
+    for pool_config in config[env].get("pools") or []:
+        if not isinstance(pool_config, dict):
+            errors.append(f"{env}.pools entries must be mappings, got {pool_config!r}")
+            continue
+        pool_errors = _check_types(pool_config, POOL_SCHEMA, f"{env}.pools.")
+        errors += pool_errors
+        pool_names.append(pool_config.get("name") if isinstance(pool_config.get("name"), str) else None)
+        # A pool with a wrongly typed limit has already failed, comparing its limits would only raise.
+        if not pool_errors:
+            limits.append((f"{env}.pools.{pool_config.get('name')}.", {key: pool_config.get(key, config[key]) for key in ("min_mm_count", "max_mm_count", "workers_per_mm")}))
+    if None in pool_names or len(set(pool_names)) != len(pool_names):
+        errors.append(f"{env}.pools need unique names")
+    for prefix, limit in limits:
+        if not 0 <= limit["min_mm_count"] <= limit["max_mm_count"]:
+            errors.append(f"{prefix}min_mm_count must be between 0 and max_mm_count")
+        if limit["workers_per_mm"] <= 0:
+            errors.append(f"{prefix}workers_per_mm must be positive")
+    if not 0 < config.scale_down.target_utilisation <= 1:
+        errors.append("scale_down.target_utilisation must be in (0, 1]")
+    if not 0 < config.forecast.smoothing <= 1:
+        errors.append("forecast.smoothing must be in (0, 1]")
+    for key in ("scale_up_max_delta", "scale_down_max_delta"):
+        if config.stabilization[key] < 0:
+            errors.append(f"stabilization.{key} must not be negative")
+    if config.leader_election.renew_deadline >= config.leader_election.lease_duration:
+        errors.append("leader_election.renew_deadline must be shorter than lease_duration")
+    if config.leader_election.enabled:
+        # A tick, and a standby's wait between snapshots, must fit in the time a leader keeps acting without a renewal.
+        for path, value in (("http.tick_deadline", config.http.tick_deadline), ("scheduler.slow_interval", config.scheduler.slow_interval)):
+            if value >= config.leader_election.renew_deadline:
+                errors.append(f"{path} must be shorter than leader_election.renew_deadline")
+    if config.scheduler.fast_interval > config.scheduler.slow_interval:
+        errors.append("scheduler.fast_interval must not exceed slow_interval")
+    for schedule in config.prewarm.schedules or []:
+        if not isinstance(schedule, dict) or len(str(schedule.get("cron", "")).split()) != 5 or not isinstance(schedule.get("min_mm_count"), int):
+            errors.append(f"prewarm.schedules entry {schedule!r} needs a five field cron and an integer min_mm_count")
+    return errors
+
+
+class EndpointUrls:
+    """Druid URLs for one pool, built once per configuration load; middle-manager URLs are templates on mm_id."""
+
+    def __init__(self, conf: "DruidConfig"):
+        overlord = f"http://{conf.overlord_service}.{conf.namespace}.{conf.suffix_domain}:{conf.overlord_port}"
+        middle_manager = f"http://{conf.middle_manager}-{{mm_id}}.{conf.mm_service}.{conf.namespace}.{conf.suffix_domain}:{conf.mm_port}"
+        self.workers = overlord + conf.workers_route
+        self.pending_tasks = overlord + conf.pending_tasks_route
+        self.all_running_tasks = overlord + conf.all_running_tasks_route
+        self.shutdown_task = overlord + conf.shutdown_task_route
+        self.running_tasks = middle_manager + conf.running_tasks_route
+        self.worker_status = middle_manager + conf.worker_status_route
+        self.disable_worker = middle_manager + conf.disable_worker_route
+        self.enable_worker = middle_manager + conf.enable_worker_route
 
 
 class DruidConfig:
-    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'druid_conf.yaml')) as __fp:
-        __config = munchify(yaml.safe_load(__fp))
+    __config: Munch = Munch()
+    __generation = 0
+    __source_mtimes: Tuple[Union[float, None], ...] = ()
+    __overrides: List[dict] = []
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.env = os.environ.get("env", "staging")
+        self.pool = pool
+        self.__loaded_generation = None
+        self.__endpoints = None
+
+    @staticmethod
+    def _read_yaml(path: str) -> dict:
+        with open(path) as fp:
+            values = yaml.safe_load(fp) or {}
+        if not isinstance(values, dict):
+            raise ConfigError(f"{path} must hold a mapping, got {type(values).__name__}")
+        return values
+
+    @classmethod
+    def _read(cls) -> Munch:
+        config = munchify(cls._read_yaml(CONFIG_PATH))
+        if os.path.isfile(OVERLAY_PATH):
+            merge_config(config, cls._read_yaml(OVERLAY_PATH))
+        merge_config(config, read_env_overlay())
+        for overrides in cls.__overrides:
+            merge_config(config, overrides)
+        try:
+            errors = validate_config(config, os.environ.get("env", "staging"))
+        except Exception as err:
+            # A value of a shape no check anticipated must still only reject the configuration.
+            raise ConfigError(f"Couldn't validate the configuration: {err!r}") from err
+        if errors:
+            raise ConfigError("; ".join(errors))
+        return config
+
+    @staticmethod
+    def _read_source_mtimes() -> Tuple[Union[float, None], ...]:
+        return tuple(os.stat(path).st_mtime if os.path.exists(path) else None for path in (CONFIG_PATH, OVERLAY_PATH))
 
-    def __init__(self):
-        env = os.environ.get("env", "staging")
-        self.env_config = self.__config[env]
+    @classmethod
+    def load(cls) -> None:
+        cls.__source_mtimes = cls._read_source_mtimes()
+        cls.__config = cls._read()
+        cls.__generation += 1
+
+    @classmethod
+    def reload_if_changed(cls) -> bool:
+        """Reloads the configuration when druid_conf.yaml or its overlay changed; a broken edit keeps the current one."""
+        source_mtimes = cls._read_source_mtimes()
+        if source_mtimes == cls.__source_mtimes:
+            return False
+        cls.__source_mtimes = source_mtimes
+        try:
+            config = cls._read()
+            env = os.environ.get("env", "staging")
+            # A PoolAutoscaler is built per pool at startup, so the pool list can't change on a reload.
+            if read_pool_names(config, env) != read_pool_names(cls.__config, env):
+                raise ConfigError(f"the pool list is read once at startup, restart to change it from "
+                                  f"{read_pool_names(cls.__config, env)} to {read_pool_names(config, env)}")
+        except (ConfigError, OSError, yaml.YAMLError) as err:
+            logger.error(f"Keeping the current configuration, reloading it failed: {err}")
+            return False
+        cls.__config = config
+        cls.__generation += 1
+        logger.info(f"Reloaded configuration, generation {cls.__generation}")
+        return True
+
+    @classmethod
+    def override(cls, overrides: dict) -> None:
+        """Deep-merges overrides into the loaded configuration, e.g. to run the simulator with other limits."""
+        cls.__overrides.append(overrides)
+        cls.__config = cls._read()
+        cls.__generation += 1
+
+    @classmethod
+    def to_dict(cls) -> dict:
+        """Returns a plain copy of the merged configuration, as overrides that reproduce it."""
+        return unmunchify(cls.__config)
+
+    @property
+    def generation(self) -> int:
+        return DruidConfig.__generation
+
+    def _refresh(self) -> None:
+        if self.__loaded_generation == DruidConfig.__generation:
+            return
+        self.__env_config = self.__config[self.env]
+        self.__pool_config = Munch()
+        for pool_config in self.__env_config.get("pools") or []:
+            if pool_config.name == self.pool:
+                self.__pool_config = pool_config
+        self.__endpoints = None
+        self.__loaded_generation = DruidConfig.__generation
+
+    @property
+    def env_config(self) -> Munch:
+        self._refresh()
+        return self.__env_config
+
+    @property
+    def pool_config(self) -> Munch:
+        self._refresh()
+        return self.__pool_config
+
+    @property
+    def endpoints(self) -> EndpointUrls:
+        self._refresh()
+        if self.__endpoints is None:
+            self.__endpoints = EndpointUrls(self)
+        return self.__endpoints
+
+    @property
+    def pool_names(self) -> List[str]:
+        return read_pool_names(self.__config, self.env)
+
+    @property
+    def pool_category(self) -> str:
+        return self.pool_config.get("category", "")
+
+    @property
+    def pool_task_types(self) -> List[str]:
+        return self.pool_config.get("task_types") or []
+
+    @property
+    def pool_datasources(self) -> List[str]:
+        return self.pool_config.get("datasources") or []
 
     @property
     def mm_service(self) -> str:
-        return self.env_config.mm_service
+        return self.pool_config.get("mm_service", self.env_config.mm_service)
 
     @property
     def overlord_service(self) -> str:
@@ -25,7 +372,7 @@ class DruidConfig:
 
     @property
     def middle_manager(self) -> str:
-        return self.env_config.middle_manager
+        return self.pool_config.get("middle_manager", self.env_config.middle_manager)
 
     @property
     def suffix_domain(self) -> str:
@@ -67,14 +414,277 @@ class DruidConfig:
     def all_running_tasks_route(self) -> str:
         return self.__config.routes.all_running_tasks
 
+    @property
+    def shutdown_task_route(self) -> str:
+        return self.__config.routes.shutdown_task
+
     @property
     def min_mm_count(self) -> int:
-        return self.__config.min_mm_count
+        return self.pool_config.get("min_mm_count", self.__config.min_mm_count)
 
     @property
     def max_mm_count(self) -> int:
-        return self.__config.max_mm_count
+        return self.pool_config.get("max_mm_count", self.__config.max_mm_count)
 
     @property
     def workers_per_mm(self) -> int:
-        return self.__config.workers_per_mm
+        return self.pool_config.get("workers_per_mm", self.__config.workers_per_mm)
+
+    @property
+    def http_pool_connections(self) -> int:
+        return self.__config.http.pool_connections
+
+    @property
+    def http_pool_maxsize(self) -> int:
+        return self.__config.http.pool_maxsize
+
+    @property
+    def http_connect_timeout(self) -> float:
+        return self.__config.http.connect_timeout
+
+    @property
+    def http_read_timeout(self) -> float:
+        return self.__config.http.read_timeout
+
+    @property
+    def http_retries(self) -> int:
+        return self.__config.http.retries
+
+    @property
+    def http_backoff_factor(self) -> float:
+        return self.__config.http.backoff_factor
+
+    @property
+    def tick_deadline(self) -> float:
+        return self.__config.http.tick_deadline
+
+    @property
+    def max_concurrent_mm_requests(self) -> int:
+        return self.__config.http.max_concurrent_mm_requests
+
+    @property
+    def k8s_scaler_mode(self) -> str:
+        return self.__config.kubernetes.scaler_mode
+
+    @property
+    def k8s_service_account_dir(self) -> str:
+        return self.__config.kubernetes.service_account_dir
+
+    @property
+    def fast_tick_interval(self) -> float:
+        return self.__config.scheduler.fast_interval
+
+    @property
+    def slow_tick_interval(self) -> float:
+        return self.__config.scheduler.slow_interval
+
+    @property
+    def late_tick_tolerance(self) -> float:
+        return self.__config.scheduler.late_tick_tolerance
+
+    @property
+    def watch_statefulset(self) -> bool:
+        return self.__config.scheduler.watch_statefulset
+
+    @property
+    def watch_timeout(self) -> int:
+        return self.__config.scheduler.watch_timeout
+
+    @property
+    def forecast_enabled(self) -> bool:
+        return self.__config.forecast.enabled
+
+    @property
+    def forecast_horizon(self) -> float:
+        return self.__config.forecast.horizon
+
+    @property
+    def forecast_window(self) -> float:
+        return self.__config.forecast.window
+
+    @property
+    def forecast_smoothing(self) -> float:
+        return self.__config.forecast.smoothing
+
+    @property
+    def forecast_max_step(self) -> int:
+        return self.__config.forecast.max_step
+
+    @property
+    def scale_down_target_utilisation(self) -> float:
+        return self.__config.scale_down.target_utilisation
+
+    @property
+    def scale_down_max_step(self) -> int:
+        return self.__config.scale_down.max_step
+
+    @property
+    def expected_task_duration(self) -> float:
+        return self.__config.scale_down.expected_task_duration
+
+    @property
+    def max_drain_time(self) -> float:
+        return self.__config.scale_down.max_drain_time
+
+    @property
+    def state_backend(self) -> str:
+        return self.__config.state.backend
+
+    @property
+    def state_configmap(self) -> str:
+        return self.__config.state.configmap
+
+    @property
+    def state_path(self) -> str:
+        return self.__config.state.path
+
+    @property
+    def metrics_enabled(self) -> bool:
+        return self.__config.metrics.enabled
+
+    @property
+    def metrics_port(self) -> int:
+        return self.__config.metrics.port
+
+    @property
+    def task_demand_enabled(self) -> bool:
+        return self.__config.task_demand.enabled
+
+    @property
+    def task_weights(self) -> dict:
+        return self.__config.task_demand.weights or {}
+
+    @property
+    def parallel_task_types(self) -> List[str]:
+        return self.__config.task_demand.parallel_task_types or []
+
+    @property
+    def task_history_window(self) -> float:
+        return self.__config.task_demand.history_window
+
+    @property
+    def default_fan_out(self) -> float:
+        return self.__config.task_demand.default_fan_out
+
+    @property
+    def scale_up_cooldown(self) -> float:
+        return self.__config.stabilization.scale_up_cooldown
+
+    @property
+    def scale_down_cooldown(self) -> float:
+        return self.__config.stabilization.scale_down_cooldown
+
+    @property
+    def scale_down_window(self) -> float:
+        return self.__config.stabilization.scale_down_window
+
+    @property
+    def scale_up_max_delta(self) -> int:
+        return self.__config.stabilization.scale_up_max_delta
+
+    @property
+    def scale_down_max_delta(self) -> int:
+        return self.__config.stabilization.scale_down_max_delta
+
+    @property
+    def stabilization_period(self) -> float:
+        return self.__config.stabilization.period
+
+    @property
+    def prewarm_schedules(self) -> List[dict]:
+        return self.pool_config.get("prewarm_schedules", self.__config.prewarm.schedules) or []
+
+    @property
+    def prewarm_learn_profile(self) -> bool:
+        return self.__config.prewarm.learn_profile
+
+    @property
+    def prewarm_profile_smoothing(self) -> float:
+        return self.__config.prewarm.profile_smoothing
+
+    @property
+    def prewarm_profile_lead_time(self) -> float:
+        return self.__config.prewarm.profile_lead_time
+
+    @property
+    def shadow_enabled(self) -> bool:
+        return self.__config.shadow.enabled
+
+    @property
+    def decision_log(self) -> str:
+        return self.__config.shadow.decision_log or ""
+
+    @property
+    def shadow_assumed_startup_time(self) -> float:
+        return self.__config.shadow.assumed_startup_time
+
+    @property
+    def slo_enabled(self) -> bool:
+        return self.__config.slo.enabled
+
+    @property
+    def slo_target_wait_p95(self) -> float:
+        return self.pool_config.get("slo_target_wait_p95", self.__config.slo.target_wait_p95)
+
+    @property
+    def mm_hour_cost(self) -> float:
+        return self.pool_config.get("mm_hour_cost", self.__config.slo.mm_hour_cost)
+
+    @property
+    def slo_startup_time(self) -> float:
+        return self.__config.slo.startup_time
+
+    @property
+    def slo_rate_window(self) -> float:
+        return self.__config.slo.rate_window
+
+    @property
+    def slo_report_window(self) -> float:
+        return self.__config.slo.report_window
+
+    @property
+    def trace_enabled(self) -> bool:
+        return self.__config.trace.enabled
+
+    @property
+    def trace_path(self) -> str:
+        return self.__config.trace.path
+
+    @property
+    def trace_max_bytes(self) -> int:
+        return self.__config.trace.max_bytes
+
+    @property
+    def trace_files(self) -> int:
+        return max(self.__config.trace.files, 1)
+
+    @property
+    def trace_include_snapshot(self) -> bool:
+        return self.__config.trace.include_snapshot
+
+    @property
+    def leader_election_enabled(self) -> bool:
+        return self.__config.leader_election.enabled
+
+    @property
+    def lease_name(self) -> str:
+        return self.__config.leader_election.lease_name
+
+    @property
+    def lease_duration(self) -> float:
+        return self.__config.leader_election.lease_duration
+
+    @property
+    def renew_deadline(self) -> float:
+        return self.__config.leader_election.renew_deadline
+
+    @property
+    def drain_deadline(self) -> float:
+        return self.__config.drain.deadline
+
+    @property
+    def drain_shutdown_task_types(self) -> List[str]:
+        return self.__config.drain.shutdown_task_types or []
+
+
+DruidConfig.load()
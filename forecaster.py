@@ -0,0 +1,86 @@
+from collections import deque
+from cluster_snapshot import ClusterSnapshot, parse_druid_time
+from druid_conf import DruidConfig
+from logging_config import logger
+from typing import Deque, Dict, Tuple, Union
+
+
+class DemandForecaster:
+    """Forecasts task slot demand (pending + running tasks) one horizon ahead from the recent task arrival rate."""
+
+    def __init__(self):
+        self.conf = DruidConfig()
+        self.__samples: Deque[Tuple[float, int]] = deque()
+        self.__arrivals: Deque[float] = deque()
+        self.__seen_task_ids: Dict[str, float] = {}
+        self.__forecasts: Deque[Tuple[float, float]] = deque()
+        self.__last_forecast_at: Union[float, None] = None
+        self.__arrival_rate: Union[float, None] = None
+        self.__completion_rate: Union[float, None] = None
+        self.last_forecast: Union[float, None] = None
+        self.last_error: Union[float, None] = None
+
+    def _smooth(self, prev: Union[float, None], value: float) -> float:
+        if prev is None:
+            return value
+        alpha = self.conf.forecast_smoothing
+        return alpha * value + (1 - alpha) * prev
+
+    def _record_arrivals(self, snapshot: ClusterSnapshot) -> None:
+        window_start = snapshot.taken_at - self.conf.forecast_window
+        for task in snapshot.pending_tasks + snapshot.running_tasks:
+            task_id = task.get("id")
+            if task_id is None or task_id in self.__seen_task_ids:
+                continue
+            created_at = parse_druid_time(task.get("createdTime")) or snapshot.taken_at
+            self.__seen_task_ids[task_id] = created_at
+            if created_at >= window_start:
+                self.__arrivals.append(created_at)
+
+        current_task_ids = {task.get("id") for task in snapshot.pending_tasks + snapshot.running_tasks}
+        self.__arrivals = deque(sorted(arrival for arrival in self.__arrivals if arrival >= window_start))
+        self.__seen_task_ids = {task_id: created_at for task_id, created_at in self.__seen_task_ids.items()
+                                if created_at >= window_start or task_id in current_task_ids}
+
+    def _resolve_forecasts(self, now: float, demand: int) -> None:
+        while self.__forecasts and self.__forecasts[0][0] <= now:
+            _, forecast = self.__forecasts.popleft()
+            self.last_error = forecast - demand
+            logger.info(f"Forecast demand was {forecast:.1f} task slots, actual demand is {demand}, error: {self.last_error:.1f}")
+
+    def observe(self, snapshot: ClusterSnapshot) -> None:
+        now = snapshot.taken_at
+        demand = snapshot.pending_tasks_count + snapshot.running_tasks_count
+        self._record_arrivals(snapshot)
+        self._resolve_forecasts(now, demand)
+
+        self.__samples.append((now, demand))
+        while len(self.__samples) > 1 and self.__samples[0][0] < now - self.conf.forecast_window:
+            self.__samples.popleft()
+        elapsed = now - self.__samples[0][0]
+        if elapsed <= 0:
+            return
+
+        arrival_rate = len(self.__arrivals) / self.conf.forecast_window
+        # Tasks that arrived in the window but no longer count towards demand have completed.
+        completed = len([arrival for arrival in self.__arrivals if arrival >= self.__samples[0][0]]) - (demand - self.__samples[0][1])
+        completion_rate = max(0.0, completed / elapsed)
+        self.__arrival_rate = self._smooth(self.__arrival_rate, arrival_rate)
+        self.__completion_rate = self._smooth(self.__completion_rate, completion_rate)
+
+    def forecast_demand(self, snapshot: ClusterSnapshot) -> float:
+        demand = snapshot.pending_tasks_count + snapshot.running_tasks_count
+        if self.__arrival_rate is None:
+            return float(demand)
+        if self.__last_forecast_at == snapshot.taken_at:
+            return self.last_forecast
+        growth = (self.__arrival_rate - self.__completion_rate) * self.conf.forecast_horizon
+        forecast = max(float(demand), demand + growth)
+        if not self.__forecasts or self.__forecasts[-1][0] < snapshot.taken_at + self.conf.forecast_horizon:
+            self.__forecasts.append((snapshot.taken_at + self.conf.forecast_horizon, forecast))
+        self.last_forecast = forecast
+        self.__last_forecast_at = snapshot.taken_at
+        logger.info(f"Arrival rate: {self.__arrival_rate * 60:.2f} tasks/min, completion rate: {self.__completion_rate * 60:.2f} tasks/min, "
+                    f"forecast demand in {self.conf.forecast_horizon}s: {forecast:.1f} task slots")
+        return forecast
+
@@ -0,0 +1,100 @@
+import json
+import os
+import requests
+import time
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError, RequestException
+from druid_conf import DruidConfig
+from logging_config import logger
+from metrics import K8S_API_DURATION, K8S_API_FAILURES
+from tick_trace import TickTracer
+from typing import Iterator, Union
+
+
+class ReplicaState:
+    def __init__(self, replicas: int, ready_replicas: int):
+        self.replicas = replicas
+        self.ready_replicas = ready_replicas
+
+
+class KubernetesApiClient:
+    _session = None
+
+    def __init__(self):
+        self.conf = DruidConfig()
+        self.base_url = f"https://{os.environ.get('KUBERNETES_SERVICE_HOST', 'kubernetes.default.svc')}:{os.environ.get('KUBERNETES_SERVICE_PORT', '443')}"
+        self.token_path = os.path.join(self.conf.k8s_service_account_dir, "token")
+        self.ca_cert_path = os.path.join(self.conf.k8s_service_account_dir, "ca.crt")
+
+    def is_in_cluster(self) -> bool:
+        return os.path.isfile(self.token_path)
+
+    @classmethod
+    def _get_session(cls, ca_cert_path: str) -> requests.Session:
+        if cls._session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.verify = ca_cert_path
+            cls._session = session
+        return cls._session
+
+    def _get_headers(self, content_type: str = "application/json") -> dict:
+        # Projected service-account tokens are rotated by the kubelet, so the file is re-read per request.
+        with open(self.token_path) as fp:
+            token = fp.read().strip()
+        return {"Authorization": f"Bearer {token}", "Content-Type": content_type}
+
+    def request(self, method: str, path: str, json: Union[dict, None] = None, content_type: str = "application/json") -> Union[dict, None]:
+        url = f"{self.base_url}{path}"
+        operation = f"{method} {path}"
+        started_at = time.monotonic()
+        data = None
+        try:
+            with K8S_API_DURATION.labels(operation).time():
+                response = self._get_session(self.ca_cert_path).request(
+                    method, url, json=json, headers=self._get_headers(content_type),
+                    timeout=(self.conf.http_connect_timeout, self.conf.http_read_timeout),
+                )
+            response.raise_for_status()
+            data = response.json()
+            return data
+        except HTTPError as http_err:
+            logger.error(f"Kubernetes API HTTP error occurred: {http_err}. API: {operation}")
+            K8S_API_FAILURES.labels(operation).inc()
+            return None
+        except (RequestException, OSError, ValueError) as err:
+            logger.error(f"Kubernetes API request error occurred: {err}. API: {operation}")
+            K8S_API_FAILURES.labels(operation).inc()
+            return None
+        finally:
+            TickTracer.api_call("kubernetes", method, path, url, time.monotonic() - started_at, data is not None)
+
+    def watch(self, path: str, timeout_seconds: int) -> Iterator[dict]:
+        url = f"{self.base_url}{path}"
+        params = {"watch": "true", "timeoutSeconds": timeout_seconds}
+        with self._get_session(self.ca_cert_path).get(url, params=params, headers=self._get_headers(), stream=True,
+                                                      timeout=(self.conf.http_connect_timeout, timeout_seconds + self.conf.http_read_timeout)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def watch_statefulset(self, name: str, timeout_seconds: int) -> Iterator[dict]:
+        path = f"/apis/apps/v1/namespaces/{self.conf.namespace}/statefulsets?fieldSelector=metadata.name%3D{name}"
+        return self.watch(path, timeout_seconds)
+
+    def _statefulset_path(self, name: str) -> str:
+        return f"/apis/apps/v1/namespaces/{self.conf.namespace}/statefulsets/{name}"
+
+    def patch_statefulset_scale(self, name: str, desired_replicas: int) -> bool:
+        resp = self.request("PATCH", f"{self._statefulset_path(name)}/scale", json={"spec": {"replicas": desired_replicas}},
+                            content_type="application/merge-patch+json")
+        return resp is not None
+
+    def get_statefulset_replica_state(self, name: str) -> Union[ReplicaState, None]:
+        statefulset = self.request("GET", self._statefulset_path(name))
+        if statefulset is None:
+            return None
+        spec = statefulset.get("spec") or {}
+        status = statefulset.get("status") or {}
+        return ReplicaState(spec.get("replicas", 0), status.get("readyReplicas", 0))
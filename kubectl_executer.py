@@ -1,11 +1,17 @@
 import subprocess
-from druid_conf import DruidConfig
+import time
+from druid_conf import DEFAULT_POOL, DruidConfig
+from k8s_client import KubernetesApiClient, ReplicaState
+from leader_election import LeaderElector
 from logging_config import logger
+from metrics import DESIRED_REPLICAS, K8S_API_DURATION, K8S_API_FAILURES
+from tick_trace import TickTracer
+from typing import Union
 
 
 class CommandsGenerator:
-    def __init__(self):
-        self.conf = DruidConfig()
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
 
     def generate_cmd_to_change_replicas(self, desired_replicas: int) -> str:
         cmd = f"kubectl scale statefulsets {self.conf.middle_manager} -n {self.conf.namespace} --replicas={desired_replicas}"
@@ -15,23 +21,49 @@ class CommandsGenerator:
 class CommandsRunner:
     @staticmethod
     def run(command):
+        started_at = time.monotonic()
         try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True, shell=True)
+            with K8S_API_DURATION.labels("kubectl").time():
+                result = subprocess.run(command, capture_output=True, text=True, check=True, shell=True)
             logger.info(f"Command succeeded:{command}")
             logger.info(result.stdout)
+            TickTracer.api_call("kubernetes", "RUN", "kubectl", command, time.monotonic() - started_at, True)
             return True
         except subprocess.CalledProcessError as e:
             logger.error(f"Command failed with exit code {e.returncode}")
             logger.error(e.stderr)
+            K8S_API_FAILURES.labels("kubectl").inc()
+            TickTracer.api_call("kubernetes", "RUN", "kubectl", command, time.monotonic() - started_at, False)
             return False
 
 
 class KubectlExecuter:
-    def __init__(self):
-        self.cmd_generator = CommandsGenerator()
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.cmd_generator = CommandsGenerator(pool)
         self.cmd_runner = CommandsRunner()
+        self.k8s_client = KubernetesApiClient()
+        self.use_api = self.conf.k8s_scaler_mode == "api"
+        if self.use_api and not self.k8s_client.is_in_cluster():
+            logger.warning("No in-cluster service-account token found, falling back to kubectl for scaling")
+            self.use_api = False
 
     def change_replicas(self, desired_replicas: int):
+        if not LeaderElector.can_act():
+            logger.warning(f"Lost the leader lease, not scaling to {desired_replicas} replicas")
+            return False
+        DESIRED_REPLICAS.labels(self.conf.pool).set(desired_replicas)
+        if self.use_api:
+            resp = self.k8s_client.patch_statefulset_scale(self.conf.middle_manager, desired_replicas)
+            if resp:
+                logger.info(f"Patched statefulsets/{self.conf.middle_manager}/scale to {desired_replicas} replicas")
+                return resp
+            logger.error("Failed to patch statefulset scale through the Kubernetes API, falling back to kubectl")
         command = self.cmd_generator.generate_cmd_to_change_replicas(desired_replicas)
         resp = self.cmd_runner.run(command)
         return resp
+
+    def get_replica_state(self) -> Union[ReplicaState, None]:
+        if not self.use_api:
+            return None
+        return self.k8s_client.get_statefulset_replica_state(self.conf.middle_manager)
@@ -0,0 +1,146 @@
+import os
+import socket
+import threading
+import time
+from cluster_snapshot import parse_druid_time
+from datetime import datetime, timezone
+from druid_conf import DruidConfig
+from k8s_client import KubernetesApiClient
+from logging_config import logger
+from metrics import LEADER
+from typing import Union
+
+# The leader renews this many times per renew_deadline, so a few failed renewals in a row don't depose it.
+RENEWALS_PER_DEADLINE = 4
+
+
+def to_micro_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class LeaderElector:
+    """Elects one active autoscaler among the replicas through a coordination.k8s.io Lease.
+
+    A background thread renews the lease several times per renew_deadline,
+    however long a tick takes; a standby takes it over once the holder has not
+    renewed for leader_election.lease_duration. Updates carry the lease's
+    resourceVersion, so only one of several racing standbys wins. The holder
+    stops acting once it couldn't renew for renew_deadline, which is shorter
+    than the lease duration, and every write to Druid, the StatefulSet or the
+    state store checks can_act() first, so a deposed leader stops writing
+    before a standby can take over.
+    """
+
+    # The enabled elector of this process, which can_act() asks.
+    _active: Union["LeaderElector", None] = None
+
+    def __init__(self):
+        self.conf = DruidConfig()
+        self.k8s_client = KubernetesApiClient()
+        self.identity = os.environ.get("POD_NAME") or socket.gethostname()
+        self.path = f"/apis/coordination.k8s.io/v1/namespaces/{self.conf.namespace}/leases"
+        self.is_enabled = self.conf.leader_election_enabled
+        if self.is_enabled and self.conf.shadow_enabled:
+            # A shadow autoscaler writes nothing, so it always computes its decisions instead of waiting for the lease.
+            logger.info("Shadow mode is on, running without leader election")
+            self.is_enabled = False
+        if self.is_enabled and not self.k8s_client.is_in_cluster():
+            logger.warning("No in-cluster service-account token found, running as the only autoscaler without leader election")
+            self.is_enabled = False
+        self.__lock = threading.Lock()
+        self.__renewed_at: Union[float, None] = None
+        self.__thread: Union[threading.Thread, None] = None
+        self.is_leader = False
+        # Counts the times this replica started acting as the leader, so a tick can tell it lost and regained the lease in between.
+        self.term = 0
+        if self.is_enabled:
+            LeaderElector._active = self
+
+    @classmethod
+    def can_act(cls) -> bool:
+        """Returns whether this process may write to the cluster or the state store right now."""
+        return cls._active is None or cls._active.is_acting()
+
+    def is_acting(self) -> bool:
+        if not self.is_enabled:
+            return True
+        with self.__lock:
+            return self.is_leader and time.time() - self.__renewed_at < self.conf.renew_deadline
+
+    def start(self) -> None:
+        """Tries for the lease once and keeps renewing it from a background thread."""
+        if not self.is_enabled or self.__thread is not None:
+            return
+        self.check_leadership()
+        self.__thread = threading.Thread(target=self._renew_forever, name="leader-election", daemon=True)
+        self.__thread.start()
+
+    def _renew_forever(self) -> None:
+        while True:
+            time.sleep(self.conf.renew_deadline / RENEWALS_PER_DEADLINE)
+            try:
+                self.check_leadership()
+            except Exception:
+                logger.exception("Leader lease renewal failed")
+
+    def _lease_spec(self, now: float, acquire_time: str, transitions: int) -> dict:
+        return {
+            "holderIdentity": self.identity,
+            "leaseDurationSeconds": int(self.conf.lease_duration),
+            "acquireTime": acquire_time,
+            "renewTime": to_micro_time(now),
+            "leaseTransitions": transitions,
+        }
+
+    def _try_acquire_or_renew(self, now: float) -> bool:
+        lease = self.k8s_client.request("GET", f"{self.path}/{self.conf.lease_name}")
+        if lease is None:
+            # The lease may not exist yet; creating it fails harmlessly if it does.
+            created = self.k8s_client.request("POST", self.path, json={
+                "apiVersion": "coordination.k8s.io/v1",
+                "kind": "Lease",
+                "metadata": {"name": self.conf.lease_name},
+                "spec": self._lease_spec(now, to_micro_time(now), 0),
+            })
+            return created is not None
+
+        spec = lease.get("spec") or {}
+        holder = spec.get("holderIdentity")
+        renewed_at = parse_druid_time(spec.get("renewTime"))
+        lease_duration = spec.get("leaseDurationSeconds") or self.conf.lease_duration
+        if holder and holder != self.identity and renewed_at is not None and now - renewed_at < lease_duration:
+            return False
+
+        transitions = spec.get("leaseTransitions") or 0
+        if holder == self.identity:
+            acquire_time = spec.get("acquireTime") or to_micro_time(now)
+        else:
+            logger.info(f"Leader lease held by '{holder}' expired, taking it over")
+            acquire_time = to_micro_time(now)
+            transitions += 1
+        lease["spec"] = self._lease_spec(now, acquire_time, transitions)
+        return self.k8s_client.request("PUT", f"{self.path}/{self.conf.lease_name}", json=lease) is not None
+
+    def check_leadership(self) -> bool:
+        """Acquires or renews the lease and returns whether this replica should act on the cluster."""
+        if not self.is_enabled:
+            return True
+        now = time.time()
+        is_renewed = self._try_acquire_or_renew(now)
+        with self.__lock:
+            was_leader = self.is_leader
+            # A leader that stopped acting may have been replaced in between, even if it now renews the lease as its holder.
+            was_acting = self.is_leader and now - self.__renewed_at < self.conf.renew_deadline
+            if is_renewed:
+                self.__renewed_at = now
+                self.is_leader = True
+            elif self.is_leader and now - self.__renewed_at < self.conf.renew_deadline:
+                logger.warning(f"Couldn't renew the leader lease, still leading for {self.conf.renew_deadline - (now - self.__renewed_at):.0f}s")
+            else:
+                self.is_leader = False
+            if self.is_leader and not was_acting:
+                self.term += 1
+        if self.is_leader != was_leader:
+            logger.info(f"{self.identity} {'became the leader' if self.is_leader else 'is a standby now'}")
+        LEADER.set(1 if self.is_leader else 0)
+        return self.is_leader
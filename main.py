@@ -1,13 +1,11 @@
-import time
-import schedule
 from druid_autoscaler import AutoScalerFacade
 from logging_config import logger
+from metrics import start_metrics_server
+from scheduler import AdaptiveScheduler
 
 
 if __name__ == '__main__':
     logger.info("Starting Druid Middle-Manager Autoscaler")
+    start_metrics_server()
     druid_autoscaler = AutoScalerFacade()
-    schedule.every(30).seconds.do(druid_autoscaler.execute)
-    while True:
-        schedule.run_pending()
-        time.sleep(15)
+    AdaptiveScheduler(druid_autoscaler.execute).run_forever()
@@ -0,0 +1,66 @@
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from cluster_snapshot import ClusterSnapshot, parse_druid_time
+from druid_conf import DruidConfig
+from logging_config import logger
+from typing import Dict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+WAIT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+TICK_DURATION = Histogram("midas_tick_duration_seconds", "Duration of an autoscaler tick", buckets=LATENCY_BUCKETS)
+DRUID_API_DURATION = Histogram("midas_druid_api_duration_seconds", "Latency of Druid API calls", ["method", "route"], buckets=LATENCY_BUCKETS)
+DRUID_API_FAILURES = Counter("midas_druid_api_failures_total", "Failed Druid API calls", ["method", "route"])
+K8S_API_DURATION = Histogram("midas_k8s_api_duration_seconds", "Latency of Kubernetes API and kubectl calls", ["operation"], buckets=LATENCY_BUCKETS)
+K8S_API_FAILURES = Counter("midas_k8s_api_failures_total", "Failed Kubernetes API and kubectl calls", ["operation"])
+SCALE_EVENTS = Counter("midas_scale_events_total", "Scaling actions taken", ["pool", "action"])
+SUPPRESSED_SCALE_ACTIONS = Counter("midas_suppressed_scale_actions_total", "Replica changes held back by a stabilization guard", ["pool", "guard"])
+DRAIN_DURATION = Histogram("midas_drain_duration_seconds", "Time from disabling a middle-manager until its tasks were gone", buckets=WAIT_BUCKETS)
+TASK_QUEUE_WAIT = Histogram("midas_task_queue_wait_seconds", "Time tasks spent pending before leaving the queue", buckets=WAIT_BUCKETS)
+
+PENDING_TASKS = Gauge("midas_pending_tasks", "Pending tasks reported by the overlord")
+RUNNING_TASKS = Gauge("midas_running_tasks", "Running tasks reported by the overlord")
+OLDEST_PENDING_TASK_AGE = Gauge("midas_oldest_pending_task_age_seconds", "Age of the oldest pending task")
+RUNNING_MMS = Gauge("midas_running_middle_managers", "Middle-managers registered with the overlord")
+DISABLED_MMS = Gauge("midas_disabled_middle_managers", "Middle-managers disabled by the autoscaler", ["pool"])
+DRAINING_MMS = Gauge("midas_draining_middle_managers", "Disabled middle-managers by drain phase", ["pool", "phase"])
+DESIRED_REPLICAS = Gauge("midas_desired_replicas", "Replica count last requested from the StatefulSet", ["pool"])
+WORKER_UTILISATION = Gauge("midas_worker_utilisation_ratio", "Used task slots over total task slots")
+LEADER = Gauge("midas_leader", "1 while this replica holds the leader lease and acts on the cluster")
+FORECAST_DEMAND = Gauge("midas_forecast_demand_task_slots", "Forecast task slot demand one horizon ahead", ["pool"])
+FORECAST_ERROR = Gauge("midas_forecast_error_task_slots", "Last forecast minus the demand actually observed", ["pool"])
+PREDICTED_WAIT_P95 = Gauge("midas_predicted_wait_p95_seconds", "Pending-task wait p95 predicted for the replica count the SLO policy chose", ["pool"])
+SLO_WAIT_P95 = Gauge("midas_slo_window_wait_p95_seconds", "Queue wait p95 of the tasks started in the last SLO report window", ["pool"])
+SLO_ATTAINMENT = Gauge("midas_slo_window_attainment_ratio", "Share of the tasks started in the last SLO report window within the wait target", ["pool"])
+SLO_SPEND = Gauge("midas_slo_window_spend", "Middle-manager cost of the last SLO report window", ["pool"])
+MM_SPEND = Counter("midas_mm_spend_total", "Middle-manager cost accrued at slo.mm_hour_cost", ["pool"])
+
+_pending_task_created_at: Dict[str, float] = {}
+
+
+def start_metrics_server() -> None:
+    conf = DruidConfig()
+    if not conf.metrics_enabled:
+        return
+    start_http_server(conf.metrics_port)
+    logger.info(f"Serving Prometheus metrics on port {conf.metrics_port}")
+
+
+def observe_snapshot(snapshot: ClusterSnapshot) -> None:
+    global _pending_task_created_at
+    PENDING_TASKS.set(snapshot.pending_tasks_count)
+    RUNNING_TASKS.set(snapshot.running_tasks_count)
+    RUNNING_MMS.set(snapshot.running_mm_count)
+    capacity = sum(worker.capacity for worker in snapshot.workers)
+    used = sum(worker.curr_capacity_used for worker in snapshot.workers)
+    WORKER_UTILISATION.set(used / capacity if capacity else 0)
+
+    pending_task_created_at = {}
+    for task in snapshot.pending_tasks:
+        created_at = parse_druid_time(task.get("createdTime"))
+        if task.get("id") is not None and created_at is not None:
+            pending_task_created_at[task["id"]] = created_at
+    OLDEST_PENDING_TASK_AGE.set(snapshot.taken_at - min(pending_task_created_at.values()) if pending_task_created_at else 0)
+    for task_id, created_at in _pending_task_created_at.items():
+        if task_id not in pending_task_created_at:
+            TASK_QUEUE_WAIT.observe(max(0.0, snapshot.taken_at - created_at))
+    _pending_task_created_at = pending_task_created_at
@@ -0,0 +1,166 @@
+import math
+import time
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DEFAULT_POOL, DruidConfig
+from leader_election import LeaderElector
+from logging_config import logger
+from state_store import get_state_store
+from typing import Dict, List, Set, Union
+
+SECONDS_PER_MINUTE = 60
+HOURS_PER_WEEK = 7 * 24
+
+
+class CronExpression:
+    """A standard five field cron expression (minute hour day-of-month month day-of-week), matched in UTC."""
+
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != len(self.FIELD_RANGES):
+            raise ValueError(f"Cron expression '{expression}' must have {len(self.FIELD_RANGES)} fields")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)]
+        # Sunday may be written as 0 or 7.
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.is_day_restricted = fields[2] != "*"
+        self.is_weekday_restricted = fields[4] != "*"
+
+    def _parse_field(self, field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-"))
+            else:
+                start = int(value_range)
+                end = high if step else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field '{field}' is out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def matches(self, timestamp: float) -> bool:
+        moment = time.gmtime(timestamp)
+        if moment.tm_min not in self.minutes or moment.tm_hour not in self.hours or moment.tm_mon not in self.months:
+            return False
+        is_day_match = moment.tm_mday in self.days
+        is_weekday_match = (moment.tm_wday + 1) % 7 in self.weekdays
+        # Like cron, a restricted day-of-month and day-of-week match when either does.
+        if self.is_day_restricted and self.is_weekday_restricted:
+            return is_day_match or is_weekday_match
+        return is_day_match and is_weekday_match
+
+
+class PrewarmWindow:
+    def __init__(self, schedule: dict):
+        self.cron = CronExpression(schedule["cron"])
+        self.min_mm_count = schedule["min_mm_count"]
+        self.lead_time = schedule.get("lead_time", 0)
+        self.duration = schedule.get("duration", 0)
+
+    def is_active(self, now: float) -> bool:
+        """Returns whether a run of the cron expression falls within lead_time ahead of now or duration behind it."""
+        minute = math.floor((now - self.duration) / SECONDS_PER_MINUTE) * SECONDS_PER_MINUTE
+        while minute <= now + self.lead_time:
+            if minute >= now - self.duration and self.cron.matches(minute):
+                return True
+            minute += SECONDS_PER_MINUTE
+        return False
+
+
+class WeeklyDemandProfile:
+    """Learns peak task slot demand per hour of the week, smoothed across weeks and persisted in the state store."""
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.store = get_state_store(pool, "profile")
+        self.__peaks: Dict[int, float] = {}
+        self.__current_hour: Union[int, None] = None
+        self.__current_peak = 0
+        self.load()
+
+    @staticmethod
+    def hour_of_week(timestamp: float) -> int:
+        moment = time.gmtime(timestamp)
+        return moment.tm_wday * 24 + moment.tm_hour
+
+    def load(self) -> None:
+        state = self.store.load()
+        if state is None:
+            return
+        self.__peaks = {int(hour): peak for hour, peak in state.get("peaks", {}).items()}
+        logger.info(f"Loaded weekly demand profile with {len(self.__peaks)} of {HOURS_PER_WEEK} hours learned")
+
+    def _save(self) -> None:
+        # Every replica learns the profile, only the one acting on the cluster writes it.
+        if not LeaderElector.can_act():
+            return
+        if not self.store.save({"peaks": self.__peaks, "updated_at": time.time()}):
+            logger.error("Failed to persist weekly demand profile")
+
+    def observe(self, snapshot: ClusterSnapshot) -> None:
+        hour = self.hour_of_week(snapshot.taken_at)
+        if hour != self.__current_hour:
+            if self.__current_hour is not None:
+                prev_peak = self.__peaks.get(self.__current_hour)
+                alpha = self.conf.prewarm_profile_smoothing
+                self.__peaks[self.__current_hour] = self.__current_peak if prev_peak is None else alpha * self.__current_peak + (1 - alpha) * prev_peak
+                self._save()
+            self.__current_hour = hour
+            self.__current_peak = 0
+        self.__current_peak = max(self.__current_peak, snapshot.pending_tasks_count + snapshot.running_tasks_count)
+
+    def expected_demand(self, timestamp: float) -> Union[float, None]:
+        return self.__peaks.get(self.hour_of_week(timestamp))
+
+
+class PrewarmSchedule:
+    """Raises the minimum middle-manager count ahead of known peaks, from cron schedules and optionally a learned weekly profile."""
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.windows: List[PrewarmWindow] = [PrewarmWindow(schedule) for schedule in self.conf.prewarm_schedules]
+        self.__windows_generation = self.conf.generation
+        self.profile = WeeklyDemandProfile(pool) if self.conf.prewarm_learn_profile else None
+        self.__last_min_mm_count = 0
+
+    def observe(self, snapshot: ClusterSnapshot) -> None:
+        if self.profile is not None:
+            self.profile.observe(snapshot)
+
+    def _refresh_windows(self) -> None:
+        if self.__windows_generation == self.conf.generation:
+            return
+        self.__windows_generation = self.conf.generation
+        try:
+            self.windows = [PrewarmWindow(schedule) for schedule in self.conf.prewarm_schedules]
+        except (KeyError, ValueError) as err:
+            logger.error(f"Keeping the previous pre-warm schedules, the reloaded ones are invalid: {err}")
+
+    def calc_min_mm_count(self, snapshot: ClusterSnapshot) -> int:
+        self._refresh_windows()
+        now = snapshot.taken_at
+        min_mm_count = 0
+        reasons = []
+        for window in self.windows:
+            if window.min_mm_count > min_mm_count and window.is_active(now):
+                min_mm_count = window.min_mm_count
+                reasons.append(f"schedule '{window.cron.expression}'")
+        if self.profile is not None:
+            expected_demands = [demand for demand in (self.profile.expected_demand(now), self.profile.expected_demand(now + self.conf.prewarm_profile_lead_time))
+                                if demand is not None]
+            if expected_demands:
+                learned_mm_count = math.ceil(max(expected_demands) / self.conf.workers_per_mm)
+                if learned_mm_count > min_mm_count:
+                    min_mm_count = learned_mm_count
+                    reasons.append("weekly demand profile")
+        if min_mm_count != self.__last_min_mm_count:
+            logger.info(f"Pre-warm minimum middle-manager count changed from {self.__last_min_mm_count} to {min_mm_count} ({', '.join(reasons) or 'no peak ahead'})")
+            self.__last_min_mm_count = min_mm_count
+        return min_mm_count
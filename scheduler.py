@@ -0,0 +1,99 @@
+import threading
+import time
+from druid_conf import DEFAULT_POOL, DruidConfig
+from k8s_client import KubernetesApiClient
+from logging_config import logger
+from typing import Callable
+
+
+class StatefulSetWatcher:
+    def __init__(self, on_change: Callable[[], None], pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.k8s_client = KubernetesApiClient()
+        self.on_change = on_change
+        self.__last_seen = None
+
+    def start(self) -> None:
+        if not self.k8s_client.is_in_cluster():
+            logger.warning("No in-cluster service-account token found, not watching the middle-manager statefulset")
+            return
+        threading.Thread(target=self._run, name=f"statefulset-watcher-{self.conf.pool}", daemon=True).start()
+
+    def _run(self) -> None:
+        retry_delay = 1
+        while True:
+            try:
+                for event in self.k8s_client.watch_statefulset(self.conf.middle_manager, self.conf.watch_timeout):
+                    self._handle_event(event)
+                retry_delay = 1
+            except Exception as err:
+                logger.error(f"Statefulset watch failed: {err}, retrying in {retry_delay}s")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.conf.slow_tick_interval)
+
+    def _handle_event(self, event: dict) -> None:
+        statefulset = event.get("object") or {}
+        spec = statefulset.get("spec") or {}
+        status = statefulset.get("status") or {}
+        state = (spec.get("replicas"), status.get("readyReplicas", 0))
+        if state != self.__last_seen:
+            if self.__last_seen is not None:
+                logger.info(f"Middle-manager statefulset changed, replicas/ready: {self.__last_seen} -> {state}")
+                self.on_change()
+            self.__last_seen = state
+
+
+class AdaptiveScheduler:
+    """Runs the autoscaler tick fast while the cluster is busy and backs off to the slow interval when idle."""
+
+    def __init__(self, job: Callable[[], bool]):
+        self.conf = DruidConfig()
+        self.job = job
+        self.wake_event = threading.Event()
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self.__interval = self.conf.fast_tick_interval
+
+    def trigger(self) -> None:
+        self.wake_event.set()
+
+    def _next_interval(self, is_busy: bool) -> float:
+        if is_busy:
+            return self.conf.fast_tick_interval
+        return min(self.__interval * 2, self.conf.slow_tick_interval)
+
+    def _run_job(self) -> bool:
+        try:
+            return bool(self.job())
+        except Exception:
+            logger.exception("Autoscaler tick failed")
+            return False
+
+    def run_forever(self) -> None:
+        if self.conf.watch_statefulset:
+            for pool in self.conf.pool_names:
+                StatefulSetWatcher(self.trigger, pool).start()
+
+        next_tick = time.monotonic()
+        while True:
+            started = time.monotonic()
+            lateness = started - next_tick
+            if lateness > self.conf.late_tick_tolerance:
+                self.late_ticks += 1
+                logger.warning(f"Autoscaler tick started {lateness:.1f}s late, total late ticks: {self.late_ticks}")
+
+            is_busy = self._run_job()
+            finished = time.monotonic()
+            self.__interval = self._next_interval(is_busy)
+            next_tick = started + self.__interval
+            if finished > next_tick:
+                skipped = int((finished - started) // self.__interval)
+                self.skipped_ticks += skipped
+                logger.warning(f"Autoscaler tick took {finished - started:.1f}s, skipped {skipped} tick(s), total skipped ticks: {self.skipped_ticks}")
+                next_tick = finished
+
+            if self.wake_event.wait(max(0, next_tick - time.monotonic())):
+                self.wake_event.clear()
+                logger.info("Woken up early by a middle-manager statefulset change")
+                self.__interval = self.conf.fast_tick_interval
+                next_tick = time.monotonic()
@@ -0,0 +1,71 @@
+import time
+from cluster_snapshot import ClusterSnapshot
+from druid_api_helper import DruidApiHelper
+from druid_conf import DEFAULT_POOL
+from k8s_client import ReplicaState
+from kubectl_executer import KubectlExecuter
+from metrics import DESIRED_REPLICAS
+from typing import Set, Union
+
+
+class ShadowDruidApiHelper(DruidApiHelper):
+    """Reads from the live cluster but only pretends to enable and disable middle-managers.
+
+    The middle-managers this autoscaler would have disabled are kept here and
+    laid over every snapshot, so its AutoscalerMeta reconciles against its own
+    decisions rather than those of the autoscaler actually running the cluster.
+    """
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        super().__init__(pool)
+        self.disabled_mm_ids: Set[int] = set()
+
+    def overlay(self, snapshot: ClusterSnapshot) -> None:
+        running_mm_count = snapshot.running_mm_count
+        self.disabled_mm_ids = {mm_id for mm_id in self.disabled_mm_ids if mm_id < running_mm_count}
+        for mm_id in range(running_mm_count):
+            if mm_id in self.disabled_mm_ids:
+                snapshot.mark_mm_disabled(mm_id)
+            else:
+                snapshot.mark_mm_enabled(mm_id)
+
+    def is_mm_disable(self, mm_id: int) -> Union[bool, None]:
+        return mm_id in self.disabled_mm_ids
+
+    def disable_idle_mm(self, mm_id: int) -> Union[bool, None]:
+        self.disabled_mm_ids.add(mm_id)
+        return True
+
+    def enable_mm(self, mm_id: int) -> Union[bool, None]:
+        self.disabled_mm_ids.discard(mm_id)
+        return True
+
+    def shutdown_task(self, task_id: str) -> Union[bool, None]:
+        return True
+
+
+class ShadowKubectlExecuter(KubectlExecuter):
+    """Reports replica changes as done without touching the StatefulSet.
+
+    A shadow scale-up is reported as rolling out for shadow.assumed_startup_time,
+    like a real one would be, after which the live replica count is trusted again.
+    Pods the shadow removes keep running, so it may repeat a decision; the diff
+    tool compares replica timelines, which repeats don't change.
+    """
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        super().__init__(pool)
+        self.desired_replicas: Union[int, None] = None
+        self.changed_at = 0.0
+
+    def change_replicas(self, desired_replicas: int):
+        DESIRED_REPLICAS.labels(self.conf.pool).set(desired_replicas)
+        self.desired_replicas = desired_replicas
+        self.changed_at = time.time()
+        return True
+
+    def get_replica_state(self) -> Union[ReplicaState, None]:
+        replica_state = super().get_replica_state()
+        if self.desired_replicas is None or time.time() - self.changed_at > self.conf.shadow_assumed_startup_time:
+            return replica_state
+        return ReplicaState(self.desired_replicas, replica_state.ready_replicas if replica_state is not None else 0)
@@ -0,0 +1,147 @@
+"""Compares two decision logs, e.g. the live autoscaler's and a shadow build's, over the time they overlap.
+
+Both logs are the JSON Lines files written to shadow.decision_log. Each is
+turned into a desired replica timeline and sampled every --bucket seconds next
+to the task demand it saw. Example:
+
+    python shadow_diff.py live-decisions.jsonl shadow-decisions.jsonl --bucket 60
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple, Union
+
+SCALE_ACTIONS = ("scale_up", "scale_down")
+
+
+class DecisionStream:
+    def __init__(self, path: str, entries: List[dict]):
+        self.path = path
+        self.entries = sorted(entries, key=lambda entry: entry["taken_at"])
+        self.action_counts: Dict[str, int] = {}
+        # (taken_at, desired replicas, task slot demand, slots per middle-manager) after each tick.
+        self.timeline: List[Tuple[float, int, int, int]] = []
+        desired_replicas = None
+        for entry in self.entries:
+            if desired_replicas is None:
+                desired_replicas = entry["running_mm_count"]
+            for action in entry["actions"]:
+                self.action_counts[action["action"]] = self.action_counts.get(action["action"], 0) + 1
+                if action["action"] in SCALE_ACTIONS:
+                    desired_replicas = action["to_replicas"]
+            demand = entry["pending_tasks_count"] + entry["running_tasks_count"]
+            self.timeline.append((entry["taken_at"], desired_replicas, demand, entry["workers_per_mm"]))
+
+    @property
+    def start(self) -> float:
+        return self.timeline[0][0]
+
+    @property
+    def end(self) -> float:
+        return self.timeline[-1][0]
+
+    def sample(self, start: float, end: float, bucket: float) -> List[Tuple[float, int, int, int]]:
+        samples = []
+        index = 0
+        at = start
+        while at <= end:
+            while index + 1 < len(self.timeline) and self.timeline[index + 1][0] <= at:
+                index += 1
+            samples.append((at,) + self.timeline[index][1:])
+            at += bucket
+        return samples
+
+
+def load_streams(path: str) -> Dict[str, DecisionStream]:
+    entries_by_pool: Dict[str, List[dict]] = {}
+    with open(path) as fp:
+        for line_no, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"Skipping unparsable line {line_no} of {path}", file=sys.stderr)
+                continue
+            entries_by_pool.setdefault(entry["pool"], []).append(entry)
+    return {pool: DecisionStream(path, entries) for pool, entries in entries_by_pool.items()}
+
+
+def summarize(samples: List[Tuple[float, int, int, int]], bucket: float) -> dict:
+    short_samples = [sample for sample in samples if sample[2] > sample[1] * sample[3]]
+    return {
+        "replica_hours": sum(sample[1] for sample in samples) * bucket / 3600,
+        "mean_replicas": sum(sample[1] for sample in samples) / len(samples),
+        "max_replicas": max(sample[1] for sample in samples),
+        "short_of_capacity_ratio": len(short_samples) / len(samples),
+    }
+
+
+def diff_streams(baseline: DecisionStream, candidate: DecisionStream, bucket: float, show: int) -> Union[dict, None]:
+    start = max(baseline.start, candidate.start)
+    end = min(baseline.end, candidate.end)
+    if start > end:
+        return None
+    baseline_samples = baseline.sample(start, end, bucket)
+    candidate_samples = candidate.sample(start, end, bucket)
+    deltas = [(baseline_sample[0], candidate_sample[1] - baseline_sample[1])
+              for baseline_sample, candidate_sample in zip(baseline_samples, candidate_samples)]
+    differing = [(at, delta) for at, delta in deltas if delta]
+    return {
+        "overlap_hours": (end - start) / 3600,
+        "baseline": {**summarize(baseline_samples, bucket), "actions": baseline.action_counts},
+        "candidate": {**summarize(candidate_samples, bucket), "actions": candidate.action_counts},
+        "differing_ratio": len(differing) / len(deltas),
+        "mean_replica_delta": sum(delta for _, delta in deltas) / len(deltas),
+        "max_replica_delta": max((delta for _, delta in deltas), key=abs),
+        "first_differences": [{"at": at, "replica_delta": delta} for at, delta in differing[:show]],
+    }
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two MIDAS decision logs")
+    parser.add_argument("baseline", help="decision log of the autoscaler acting on the cluster")
+    parser.add_argument("candidate", help="decision log of the shadow build")
+    parser.add_argument("--pool", help="only compare this pool")
+    parser.add_argument("--bucket", type=float, default=60, help="seconds between timeline samples")
+    parser.add_argument("--show", type=int, default=10, help="number of differing samples to list")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    baseline_streams = load_streams(args.baseline)
+    candidate_streams = load_streams(args.candidate)
+    pools = sorted(set(baseline_streams) & set(candidate_streams))
+    if args.pool:
+        pools = [pool for pool in pools if pool == args.pool]
+    if not pools:
+        print("The decision logs have no pool in common", file=sys.stderr)
+        return 1
+
+    reports = {}
+    for pool in pools:
+        report = diff_streams(baseline_streams[pool], candidate_streams[pool], args.bucket, args.show)
+        if report is None:
+            print(f"The decision logs for pool {pool} don't overlap in time", file=sys.stderr)
+            continue
+        reports[pool] = report
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return 0 if reports else 1
+
+    for pool, report in reports.items():
+        print(f"pool {pool}, {report['overlap_hours']:.1f}h overlap")
+        print(f"{'':>24}  {'baseline':>10}  {'candidate':>10}")
+        for key in ("replica_hours", "mean_replicas", "max_replicas", "short_of_capacity_ratio"):
+            print(f"{key:>24}  {report['baseline'][key]:>10.2f}  {report['candidate'][key]:>10.2f}")
+        for action in sorted(set(report["baseline"]["actions"]) | set(report["candidate"]["actions"])):
+            print(f"{action:>24}  {report['baseline']['actions'].get(action, 0):>10}  {report['candidate']['actions'].get(action, 0):>10}")
+        print(f"{'differing_ratio':>24}: {report['differing_ratio']:.2f}")
+        print(f"{'mean_replica_delta':>24}: {report['mean_replica_delta']:+.2f}")
+        print(f"{'max_replica_delta':>24}: {report['max_replica_delta']:+d}")
+        for difference in report["first_differences"]:
+            print(f"{'':>24}  at {difference['at']:.0f}: {difference['replica_delta']:+d} replicas")
+    return 0 if reports else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
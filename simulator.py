@@ -0,0 +1,383 @@
+"""Discrete-event simulator that replays ingestion task traces against the autoscaling policy.
+
+Runs AutoScalerFacade against an in-memory overlord, middle-managers and
+StatefulSet on a simulated clock, and reports queueing delay, MM-hours and
+scaling behaviour. Example:
+
+    python simulator.py --synthetic --hours 24 --workers-per-mm 15 --max-mm-count 8 --max-p95-wait 300
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import random
+import sys
+from datetime import datetime, timezone
+from druid_api_helper import DruidApiHelper
+from druid_conf import DruidConfig
+from cluster_snapshot import ClusterSnapshot
+from k8s_client import ReplicaState
+from logging_config import logger
+from slo_policy import percentile
+from typing import Callable, Dict, List, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+
+SIM_EPOCH = 1700000000.0
+
+
+def to_druid_time(sim_time: float) -> str:
+    return datetime.fromtimestamp(SIM_EPOCH + sim_time, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class SimTask:
+    def __init__(self, task_id: str, arrival: float, duration: float, task_type: str = "index_kafka", data_source: str = "sim"):
+        self.task_id = task_id
+        self.arrival = arrival
+        self.duration = duration
+        self.task_type = task_type
+        self.data_source = data_source
+        self.started_at: Union[float, None] = None
+        self.mm_id: Union[int, None] = None
+
+    def to_payload(self) -> dict:
+        return {"id": self.task_id, "type": self.task_type, "dataSource": self.data_source, "createdTime": to_druid_time(self.arrival)}
+
+
+class SimMiddleManager:
+    def __init__(self, mm_id: int, ready_at: float):
+        self.mm_id = mm_id
+        self.ready_at = ready_at
+        self.is_enabled = True
+        self.tasks: Dict[str, SimTask] = {}
+
+
+class SimCluster:
+    """In-memory overlord, middle-managers and middle-manager StatefulSet."""
+
+    def __init__(self, workers_per_mm: int, initial_mm_count: int, startup_delay: float):
+        self.conf = DruidConfig()
+        self.workers_per_mm = workers_per_mm
+        self.startup_delay = startup_delay
+        self.now = 0.0
+        self.pending: List[SimTask] = []
+        self.completions: List[Tuple[float, str]] = []
+        self.running: Dict[str, SimTask] = {}
+        self.pods: Dict[int, SimMiddleManager] = {mm_id: SimMiddleManager(mm_id, 0.0) for mm_id in range(initial_mm_count)}
+        self.desired_replicas = initial_mm_count
+        self.finished: List[SimTask] = []
+        self.killed: List[SimTask] = []
+        self.restarted: List[SimTask] = []
+        self.mm_seconds = 0.0
+
+    def _host(self, mm_id: int) -> str:
+        return f"{self.conf.middle_manager}-{mm_id}.{self.conf.mm_service}.{self.conf.namespace}.{self.conf.suffix_domain}:{self.conf.mm_port}"
+
+    def ready_pods(self) -> List[SimMiddleManager]:
+        return [pod for mm_id, pod in sorted(self.pods.items()) if pod.ready_at <= self.now]
+
+    def next_event_time(self) -> float:
+        times = [pod.ready_at for pod in self.pods.values() if pod.ready_at > self.now]
+        if self.completions:
+            times.append(self.completions[0][0])
+        return min(times) if times else math.inf
+
+    def advance(self, until: float) -> None:
+        self.mm_seconds += len(self.pods) * (until - self.now)
+        self.now = until
+        while self.completions and self.completions[0][0] <= self.now:
+            _, task_id = heapq.heappop(self.completions)
+            task = self.running.pop(task_id, None)
+            if task is None:
+                continue
+            self.pods[task.mm_id].tasks.pop(task_id, None)
+            self.finished.append(task)
+
+    def submit(self, task: SimTask) -> None:
+        self.pending.append(task)
+
+    def assign_pending(self) -> None:
+        # Mirrors the overlord's equalDistribution strategy: the enabled worker with most free slots wins.
+        while self.pending:
+            candidates = [pod for pod in self.ready_pods() if pod.is_enabled and len(pod.tasks) < self.workers_per_mm]
+            if not candidates:
+                return
+            pod = min(candidates, key=lambda candidate: (len(candidate.tasks), candidate.mm_id))
+            task = self.pending.pop(0)
+            task.started_at = self.now
+            task.mm_id = pod.mm_id
+            pod.tasks[task.task_id] = task
+            self.running[task.task_id] = task
+            heapq.heappush(self.completions, (self.now + task.duration, task.task_id))
+
+    def restart(self, task_id: str) -> None:
+        """Shuts a running task down and queues the replacement its supervisor would start for the remaining work."""
+        task = self.running.pop(task_id)
+        self.pods[task.mm_id].tasks.pop(task_id, None)
+        self.restarted.append(task)
+        self.submit(SimTask(f"{task_id}-restart", self.now, task.started_at + task.duration - self.now, task.task_type, task.data_source))
+
+    def scale(self, desired_replicas: int) -> None:
+        for mm_id in range(desired_replicas, len(self.pods)):
+            pod = self.pods.pop(mm_id)
+            for task in pod.tasks.values():
+                self.running.pop(task.task_id, None)
+                self.killed.append(task)
+        for mm_id in range(len(self.pods), desired_replicas):
+            self.pods[mm_id] = SimMiddleManager(mm_id, self.now + self.startup_delay)
+        self.desired_replicas = desired_replicas
+
+    def workers_payload(self) -> List[dict]:
+        return [{
+            "worker": {"host": self._host(pod.mm_id), "capacity": self.workers_per_mm, "version": "1" if pod.is_enabled else ""},
+            "currCapacityUsed": len(pod.tasks),
+            "runningTasks": list(pod.tasks),
+        } for pod in self.ready_pods()]
+
+    def get_pod(self, mm_id: int) -> Union[SimMiddleManager, None]:
+        pod = self.pods.get(mm_id)
+        if pod is None or pod.ready_at > self.now:
+            return None
+        return pod
+
+
+class SimDruidApiHelper(DruidApiHelper):
+    def __init__(self, cluster: SimCluster):
+        super().__init__()
+        self.cluster = cluster
+
+    def start_tick(self) -> None:
+        pass
+
+    def end_tick(self) -> None:
+        pass
+
+    def _fan_out(self, fn: Callable[[int], T], mm_ids: List[int]) -> Dict[int, T]:
+        return {mm_id: fn(mm_id) for mm_id in mm_ids}
+
+    def get_cluster_snapshot(self) -> Union[ClusterSnapshot, None]:
+        return ClusterSnapshot(
+            self.cluster.workers_payload(),
+            [task.to_payload() for task in self.cluster.pending],
+            [task.to_payload() for task in self.cluster.running.values()],
+            taken_at=SIM_EPOCH + self.cluster.now,
+        )
+
+    def get_running_tasks_on_mm(self, mm_id: int) -> Union[int, None]:
+        pod = self.cluster.get_pod(mm_id)
+        return None if pod is None else len(pod.tasks)
+
+    def get_free_workers_on_mm(self, mm_id: int) -> Union[int, None]:
+        pod = self.cluster.get_pod(mm_id)
+        return None if pod is None else self.cluster.workers_per_mm - len(pod.tasks)
+
+    def is_mm_idle(self, mm_id: int) -> Union[bool, None]:
+        pod = self.cluster.get_pod(mm_id)
+        return None if pod is None else not pod.tasks
+
+    def is_mm_disable(self, mm_id: int) -> Union[bool, None]:
+        pod = self.cluster.get_pod(mm_id)
+        return None if pod is None else not pod.is_enabled
+
+    def disable_idle_mm(self, mm_id: int) -> Union[bool, None]:
+        pod = self.cluster.get_pod(mm_id)
+        if pod is None:
+            return None
+        pod.is_enabled = False
+        return True
+
+    def enable_mm(self, mm_id: int) -> Union[bool, None]:
+        pod = self.cluster.get_pod(mm_id)
+        if pod is None:
+            return None
+        pod.is_enabled = True
+        return True
+
+    def shutdown_task(self, task_id: str) -> Union[bool, None]:
+        if task_id not in self.cluster.running:
+            return None
+        self.cluster.restart(task_id)
+        return True
+
+
+class SimStatefulSetExecuter:
+    def __init__(self, cluster: SimCluster):
+        self.cluster = cluster
+        self.scale_events: List[Tuple[float, int, int]] = []
+
+    def change_replicas(self, desired_replicas: int) -> bool:
+        self.scale_events.append((self.cluster.now, len(self.cluster.pods), desired_replicas))
+        self.cluster.scale(desired_replicas)
+        return True
+
+    def get_replica_state(self) -> Union[ReplicaState, None]:
+        return ReplicaState(self.cluster.desired_replicas, len(self.cluster.ready_pods()))
+
+
+def count_flaps(scale_events: List[Tuple[float, int, int]], flap_window: float) -> int:
+    """Counts direction reversals that happen within flap_window seconds of the previous scale event."""
+    flaps = 0
+    for (prev_time, prev_from, prev_to), (time, from_count, to_count) in zip(scale_events, scale_events[1:]):
+        if time - prev_time <= flap_window and (prev_to - prev_from) * (to_count - from_count) < 0:
+            flaps += 1
+    return flaps
+
+
+def synthetic_trace(hours: float, base_rate: float, burst_every: float, burst_size: int, mean_duration: float, seed: int) -> List[SimTask]:
+    """Poisson arrivals at base_rate tasks/min plus a burst of burst_size tasks every burst_every minutes."""
+    rng = random.Random(seed)
+    tasks = []
+    horizon = hours * 3600
+    now = 0.0
+    while base_rate > 0:
+        now += rng.expovariate(base_rate / 60)
+        if now >= horizon:
+            break
+        tasks.append(SimTask(f"task-{len(tasks)}", now, rng.lognormvariate(math.log(mean_duration), 0.5)))
+    if burst_every > 0:
+        burst_at = burst_every * 60
+        while burst_at < horizon:
+            for _ in range(burst_size):
+                tasks.append(SimTask(f"task-{len(tasks)}", burst_at + rng.uniform(0, 60), rng.lognormvariate(math.log(mean_duration), 0.5), "index_parallel"))
+            burst_at += burst_every * 60
+    return sorted(tasks, key=lambda task: task.arrival)
+
+
+def load_trace(path: str) -> List[SimTask]:
+    """Reads a JSON Lines trace with arrival and duration in seconds, and optional type and dataSource."""
+    tasks = []
+    with open(path) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            tasks.append(SimTask(record.get("id", f"task-{len(tasks)}"), float(record["arrival"]), float(record["duration"]),
+                                 record.get("type", "index_kafka"), record.get("dataSource", "sim")))
+    return sorted(tasks, key=lambda task: task.arrival)
+
+
+def run_simulation(tasks: List[SimTask], initial_mm_count: int, startup_delay: float, flap_window: float, drain_timeout: float) -> dict:
+    # Imported here so configuration overrides are in place before the autoscaler reads them.
+    from druid_autoscaler import AutoScalerFacade, AutoscalerMeta
+    conf = DruidConfig()
+    AutoscalerMeta._instances = {}
+    cluster = SimCluster(conf.workers_per_mm, initial_mm_count, startup_delay)
+    executer = SimStatefulSetExecuter(cluster)
+    facade = AutoScalerFacade(SimDruidApiHelper(cluster), executer)
+
+    arrivals = list(tasks)
+    end_of_trace = arrivals[-1].arrival if arrivals else 0.0
+    next_tick = 0.0
+    next_arrival = 0
+    interval = conf.fast_tick_interval
+    ticks = 0
+    while True:
+        next_time = min(next_tick, cluster.next_event_time(), arrivals[next_arrival].arrival if next_arrival < len(arrivals) else math.inf)
+        if next_time > end_of_trace + drain_timeout or (next_arrival >= len(arrivals) and not cluster.pending and not cluster.running and next_time >= end_of_trace):
+            break
+        cluster.advance(next_time)
+        while next_arrival < len(arrivals) and arrivals[next_arrival].arrival <= cluster.now:
+            cluster.submit(arrivals[next_arrival])
+            next_arrival += 1
+        cluster.assign_pending()
+        if cluster.now >= next_tick:
+            is_busy = facade.execute()
+            ticks += 1
+            interval = conf.fast_tick_interval if is_busy else min(interval * 2, conf.slow_tick_interval)
+            next_tick = cluster.now + interval
+            cluster.assign_pending()
+
+    waits = [task.started_at - task.arrival for task in cluster.finished + list(cluster.running.values()) if task.started_at is not None]
+    scale_ups = len([event for event in executer.scale_events if event[2] > event[1]])
+    return {
+        "tasks": len(tasks),
+        "finished_tasks": len(cluster.finished),
+        "killed_tasks": len(cluster.killed),
+        "restarted_tasks": len(cluster.restarted),
+        "unstarted_tasks": len(cluster.pending),
+        "queue_wait_p50": percentile(waits, 50),
+        "queue_wait_p95": percentile(waits, 95),
+        "queue_wait_p99": percentile(waits, 99),
+        "queue_wait_max": max(waits) if waits else 0.0,
+        "slo_attainment": len([wait for wait in waits if wait <= conf.slo_target_wait_p95]) / len(waits) if waits else 1.0,
+        "mm_hours": cluster.mm_seconds / 3600,
+        "spend": cluster.mm_seconds / 3600 * conf.mm_hour_cost,
+        "scale_ups": scale_ups,
+        "scale_downs": len(executer.scale_events) - scale_ups,
+        "flaps": count_flaps(executer.scale_events, flap_window),
+        "suppressed_actions": sum(sum(pool.stabilizer.suppressed.values()) for pool in facade.pools),
+        "ticks": ticks,
+        "simulated_hours": cluster.now / 3600,
+    }
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay an ingestion workload against the MIDAS scaling policy")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="JSON Lines trace with arrival and duration in seconds per task")
+    source.add_argument("--synthetic", action="store_true", help="generate a synthetic trace")
+    parser.add_argument("--hours", type=float, default=24, help="length of the synthetic trace")
+    parser.add_argument("--base-rate", type=float, default=2, help="synthetic Poisson arrivals per minute")
+    parser.add_argument("--burst-every", type=float, default=60, help="minutes between synthetic bursts, 0 disables them")
+    parser.add_argument("--burst-size", type=int, default=40, help="tasks per synthetic burst")
+    parser.add_argument("--mean-duration", type=float, default=900, help="median synthetic task duration in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers-per-mm", type=int)
+    parser.add_argument("--min-mm-count", type=int)
+    parser.add_argument("--max-mm-count", type=int)
+    parser.add_argument("--initial-mm-count", type=int, help="replicas at the start, defaults to min_mm_count")
+    parser.add_argument("--startup-delay", type=float, default=120, help="seconds for a new middle-manager pod to become ready")
+    parser.add_argument("--flap-window", type=float, default=600, help="seconds within which a reversed scale event counts as a flap")
+    parser.add_argument("--drain-timeout", type=float, default=6 * 3600, help="seconds to keep simulating after the last arrival")
+    parser.add_argument("--config", help="JSON object deep-merged into druid_conf.yaml before the run")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-p95-wait", type=float, help="fail if the p95 queue wait exceeds this many seconds")
+    parser.add_argument("--max-mm-hours", type=float, help="fail if more MM-hours than this are consumed")
+    parser.add_argument("--max-flaps", type=int, help="fail if the policy flaps more often than this")
+    parser.add_argument("--verbose", action="store_true", help="keep the autoscaler's own logging")
+    args = parser.parse_args(argv)
+
+    overrides = json.loads(args.config) if args.config else {}
+    overrides.setdefault("state", {})["backend"] = "memory"
+    overrides.setdefault("metrics", {})["enabled"] = False
+    overrides.setdefault("trace", {})["enabled"] = False
+    for key, value in (("workers_per_mm", args.workers_per_mm), ("min_mm_count", args.min_mm_count), ("max_mm_count", args.max_mm_count)):
+        if value is not None:
+            overrides[key] = value
+    DruidConfig.override(overrides)
+    if DruidConfig().env_config.get("pools"):
+        # The simulated cluster is a single StatefulSet, which every pool's autoscaler would then scale.
+        parser.error(f"the simulator models one middle-manager pool, remove {DruidConfig().env}.pools to run it")
+    if not args.verbose:
+        logger.setLevel(logging.ERROR)
+
+    if args.trace:
+        tasks = load_trace(args.trace)
+    else:
+        tasks = synthetic_trace(args.hours, args.base_rate, args.burst_every, args.burst_size, args.mean_duration, args.seed)
+    initial_mm_count = args.initial_mm_count if args.initial_mm_count is not None else DruidConfig().min_mm_count
+    report = run_simulation(tasks, initial_mm_count, args.startup_delay, args.flap_window, args.drain_timeout)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>18}: {value:.1f}" if isinstance(value, float) else f"{key:>18}: {value}")
+
+    failures = []
+    if args.max_p95_wait is not None and report["queue_wait_p95"] > args.max_p95_wait:
+        failures.append(f"p95 queue wait {report['queue_wait_p95']:.1f}s exceeds {args.max_p95_wait}s")
+    if args.max_mm_hours is not None and report["mm_hours"] > args.max_mm_hours:
+        failures.append(f"{report['mm_hours']:.1f} MM-hours exceeds {args.max_mm_hours}")
+    if args.max_flaps is not None and report["flaps"] > args.max_flaps:
+        failures.append(f"{report['flaps']} flaps exceeds {args.max_flaps}")
+    if report["killed_tasks"]:
+        failures.append(f"{report['killed_tasks']} tasks were killed by a scale-down")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
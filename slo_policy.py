@@ -0,0 +1,147 @@
+import math
+from collections import deque
+from cluster_snapshot import ClusterSnapshot, parse_druid_time
+from druid_conf import DEFAULT_POOL, DruidConfig
+from logging_config import logger
+from metrics import MM_SPEND, PREDICTED_WAIT_P95, SLO_ATTAINMENT, SLO_SPEND, SLO_WAIT_P95
+from tick_trace import TickTracer
+from typing import Deque, Dict, List, Set, Tuple, Union
+
+SECONDS_PER_HOUR = 3600
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(pct / 100 * len(values))) - 1)]
+
+
+class SloPolicy:
+    """Sizes a pool for a p95 pending-task wait target at the lowest middle-manager cost.
+
+    Pending tasks are expected to start oldest first: on a free slot right
+    away, then as running tasks finish at the completion rate seen over
+    slo.rate_window, or on the slots of added pods once slo.startup_time has
+    passed. The fewest added pods for which the p95 of the resulting waits,
+    counted from each task's createdTime, stays within target_wait_p95 wins.
+    Every slo.report_window the wait p95 of the tasks started, from createdTime
+    to the first tick that sees them running, the share of them started within
+    target and the middle-manager spend are reported. Only the leader accrues
+    spend and reports windows, standbys keep the completion rate and the tasks
+    they have seen current so they can take over.
+    """
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.pool = pool
+        self.__pending_created_at: Dict[str, float] = {}
+        self.__running_task_ids: Set[str] = set()
+        self.__completions: Deque[Tuple[float, int]] = deque()
+        self.__observed_since: Union[float, None] = None
+        self.__last_observed_at: Union[float, None] = None
+        self.__last_mm_count = 0
+        self.__window_id: Union[int, None] = None
+        self.__window_waits: List[float] = []
+        self.__window_mm_seconds = 0.0
+        self.__last_decision: Union[Tuple[int, int], None] = None
+
+    def observe(self, snapshot: ClusterSnapshot, is_acting: bool = True) -> None:
+        now = snapshot.taken_at
+        running_task_ids = {task["id"] for task in snapshot.running_tasks if task.get("id") is not None}
+        window_id = math.floor(now / self.conf.slo_report_window)
+        if self.__window_id is not None and window_id != self.__window_id:
+            if is_acting:
+                self._report()
+            self.__window_waits = []
+            self.__window_mm_seconds = 0.0
+        self.__window_id = window_id
+
+        if self.__last_observed_at is not None:
+            if is_acting:
+                self._accrue(snapshot)
+            self.__completions.append((now, len(self.__running_task_ids - running_task_ids)))
+        else:
+            self.__observed_since = now
+        while self.__completions and self.__completions[0][0] <= now - self.conf.slo_rate_window:
+            self.__completions.popleft()
+
+        self.__pending_created_at = {task["id"]: parse_druid_time(task.get("createdTime")) or now
+                                     for task in snapshot.pending_tasks if task.get("id") is not None}
+        self.__running_task_ids = running_task_ids
+        self.__last_observed_at = now
+        self.__last_mm_count = snapshot.running_mm_count
+
+    def _accrue(self, snapshot: ClusterSnapshot) -> None:
+        now = snapshot.taken_at
+        mm_seconds = self.__last_mm_count * (now - self.__last_observed_at)
+        self.__window_mm_seconds += mm_seconds
+        MM_SPEND.labels(self.pool).inc(mm_seconds / SECONDS_PER_HOUR * self.conf.mm_hour_cost)
+        # Tasks can queue and start between two ticks, so every task running for the first time counts, not just the ones seen pending.
+        for task in snapshot.running_tasks:
+            task_id = task.get("id")
+            if task_id is None or task_id in self.__running_task_ids:
+                continue
+            created_at = parse_druid_time(task.get("createdTime")) or self.__pending_created_at.get(task_id)
+            if created_at is not None:
+                self.__window_waits.append(max(0.0, now - created_at))
+
+    def _report(self) -> None:
+        waits = self.__window_waits
+        target = self.conf.slo_target_wait_p95
+        wait_p95 = percentile(waits, 95)
+        attainment = len([wait for wait in waits if wait <= target]) / len(waits) if waits else 1.0
+        mm_hours = self.__window_mm_seconds / SECONDS_PER_HOUR
+        spend = mm_hours * self.conf.mm_hour_cost
+        SLO_WAIT_P95.labels(self.pool).set(wait_p95)
+        SLO_ATTAINMENT.labels(self.pool).set(attainment)
+        SLO_SPEND.labels(self.pool).set(spend)
+        logger.info(f"SLO window of pool {self.pool}: {len(waits)} tasks started with a wait p95 of {wait_p95:.0f}s against {target:.0f}s "
+                    f"({'met' if wait_p95 <= target else 'missed'}), {attainment:.1%} within target, {mm_hours:.2f} MM-hours costing {spend:.2f}")
+
+    def calc_completion_rate(self, snapshot: ClusterSnapshot) -> float:
+        """Returns the task slots freed per second, from observed completions or else the assumed task duration."""
+        completions = sum(count for _, count in self.__completions)
+        observed_for = min(self.conf.slo_rate_window, snapshot.taken_at - self.__observed_since) if self.__observed_since is not None else 0
+        if completions and observed_for > 0:
+            return completions / observed_for
+        return snapshot.running_tasks_count / self.conf.expected_task_duration
+
+    def _predict_wait_p95(self, ages: List[float], free_slots: int, added_slots: int, rate: float) -> float:
+        releases_before_startup = math.floor(self.conf.slo_startup_time * rate)
+        waits = []
+        for position, age in enumerate(ages):
+            queued = position - free_slots + 1
+            if queued <= 0:
+                start_in = 0.0
+            elif queued <= releases_before_startup:
+                start_in = queued / rate
+            elif queued <= releases_before_startup + added_slots:
+                start_in = self.conf.slo_startup_time
+            else:
+                start_in = (queued - added_slots) / rate if rate > 0 else math.inf
+            waits.append(age + start_in)
+        return percentile(waits, 95)
+
+    def calc_mm_count(self, snapshot: ClusterSnapshot, rate: float) -> int:
+        """Returns the fewest middle-managers whose predicted pending-task wait p95 meets the target, or max_mm_count."""
+        now = snapshot.taken_at
+        running_mm_count = snapshot.running_mm_count
+        ages = sorted((now - (parse_druid_time(task.get("createdTime")) or now) for task in snapshot.pending_tasks), reverse=True)
+        free_slots = sum(worker.free_workers for worker in snapshot.workers if not worker.is_disabled)
+        target = self.conf.slo_target_wait_p95
+        # A target no pod count can meet, e.g. below the pod startup time, only buys the pods that still shorten the wait.
+        best_wait_p95 = self._predict_wait_p95(ages, free_slots, max(0, self.conf.max_mm_count - running_mm_count) * self.conf.workers_per_mm, rate)
+        reachable_target = max(target, best_wait_p95)
+        mm_count = running_mm_count
+        wait_p95 = self._predict_wait_p95(ages, free_slots, 0, rate)
+        while wait_p95 > reachable_target and mm_count < self.conf.max_mm_count:
+            mm_count += 1
+            wait_p95 = self._predict_wait_p95(ages, free_slots, (mm_count - running_mm_count) * self.conf.workers_per_mm, rate)
+        PREDICTED_WAIT_P95.labels(self.pool).set(wait_p95)
+        TickTracer.branch("slo", mm_count=mm_count, predicted_wait_p95=round(wait_p95, 1), free_slots=free_slots, completion_rate=round(rate, 4))
+        if (running_mm_count, mm_count) != self.__last_decision:
+            self.__last_decision = (running_mm_count, mm_count)
+            logger.info(f"{len(ages)} pending tasks, {free_slots} free slots and {rate * 60:.1f} slots freed per minute predict a wait p95 of "
+                        f"{wait_p95:.0f}s against {target:.0f}s with {mm_count} middle-managers")
+        return mm_count
@@ -0,0 +1,117 @@
+from collections import deque
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DEFAULT_POOL, DruidConfig
+from logging_config import logger
+from metrics import SUPPRESSED_SCALE_ACTIONS
+from tick_trace import TickTracer
+from typing import Deque, Dict, Tuple, Union
+
+
+class ScaleStabilizer:
+    """Holds back replica changes that would make the StatefulSet flap, along the lines of the HPA behavior field.
+
+    Scale-up waits scale_up_cooldown after the last scale-up. Scale-down waits
+    scale_down_cooldown after any replica change and only goes as low as the
+    highest target recommended over the last scale_down_window, so a short lull
+    doesn't shed pods. Either direction can be capped at a max replica delta
+    per period, 0 leaves it uncapped.
+    """
+
+    def __init__(self, pool: str = DEFAULT_POOL):
+        self.conf = DruidConfig(pool)
+        self.pool = pool
+        self.__recommendations: Deque[Tuple[float, int]] = deque()
+        self.__observed_since: Union[float, None] = None
+        self.__changes: Deque[Tuple[float, int]] = deque()
+        self.__last_scale_up_at: Union[float, None] = None
+        self.__last_change_at: Union[float, None] = None
+        self.suppressed: Dict[str, int] = {}
+
+    def _suppress(self, guard: str, message: str) -> None:
+        self.suppressed[guard] = self.suppressed.get(guard, 0) + 1
+        SUPPRESSED_SCALE_ACTIONS.labels(self.pool, guard).inc()
+        logger.info(f"Stabilization guard {guard} held back {message}")
+        TickTracer.branch("suppressed", guard=guard, message=message)
+
+    def get_state(self) -> dict:
+        return {
+            "recommendations": list(self.__recommendations),
+            "observed_since": self.__observed_since,
+            "changes": list(self.__changes),
+            "last_scale_up_at": self.__last_scale_up_at,
+            "last_change_at": self.__last_change_at,
+        }
+
+    def set_state(self, state: dict) -> None:
+        self.__recommendations = deque(tuple(recommendation) for recommendation in state["recommendations"])
+        self.__observed_since = state["observed_since"]
+        self.__changes = deque(tuple(change) for change in state["changes"])
+        self.__last_scale_up_at = state["last_scale_up_at"]
+        self.__last_change_at = state["last_change_at"]
+
+    def _is_cooling_down(self, since: Union[float, None], cooldown: float, now: float) -> bool:
+        return since is not None and now - since < cooldown
+
+    def _delta_budget(self, direction: int, max_delta: int, now: float) -> Union[int, None]:
+        """Returns how many more replicas may change in the direction this period, None when max_delta is 0."""
+        while self.__changes and self.__changes[0][0] <= now - self.conf.stabilization_period:
+            self.__changes.popleft()
+        if max_delta == 0:
+            return None
+        used = sum(abs(delta) for _, delta in self.__changes if delta * direction > 0)
+        return max(0, max_delta - used)
+
+    def _record_recommendation(self, target_mm_count: int, now: float) -> None:
+        if self.__observed_since is None:
+            self.__observed_since = now
+        self.__recommendations.append((now, target_mm_count))
+        while self.__recommendations and self.__recommendations[0][0] < now - self.conf.scale_down_window:
+            self.__recommendations.popleft()
+
+    def hold(self, snapshot: ClusterSnapshot) -> None:
+        """Records a tick in which scale-down was not considered, so it counts as a recommendation to keep every pod."""
+        self._record_recommendation(snapshot.running_mm_count, snapshot.taken_at)
+
+    def stabilize_scale_up(self, target_mm_count: int, snapshot: ClusterSnapshot) -> int:
+        running_mm_count = snapshot.running_mm_count
+        now = snapshot.taken_at
+        if target_mm_count <= running_mm_count:
+            return target_mm_count
+        if self._is_cooling_down(self.__last_scale_up_at, self.conf.scale_up_cooldown, now):
+            self._suppress("scale_up_cooldown", f"scale-up to {target_mm_count}, last scale-up was {now - self.__last_scale_up_at:.0f}s ago")
+            return running_mm_count
+        budget = self._delta_budget(1, self.conf.scale_up_max_delta, now)
+        if budget is not None and target_mm_count - running_mm_count > budget:
+            self._suppress("scale_up_max_delta", f"scale-up to {target_mm_count}, {budget} more replicas allowed this period")
+            return running_mm_count + budget
+        return target_mm_count
+
+    def stabilize_scale_down(self, target_mm_count: int, snapshot: ClusterSnapshot) -> int:
+        running_mm_count = snapshot.running_mm_count
+        now = snapshot.taken_at
+        self._record_recommendation(target_mm_count, now)
+        if target_mm_count >= running_mm_count:
+            return target_mm_count
+        if self._is_cooling_down(self.__last_change_at, self.conf.scale_down_cooldown, now):
+            self._suppress("scale_down_cooldown", f"scale-down to {target_mm_count}, last replica change was {now - self.__last_change_at:.0f}s ago")
+            return running_mm_count
+        if now - self.__observed_since < self.conf.scale_down_window:
+            self._suppress("scale_down_window", f"scale-down to {target_mm_count}, only {now - self.__observed_since:.0f}s of recommendations seen")
+            return running_mm_count
+        stabilized_mm_count = max(mm_count for _, mm_count in self.__recommendations)
+        if stabilized_mm_count > target_mm_count:
+            self._suppress("scale_down_window", f"scale-down to {target_mm_count}, highest recommendation in the window is {stabilized_mm_count}")
+        if stabilized_mm_count >= running_mm_count:
+            return running_mm_count
+        budget = self._delta_budget(-1, self.conf.scale_down_max_delta, now)
+        if budget is not None and running_mm_count - stabilized_mm_count > budget:
+            self._suppress("scale_down_max_delta", f"scale-down to {stabilized_mm_count}, {budget} fewer replicas allowed this period")
+            return running_mm_count - budget
+        return stabilized_mm_count
+
+    def record_change(self, from_mm_count: int, to_mm_count: int, snapshot: ClusterSnapshot) -> None:
+        now = snapshot.taken_at
+        self.__changes.append((now, to_mm_count - from_mm_count))
+        self.__last_change_at = now
+        if to_mm_count > from_mm_count:
+            self.__last_scale_up_at = now
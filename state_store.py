@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+from druid_conf import DEFAULT_POOL, DruidConfig
+from k8s_client import KubernetesApiClient
+from logging_config import logger
+from typing import Union
+
+STATE_KEY = "state.json"
+
+
+class StateStore:
+    def load(self) -> Union[dict, None]:
+        raise NotImplementedError
+
+    def save(self, state: dict) -> bool:
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self.__state = None
+
+    def load(self) -> Union[dict, None]:
+        return self.__state
+
+    def save(self, state: dict) -> bool:
+        self.__state = dict(state)
+        return True
+
+
+class FileStateStore(StateStore):
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Union[dict, None]:
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except (OSError, ValueError) as err:
+            logger.error(f"Couldn't read autoscaler state from {self.path}: {err}")
+            return None
+
+    def save(self, state: dict) -> bool:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".midas-state-")
+            with os.fdopen(fd, "w") as fp:
+                json.dump(state, fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as err:
+            logger.error(f"Couldn't write autoscaler state to {self.path}: {err}")
+            return False
+
+
+class ConfigMapStateStore(StateStore):
+    def __init__(self, name: str, key: str = STATE_KEY):
+        self.conf = DruidConfig()
+        self.name = name
+        self.key = key
+        self.k8s_client = KubernetesApiClient()
+        self.path = f"/api/v1/namespaces/{self.conf.namespace}/configmaps"
+
+    def load(self) -> Union[dict, None]:
+        configmap = self.k8s_client.request("GET", f"{self.path}/{self.name}")
+        if configmap is None:
+            return None
+        try:
+            return json.loads((configmap.get("data") or {})[self.key])
+        except (KeyError, ValueError) as err:
+            logger.error(f"Couldn't parse autoscaler state from configmap {self.name}: {err}")
+            return None
+
+    def save(self, state: dict) -> bool:
+        # A merge patch replaces the single data key in one write, so readers never see a partial state.
+        data = {self.key: json.dumps(state)}
+        resp = self.k8s_client.request("PATCH", f"{self.path}/{self.name}", json={"data": data},
+                                       content_type="application/merge-patch+json")
+        if resp is None:
+            resp = self.k8s_client.request("POST", self.path, json={"metadata": {"name": self.name}, "data": data})
+        return resp is not None
+
+
+def get_state_store(pool: str = DEFAULT_POOL, name: str = "") -> StateStore:
+    """Returns the configured store for a pool and state name; the default pool and name keep the unsuffixed key and path."""
+    conf = DruidConfig()
+    backend = conf.state_backend
+    if conf.shadow_enabled:
+        # A shadow autoscaler must never overwrite the state of the one acting on the cluster.
+        return MemoryStateStore()
+    parts = [part for part in (pool if pool != DEFAULT_POOL else "", name) if part]
+    if backend == "configmap":
+        if KubernetesApiClient().is_in_cluster():
+            return ConfigMapStateStore(conf.state_configmap, ".".join(parts + [STATE_KEY]))
+        logger.warning("No in-cluster service-account token found, keeping autoscaler state in a local file")
+        backend = "file"
+    if backend == "file":
+        root, ext = os.path.splitext(conf.state_path)
+        return FileStateStore(root + "".join(f"-{part}" for part in parts) + ext)
+    return MemoryStateStore()
@@ -0,0 +1,86 @@
+import math
+from collections import deque
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DruidConfig
+from logging_config import logger
+from typing import Deque, Dict, List, Tuple
+
+
+class ParentTask:
+    def __init__(self, task: dict):
+        self.key = (task.get("type"), task.get("dataSource"))
+        self.group_id = task.get("groupId") or task.get("id")
+        self.max_subtasks = 0
+
+
+class TaskDemandModel:
+    """Estimates pending task slot demand from per-type weights and the fan-out parallel tasks showed recently.
+
+    Subtasks of a parallel task share its groupId, so the peak number of live
+    subtasks seen per parent is recorded once the parent finishes and averaged
+    per (type, dataSource) over task_demand.history_window.
+    """
+
+    def __init__(self):
+        self.conf = DruidConfig()
+        self.__parents: Dict[str, ParentTask] = {}
+        self.__history: Deque[Tuple[float, Tuple[str, str], int]] = deque()
+
+    def _weight(self, task: dict) -> float:
+        return self.conf.task_weights.get(task.get("type"), 1)
+
+    @staticmethod
+    def _count_live_tasks_by_group(tasks: List[dict]) -> Dict[str, int]:
+        live_tasks_by_group: Dict[str, int] = {}
+        for task in tasks:
+            group_id = task.get("groupId")
+            if group_id is not None:
+                live_tasks_by_group[group_id] = live_tasks_by_group.get(group_id, 0) + 1
+        return live_tasks_by_group
+
+    def observe(self, snapshot: ClusterSnapshot) -> None:
+        tasks = snapshot.pending_tasks + snapshot.running_tasks
+        live_tasks_by_group = self._count_live_tasks_by_group(tasks)
+
+        live_parent_ids = set()
+        for task in tasks:
+            if task.get("type") not in self.conf.parallel_task_types:
+                continue
+            parent = self.__parents.setdefault(task.get("id"), ParentTask(task))
+            # The group count includes the parent itself.
+            parent.max_subtasks = max(parent.max_subtasks, live_tasks_by_group.get(parent.group_id, 1) - 1)
+            live_parent_ids.add(task.get("id"))
+
+        for parent_id in list(self.__parents):
+            if parent_id not in live_parent_ids:
+                parent = self.__parents.pop(parent_id)
+                self.__history.append((snapshot.taken_at, parent.key, parent.max_subtasks))
+                logger.info(f"Parallel task {parent_id} of type {parent.key[0]} on {parent.key[1]} finished after fanning out to {parent.max_subtasks} subtasks")
+        while self.__history and self.__history[0][0] < snapshot.taken_at - self.conf.task_history_window:
+            self.__history.popleft()
+
+    def expected_fan_out(self, task_type: str, data_source: str) -> float:
+        for matches in (lambda key: key == (task_type, data_source), lambda key: key[0] == task_type):
+            fan_outs = [fan_out for _, key, fan_out in self.__history if matches(key)]
+            if fan_outs:
+                return sum(fan_outs) / len(fan_outs)
+        return self.conf.default_fan_out
+
+    def calc_pending_demand(self, snapshot: ClusterSnapshot) -> int:
+        tasks = snapshot.pending_tasks + snapshot.running_tasks
+        demand = sum(self._weight(task) for task in snapshot.pending_tasks)
+        live_tasks_by_group = self._count_live_tasks_by_group(tasks)
+
+        unspawned: List[str] = []
+        for task in tasks:
+            if task.get("type") not in self.conf.parallel_task_types:
+                continue
+            group_id = task.get("groupId") or task.get("id")
+            spawned = live_tasks_by_group.get(group_id, 1) - 1
+            expected = self.expected_fan_out(task.get("type"), task.get("dataSource"))
+            if expected > spawned:
+                demand += expected - spawned
+                unspawned.append(f"{task.get('id')}: {expected - spawned:.1f}")
+        if unspawned:
+            logger.info(f"Expected subtasks not spawned yet: {', '.join(unspawned)}")
+        return math.ceil(demand)
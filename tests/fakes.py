@@ -0,0 +1,168 @@
+"""In-memory stand-ins for the Druid overlord and middle-managers, the Kubernetes API and the state store."""
+import copy
+import itertools
+from datetime import datetime, timezone
+from cluster_snapshot import ClusterSnapshot
+from druid_api_helper import DruidApiHelper
+from druid_conf import DEFAULT_POOL, DruidConfig
+from k8s_client import KubernetesApiClient
+from state_store import MemoryStateStore
+from typing import Callable, Dict, List, Set, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+
+
+def to_druid_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeStateStores:
+    """Replaces get_state_store, handing out one MemoryStateStore per pool and state name."""
+
+    def __init__(self):
+        self.stores: Dict[Tuple[str, str], MemoryStateStore] = {}
+
+    def __call__(self, pool: str = DEFAULT_POOL, name: str = "") -> MemoryStateStore:
+        return self.stores.setdefault((pool, name), MemoryStateStore())
+
+
+class FakeMiddleManager:
+    def __init__(self):
+        self.is_enabled = True
+        self.task_ids: List[str] = []
+
+
+class FakeDruidApiHelper(DruidApiHelper):
+    """A pool's overlord and middle-managers; a write listed in failing_writes, e.g. ("disable_mm", 3), fails."""
+
+    def __init__(self, mm_count: int, pool: str = DEFAULT_POOL):
+        super().__init__(pool)
+        self.conf = DruidConfig(pool)
+        self.middle_managers: Dict[int, FakeMiddleManager] = {mm_id: FakeMiddleManager() for mm_id in range(mm_count)}
+        self.tasks: Dict[str, dict] = {}
+        self.pending_tasks: List[dict] = []
+        self.failing_writes: Set[Tuple[str, Union[int, str]]] = set()
+        self.writes: List[Tuple[str, Union[int, str]]] = []
+
+    def start_tick(self) -> None:
+        pass
+
+    def end_tick(self) -> None:
+        pass
+
+    def _fan_out(self, fn: Callable[[int], T], mm_ids: List[int]) -> Dict[int, T]:
+        return {mm_id: fn(mm_id) for mm_id in mm_ids}
+
+    def add_task(self, mm_id: int, task_id: str, created_at: float, task_type: str = "index_kafka") -> None:
+        self.middle_managers[mm_id].task_ids.append(task_id)
+        self.tasks[task_id] = {"id": task_id, "type": task_type, "createdTime": to_druid_time(created_at)}
+
+    def finish_task(self, task_id: str) -> None:
+        self.tasks.pop(task_id)
+        for middle_manager in self.middle_managers.values():
+            if task_id in middle_manager.task_ids:
+                middle_manager.task_ids.remove(task_id)
+
+    def snapshot(self, taken_at: float) -> ClusterSnapshot:
+        workers = [{
+            "worker": {"host": f"{self.conf.middle_manager}-{mm_id}.{self.conf.mm_service}:{self.conf.mm_port}",
+                       "capacity": self.conf.workers_per_mm, "version": "1" if middle_manager.is_enabled else ""},
+            "currCapacityUsed": len(middle_manager.task_ids),
+            "runningTasks": list(middle_manager.task_ids),
+        } for mm_id, middle_manager in sorted(self.middle_managers.items())]
+        return ClusterSnapshot(workers, list(self.pending_tasks), list(self.tasks.values()), taken_at, self.conf.pool)
+
+    def get_running_tasks_on_mm(self, mm_id: int) -> Union[int, None]:
+        middle_manager = self.middle_managers.get(mm_id)
+        return None if middle_manager is None else len(middle_manager.task_ids)
+
+    def get_free_workers_on_mm(self, mm_id: int) -> Union[int, None]:
+        middle_manager = self.middle_managers.get(mm_id)
+        return None if middle_manager is None else self.conf.workers_per_mm - len(middle_manager.task_ids)
+
+    def is_mm_idle(self, mm_id: int) -> Union[bool, None]:
+        middle_manager = self.middle_managers.get(mm_id)
+        return None if middle_manager is None else not middle_manager.task_ids
+
+    def is_mm_disable(self, mm_id: int) -> Union[bool, None]:
+        middle_manager = self.middle_managers.get(mm_id)
+        return None if middle_manager is None else not middle_manager.is_enabled
+
+    def _set_enabled(self, mm_id: int, is_enabled: bool) -> Union[bool, None]:
+        action = "enable_mm" if is_enabled else "disable_mm"
+        if not self._can_write(f"running {action} on MM-{mm_id}"):
+            return None
+        self.writes.append((action, mm_id))
+        middle_manager = self.middle_managers.get(mm_id)
+        if middle_manager is None or (action, mm_id) in self.failing_writes:
+            return None
+        middle_manager.is_enabled = is_enabled
+        return True
+
+    def disable_idle_mm(self, mm_id: int) -> Union[bool, None]:
+        return self._set_enabled(mm_id, False)
+
+    def enable_mm(self, mm_id: int) -> Union[bool, None]:
+        return self._set_enabled(mm_id, True)
+
+    def shutdown_task(self, task_id: str) -> Union[bool, None]:
+        if not self._can_write(f"shutting down task {task_id}"):
+            return None
+        self.writes.append(("shutdown_task", task_id))
+        if task_id not in self.tasks or ("shutdown_task", task_id) in self.failing_writes:
+            return None
+        self.finish_task(task_id)
+        return True
+
+
+def merge_patch(target: dict, patch: dict) -> None:
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class FakeKubernetesApiClient(KubernetesApiClient):
+    """An API server keeping objects by path, shared between clients through objects; every request fails while is_down."""
+
+    _resource_versions = itertools.count(1)
+
+    def __init__(self, objects: Union[Dict[str, dict], None] = None):
+        super().__init__()
+        self.objects: Dict[str, dict] = objects if objects is not None else {}
+        self.is_down = False
+        self.requests: List[Tuple[str, str]] = []
+
+    def is_in_cluster(self) -> bool:
+        return True
+
+    def _store(self, path: str, obj: dict) -> dict:
+        obj = copy.deepcopy(obj)
+        obj.setdefault("metadata", {})["resourceVersion"] = str(next(self._resource_versions))
+        self.objects[path] = obj
+        return copy.deepcopy(obj)
+
+    def request(self, method: str, path: str, json: Union[dict, None] = None, content_type: str = "application/json") -> Union[dict, None]:
+        self.requests.append((method, path))
+        if self.is_down:
+            return None
+        if method == "GET":
+            return copy.deepcopy(self.objects.get(path))
+        if method == "POST":
+            path = f"{path}/{json['metadata']['name']}"
+            return None if path in self.objects else self._store(path, json)
+        # The scale subresource patches the StatefulSet itself.
+        stored = self.objects.get(path[:-len("/scale")] if path.endswith("/scale") else path)
+        if stored is None:
+            return None
+        if method == "PUT":
+            # Like the API server, an update carrying a stale resourceVersion conflicts.
+            if (json.get("metadata") or {}).get("resourceVersion") != stored["metadata"]["resourceVersion"]:
+                return None
+            return self._store(path, json)
+        if method == "PATCH":
+            obj = copy.deepcopy(stored)
+            merge_patch(obj, json)
+            return self._store(path[:-len("/scale")] if path.endswith("/scale") else path, obj)
+        return None
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from druid_autoscaler import AutoscalerMeta
+from fakes import FakeDruidApiHelper, FakeStateStores
+
+NOW = 1_700_000_000.0
+
+
+class AutoscalerMetaTest(unittest.TestCase):
+    def setUp(self):
+        self.stores = FakeStateStores()
+        for patcher in (mock.patch("druid_autoscaler.get_state_store", self.stores), mock.patch.dict(AutoscalerMeta._instances, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.druid = FakeDruidApiHelper(6)
+        self.meta = AutoscalerMeta()
+
+    def disable(self, *mm_ids):
+        for mm_id in mm_ids:
+            self.druid.middle_managers[mm_id].is_enabled = False
+
+    def test_reconcile_counts_the_disabled_top_ordinals(self):
+        self.disable(5, 4, 2)
+        self.meta.reconcile(self.druid.snapshot(NOW))
+        self.assertEqual(self.meta.get_disable_mm_count(), 2)
+        self.assertEqual(self.stores().load()["disable_mm_count"], 2)
+
+    def test_reconcile_drops_a_count_the_overlord_no_longer_shows(self):
+        self.meta.inc_disable_mm_count()
+        self.meta.reconcile(self.druid.snapshot(NOW))
+        self.assertEqual(self.meta.get_disable_mm_count(), 0)
+
+    def test_reconcile_keeps_the_count_when_a_middle_manager_is_missing(self):
+        self.disable(5)
+        self.meta.inc_disable_mm_count()
+        self.meta.inc_disable_mm_count()
+        # The overlord lists five workers, but not MM-4, where the walk from the top starts.
+        del self.druid.middle_managers[4]
+        self.meta.reconcile(self.druid.snapshot(NOW))
+        self.assertEqual(self.meta.get_disable_mm_count(), 2)
+
+    def test_state_survives_a_restart(self):
+        self.meta.inc_disable_mm_count()
+        self.meta.set_prev_scale_state(5)
+        self.meta.set_stray_mm_ids([1])
+        AutoscalerMeta._instances.clear()
+        restored = AutoscalerMeta()
+        self.assertIsNot(restored, self.meta)
+        self.assertEqual((restored.get_disable_mm_count(), restored.get_prev_scale_state(), restored.get_stray_mm_ids()), (1, 5, [1]))
+
+    def test_unchanged_values_are_not_saved(self):
+        self.meta.set_prev_scale_state(5)
+        with mock.patch.object(self.meta.store, "save", wraps=self.meta.store.save) as save:
+            self.meta.set_prev_scale_state(5)
+            self.meta.reconcile(self.druid.snapshot(NOW))
+            save.assert_not_called()
+            self.meta.set_prev_scale_state(0)
+            save.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
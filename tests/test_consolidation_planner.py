@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime, timezone
+
+from cluster_snapshot import ClusterSnapshot
+from consolidation_planner import ConsolidationPlanner
+from druid_conf import DruidConfig
+
+NOW = 1_000_000.0
+
+
+def snapshot(task_ages):
+    """Builds a snapshot with one middle-manager per entry of task_ages, each running tasks of the given ages in seconds."""
+    conf = DruidConfig()
+    workers, running_tasks = [], []
+    for mm_id, ages in enumerate(task_ages):
+        task_ids = [f"task-{mm_id}-{i}" for i in range(len(ages))]
+        host = f"{conf.middle_manager}-{mm_id}.{conf.mm_service}:{conf.mm_port}"
+        workers.append({"worker": {"host": host, "capacity": 4, "version": "1"}, "currCapacityUsed": len(ages), "runningTasks": task_ids})
+        for task_id, age in zip(task_ids, ages):
+            created_time = datetime.fromtimestamp(NOW - age, timezone.utc).isoformat().replace("+00:00", "Z")
+            running_tasks.append({"id": task_id, "createdTime": created_time})
+    return ClusterSnapshot(workers, [], running_tasks, NOW)
+
+
+class ConsolidationPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.planner = ConsolidationPlanner()
+        self.conf = DruidConfig()
+        self.task_duration = self.conf.expected_task_duration
+
+    def test_idle_middle_managers_drain_from_the_top(self):
+        plan = self.planner.plan(snapshot([[0], [], [], []]), 1)
+        self.assertEqual(plan.drain_mm_ids, [3, 2, 1])
+        self.assertEqual(plan.drain_times, {3: 0.0, 2: 0.0, 1: 0.0})
+
+    def test_nothing_to_drain_at_target(self):
+        self.assertEqual(self.planner.plan(snapshot([[0], [0]]), 2).drain_mm_ids, [])
+
+    def test_drain_time_is_the_longest_remaining_task(self):
+        ages = [self.task_duration - 100, self.task_duration - 400]
+        self.assertAlmostEqual(self.planner.estimate_drain_time(0, snapshot([ages])), 400, places=3)
+
+    def test_overdue_tasks_drain_right_away(self):
+        self.assertEqual(self.planner.estimate_drain_time(0, snapshot([[self.task_duration + 60]])), 0.0)
+
+    def test_stops_at_the_first_slow_middle_manager_below_the_top(self):
+        slow = [self.task_duration - self.conf.max_drain_time - 60]
+        plan = self.planner.plan(snapshot([[0], [0], slow, []]), 0)
+        self.assertEqual(plan.drain_mm_ids, [3])
+
+    def test_top_middle_manager_drains_however_long_it_takes(self):
+        slow = [0]
+        plan = self.planner.plan(snapshot([[0], slow]), 1)
+        self.assertEqual(plan.drain_mm_ids, [1])
+        self.assertAlmostEqual(plan.drain_times[1], self.task_duration, places=3)
+
+    def test_middle_manager_missing_from_the_overlord_never_drains(self):
+        self.assertEqual(self.planner.estimate_drain_time(5, snapshot([[], []])), float("inf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
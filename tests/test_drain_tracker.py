@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+
+from drain_tracker import DRAINED, DRAINING, OVERDUE, SHUTTING_DOWN, DrainTracker
+from druid_conf import DruidConfig
+from fakes import FakeDruidApiHelper, FakeStateStores
+
+NOW = 1_700_000_000.0
+
+
+class DrainTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.conf = DruidConfig()
+        self.stores = FakeStateStores()
+        patcher = mock.patch("drain_tracker.get_state_store", self.stores)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.druid = FakeDruidApiHelper(4)
+        self.tracker = DrainTracker(druid_api_helper=self.druid)
+
+    def start(self, *mm_ids):
+        for mm_id in mm_ids:
+            self.druid.middle_managers[mm_id].is_enabled = False
+        self.tracker.start(list(mm_ids), self.druid.snapshot(NOW))
+
+    def phases(self):
+        return {mm_id: drain.phase for mm_id, drain in self.tracker.drains.items()}
+
+    def test_idle_middle_managers_drain_right_away(self):
+        self.druid.add_task(2, "busy", NOW)
+        self.start(3, 2)
+        self.assertEqual(self.tracker.update(self.druid.snapshot(NOW)), [3])
+        self.assertEqual(self.phases(), {3: DRAINED, 2: DRAINING})
+
+    def test_busy_middle_manager_drains_once_its_tasks_finish(self):
+        self.druid.add_task(3, "busy", NOW)
+        self.start(3)
+        self.assertEqual(self.tracker.update(self.druid.snapshot(NOW + 60)), [])
+        self.druid.finish_task("busy")
+        self.assertEqual(self.tracker.update(self.druid.snapshot(NOW + 120)), [3])
+
+    def test_past_the_deadline_without_shutdown_task_types_is_overdue(self):
+        self.druid.add_task(3, "busy", NOW)
+        self.start(3)
+        self.tracker.update(self.druid.snapshot(NOW + self.conf.drain_deadline))
+        self.assertEqual(self.phases(), {3: DRAINING})
+        self.tracker.update(self.druid.snapshot(NOW + self.conf.drain_deadline + 1))
+        self.assertEqual(self.phases(), {3: OVERDUE})
+        self.assertEqual(self.druid.writes, [])
+        # An overdue middle-manager still drains once its tasks are done.
+        self.druid.finish_task("busy")
+        self.assertEqual(self.tracker.update(self.druid.snapshot(NOW + self.conf.drain_deadline + 60)), [3])
+
+    @mock.patch.object(DruidConfig, "drain_shutdown_task_types", ["index_kafka"])
+    def test_past_the_deadline_tasks_of_the_shutdown_types_are_shut_down(self):
+        self.druid.add_task(3, "kafka", NOW, "index_kafka")
+        self.druid.add_task(3, "batch", NOW, "index_parallel")
+        self.start(3)
+        deadline_passed_at = NOW + self.conf.drain_deadline + 1
+        self.tracker.update(self.druid.snapshot(deadline_passed_at))
+        self.assertEqual(self.phases(), {3: SHUTTING_DOWN})
+        self.assertEqual(self.tracker.drains[3].shutdown_at, deadline_passed_at)
+        self.assertEqual(self.druid.writes, [("shutdown_task", "kafka")])
+        # Shutdown is asked for once; the middle-manager then drains like any other.
+        self.tracker.update(self.druid.snapshot(deadline_passed_at + 60))
+        self.assertEqual(self.druid.writes, [("shutdown_task", "kafka")])
+        self.druid.finish_task("batch")
+        self.assertEqual(self.tracker.update(self.druid.snapshot(deadline_passed_at + 120)), [3])
+
+    def test_drains_resume_after_a_restart(self):
+        self.druid.add_task(2, "busy", NOW)
+        self.start(3, 2)
+        self.tracker.update(self.druid.snapshot(NOW))
+        restored = DrainTracker(druid_api_helper=self.druid)
+        self.assertEqual({mm_id: drain.to_dict() for mm_id, drain in restored.drains.items()},
+                         {mm_id: drain.to_dict() for mm_id, drain in self.tracker.drains.items()})
+        # The deadline still counts from the original disable.
+        restored.update(self.druid.snapshot(NOW + self.conf.drain_deadline + 1))
+        self.assertEqual(restored.drains[2].phase, OVERDUE)
+
+    def test_sync_drops_enabled_and_removed_middle_managers(self):
+        self.start(3, 2, 1)
+        self.druid.middle_managers[2].is_enabled = True
+        del self.druid.middle_managers[3]
+        self.tracker.sync(self.druid.snapshot(NOW))
+        self.assertEqual(list(self.tracker.drains), [1])
+        self.assertEqual(list(self.stores(name="drains").load()["drains"]), ["1"])
+
+    def test_start_keeps_a_running_drain(self):
+        self.start(3)
+        self.tracker.start([3, 2], self.druid.snapshot(NOW + 60))
+        self.assertEqual(self.tracker.drains[3].disabled_at, NOW)
+        self.assertEqual(self.tracker.drains[2].disabled_at, NOW + 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
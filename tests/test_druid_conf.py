@@ -0,0 +1,124 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import druid_conf
+from druid_conf import DEFAULT_POOL, ConfigError, DruidConfig, validate_config
+from munch import munchify
+
+ENV = os.environ.get("env", "staging")
+
+
+def read_default_config():
+    return munchify(DruidConfig._read_yaml(druid_conf.CONFIG_PATH))
+
+
+class ValidateConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.config = read_default_config()
+
+    def test_default_config_is_valid(self):
+        self.assertEqual(validate_config(self.config, ENV), [])
+
+    def test_missing_env_block(self):
+        self.assertEqual(validate_config(self.config, "nowhere"), ["No configuration block for env 'nowhere'"])
+
+    def test_wrong_types_are_reported(self):
+        self.config.http.retries = True
+        self.config.max_mm_count = "4"
+        errors = validate_config(self.config, ENV)
+        self.assertIn("http.retries must be int, got True", errors)
+        self.assertIn("max_mm_count must be int, got '4'", errors)
+
+    def test_null_section_is_an_error(self):
+        self.config.scale_down = None
+        self.assertEqual(validate_config(self.config, ENV), ["scale_down must be a mapping, got None"])
+
+    def test_pool_with_wrong_type_skips_its_limit_checks(self):
+        self.config[ENV].pools = munchify([{"name": "batch", "min_mm_count": "2"}])
+        self.assertEqual(validate_config(self.config, ENV), [f"{ENV}.pools.min_mm_count must be int, got '2'"])
+
+    def test_pool_entries_must_be_mappings(self):
+        self.config[ENV].pools = ["batch"]
+        self.assertIn(f"{ENV}.pools entries must be mappings, got 'batch'", validate_config(self.config, ENV))
+
+    def test_pool_names_must_be_unique(self):
+        self.config[ENV].pools = munchify([{"name": "batch"}, {"name": "batch"}])
+        self.assertEqual(validate_config(self.config, ENV), [f"{ENV}.pools need unique names"])
+
+    def test_pool_limits_fall_back_to_global_ones(self):
+        self.config[ENV].pools = munchify([{"name": "batch", "min_mm_count": self.config.max_mm_count + 1}])
+        self.assertEqual(validate_config(self.config, ENV), [f"{ENV}.pools.batch.min_mm_count must be between 0 and max_mm_count"])
+
+    def test_renew_deadline_bounds(self):
+        self.config.leader_election.renew_deadline = self.config.leader_election.lease_duration
+        self.config.http.tick_deadline = self.config.leader_election.renew_deadline
+        errors = validate_config(self.config, ENV)
+        self.assertIn("leader_election.renew_deadline must be shorter than lease_duration", errors)
+        self.assertIn("http.tick_deadline must be shorter than leader_election.renew_deadline", errors)
+
+    def test_tick_bounds_only_apply_with_leader_election(self):
+        self.config.leader_election.enabled = False
+        self.config.scheduler.slow_interval = self.config.leader_election.renew_deadline
+        self.assertEqual(validate_config(self.config, ENV), [])
+
+    def test_negative_max_delta_is_an_error(self):
+        self.config.stabilization.scale_up_max_delta = -1
+        self.assertEqual(validate_config(self.config, ENV), ["stabilization.scale_up_max_delta must not be negative"])
+
+    def test_prewarm_schedule_needs_five_fields(self):
+        self.config.prewarm.schedules = [{"cron": "0 * * *", "min_mm_count": 2}]
+        self.assertEqual(len(validate_config(self.config, ENV)), 1)
+
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.overlay_path = os.path.join(self.directory.name, "overlay.yaml")
+        patcher = mock.patch.object(druid_conf, "OVERLAY_PATH", self.overlay_path)
+        patcher.start()
+        # Cleanups run last in, first out: the real configuration is loaded again once the overlay is gone.
+        self.addCleanup(DruidConfig.load)
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(patcher.stop)
+        DruidConfig.load()
+        self.conf = DruidConfig()
+
+    def write_overlay(self, content):
+        with open(self.overlay_path, "w") as fp:
+            fp.write(content)
+        # Make the change visible to the mtime check even on coarse clocks.
+        mtime = time.time() + len(content)
+        os.utime(self.overlay_path, (mtime, mtime))
+
+    def test_valid_edit_is_applied(self):
+        generation = self.conf.generation
+        self.write_overlay(f"max_mm_count: {self.conf.max_mm_count + 1}\n")
+        self.assertTrue(DruidConfig.reload_if_changed())
+        self.assertEqual(self.conf.max_mm_count, read_default_config().max_mm_count + 1)
+        self.assertEqual(self.conf.generation, generation + 1)
+        self.assertFalse(DruidConfig.reload_if_changed())
+
+    def test_invalid_edit_keeps_the_running_config(self):
+        max_mm_count = self.conf.max_mm_count
+        for content in ("scale_down: null\n", f"{ENV}:\n  pools:\n    - name: batch\n      min_mm_count: '2'\n", "- a list\n", "max_mm_count: [\n"):
+            with self.subTest(content=content):
+                self.write_overlay(content)
+                self.assertFalse(DruidConfig.reload_if_changed())
+                self.assertEqual(self.conf.max_mm_count, max_mm_count)
+
+    def test_pool_list_change_is_rejected(self):
+        self.write_overlay(f"{ENV}:\n  pools:\n    - name: batch\n")
+        self.assertFalse(DruidConfig.reload_if_changed())
+        self.assertEqual(self.conf.pool_names, [DEFAULT_POOL])
+
+    def test_broken_file_at_startup_raises_config_error(self):
+        self.write_overlay("scale_down: null\n")
+        with self.assertRaises(ConfigError):
+            DruidConfig.load()
+
+
+if __name__ == "__main__":
+    unittest.main()
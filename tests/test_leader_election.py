@@ -0,0 +1,131 @@
+import copy
+import unittest
+from unittest import mock
+
+from druid_api_helper import DruidApiHelper
+from druid_autoscaler import AutoscalerMeta
+from druid_conf import DruidConfig
+from fakes import FakeKubernetesApiClient, FakeStateStores
+from kubectl_executer import KubectlExecuter
+from leader_election import LeaderElector
+
+START = 1_700_000_000.0
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class LeaderElectorTest(unittest.TestCase):
+    def setUp(self):
+        self.conf = DruidConfig()
+        self.clock = FakeClock(START)
+        self.objects = {}
+        for patcher in (mock.patch("leader_election.time", self.clock), mock.patch.object(LeaderElector, "_active", None),
+                        mock.patch("leader_election.KubernetesApiClient", lambda: FakeKubernetesApiClient(self.objects))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def replica(self, identity):
+        with mock.patch.dict("os.environ", {"POD_NAME": identity}):
+            return LeaderElector()
+
+    def lease(self):
+        return self.objects[f"/apis/coordination.k8s.io/v1/namespaces/{self.conf.namespace}/leases/{self.conf.lease_name}"]
+
+    def test_first_replica_creates_the_lease_and_the_others_stand_by(self):
+        leader, standby = self.replica("a"), self.replica("b")
+        self.assertTrue(leader.check_leadership())
+        self.assertFalse(standby.check_leadership())
+        self.clock.now += self.conf.lease_duration - 1
+        self.assertTrue(leader.check_leadership())
+        self.clock.now += self.conf.lease_duration - 1
+        self.assertFalse(standby.check_leadership())
+        self.assertEqual(self.lease()["spec"]["holderIdentity"], "a")
+
+    def test_standby_takes_over_an_expired_lease(self):
+        leader, standby = self.replica("a"), self.replica("b")
+        leader.check_leadership()
+        leader.k8s_client.is_down = True
+        self.clock.now += self.conf.lease_duration
+        self.assertTrue(standby.check_leadership())
+        self.assertEqual(standby.term, 1)
+        self.assertEqual(self.lease()["spec"]["holderIdentity"], "b")
+        self.assertEqual(self.lease()["spec"]["leaseTransitions"], 1)
+        leader.k8s_client.is_down = False
+        self.assertFalse(leader.check_leadership())
+
+    def test_only_one_of_racing_standbys_wins(self):
+        leader, first, second = self.replica("a"), self.replica("b"), self.replica("c")
+        leader.check_leadership()
+        self.clock.now += self.conf.lease_duration
+        # Both standbys read the expired lease before either writes it back.
+        stale_lease = copy.deepcopy(self.lease())
+        self.assertTrue(first.check_leadership())
+        put = second.k8s_client.request
+        with mock.patch.object(second.k8s_client, "request", lambda method, path, **kwargs: copy.deepcopy(stale_lease) if method == "GET" else put(method, path, **kwargs)):
+            self.assertFalse(second.check_leadership())
+        self.assertEqual(self.lease()["spec"]["holderIdentity"], "b")
+
+    def test_leader_steps_down_once_renewals_fail_for_renew_deadline(self):
+        leader = self.replica("a")
+        leader.check_leadership()
+        leader.k8s_client.is_down = True
+        self.clock.now += self.conf.renew_deadline - 1
+        self.assertTrue(leader.check_leadership())
+        self.assertTrue(LeaderElector.can_act())
+        # Acting stops on its own once the deadline passes, without waiting for the next renewal attempt.
+        self.clock.now += 1
+        self.assertFalse(leader.is_acting())
+        self.assertFalse(LeaderElector.can_act())
+        self.assertFalse(leader.check_leadership())
+
+    def test_regaining_the_lease_starts_a_new_term(self):
+        leader, standby = self.replica("a"), self.replica("b")
+        leader.check_leadership()
+        self.clock.now += self.conf.lease_duration
+        standby.check_leadership()
+        self.clock.now += self.conf.lease_duration
+        self.assertTrue(leader.check_leadership())
+        self.assertEqual(leader.term, 2)
+
+    def test_deposed_leader_writes_nothing(self):
+        stores = FakeStateStores()
+        with mock.patch("druid_autoscaler.get_state_store", stores), mock.patch.dict(AutoscalerMeta._instances, clear=True):
+            meta = AutoscalerMeta()
+            leader = self.replica("a")
+            leader.check_leadership()
+            meta.inc_disable_mm_count()
+            self.assertEqual(stores().load()["disable_mm_count"], 1)
+
+            self.clock.now += self.conf.renew_deadline
+            meta.inc_disable_mm_count()
+            self.assertEqual(stores().load()["disable_mm_count"], 1)
+
+        druid_api_helper = DruidApiHelper()
+        druid_api_helper.http_requester = mock.Mock()
+        self.assertIsNone(druid_api_helper.disable_idle_mm(3))
+        self.assertIsNone(druid_api_helper.enable_mm(3))
+        self.assertIsNone(druid_api_helper.shutdown_task("task"))
+        druid_api_helper.http_requester.post.assert_not_called()
+
+        kubectl_executor = KubectlExecuter()
+        kubectl_executor.k8s_client = FakeKubernetesApiClient(self.objects)
+        self.assertFalse(kubectl_executor.change_replicas(5))
+        self.assertEqual(kubectl_executor.k8s_client.requests, [])
+
+    def test_disabled_election_always_acts(self):
+        with mock.patch.object(DruidConfig, "leader_election_enabled", False):
+            elector = self.replica("a")
+        self.assertTrue(elector.check_leadership())
+        self.assertTrue(elector.is_acting())
+        self.assertTrue(LeaderElector.can_act())
+        self.assertEqual(self.objects, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from unittest import mock
+
+from druid_autoscaler import AutoscalerMeta, PoolAutoscaler
+from fakes import FakeDruidApiHelper, FakeStateStores
+
+NOW = 1_700_000_000.0
+
+
+class PoolAutoscalerTest(unittest.TestCase):
+    def setUp(self):
+        self.stores = FakeStateStores()
+        for patcher in (mock.patch("druid_autoscaler.get_state_store", self.stores), mock.patch("drain_tracker.get_state_store", self.stores),
+                        mock.patch.dict(AutoscalerMeta._instances, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.druid = FakeDruidApiHelper(4)
+        self.kubectl_executor = mock.Mock(**{"get_replica_state.return_value": None, "change_replicas.return_value": False})
+        self.pool = PoolAutoscaler(druid_api_helper=self.druid, kubectl_executor=self.kubectl_executor)
+
+    def test_scale_up_is_busy_until_its_pods_run(self):
+        self.pool.meta.set_prev_scale_state(6)
+        self.assertTrue(self.pool.execute(self.druid.snapshot(NOW)))
+
+    def test_finished_scale_up_is_not_busy(self):
+        self.pool.meta.set_prev_scale_state(4)
+        self.assertFalse(self.pool.execute(self.druid.snapshot(NOW)))
+        self.kubectl_executor.change_replicas.assert_not_called()
+
+    def test_pending_tasks_are_busy(self):
+        self.druid.pending_tasks = [{"id": "pending", "type": "index_kafka"}]
+        self.assertTrue(self.pool.execute(self.druid.snapshot(NOW)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import calendar
+import unittest
+
+from prewarm import CronExpression, PrewarmWindow
+
+
+def utc(year, month, day, hour=0, minute=0):
+    return calendar.timegm((year, month, day, hour, minute, 0))
+
+
+class CronExpressionTest(unittest.TestCase):
+    def test_fields_are_parsed(self):
+        cron = CronExpression("*/15 9-17 1,15 * 1-5")
+        self.assertEqual(cron.minutes, {0, 15, 30, 45})
+        self.assertEqual(cron.hours, set(range(9, 18)))
+        self.assertEqual(cron.days, {1, 15})
+        self.assertEqual(cron.months, set(range(1, 13)))
+        self.assertEqual(cron.weekdays, {1, 2, 3, 4, 5})
+
+    def test_step_from_a_start_value_runs_to_the_end_of_the_range(self):
+        self.assertEqual(CronExpression("5/20 * * * *").minutes, {5, 25, 45})
+
+    def test_sunday_may_be_written_as_seven(self):
+        self.assertEqual(CronExpression("0 0 * * 7").weekdays, {0})
+
+    def test_invalid_expressions_are_rejected(self):
+        for expression in ("* * * *", "60 * * * *", "* 5-3 * * *", "* * 0 * *", "x * * * *"):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    CronExpression(expression)
+
+    def test_matches_in_utc(self):
+        cron = CronExpression("30 2 * * *")
+        self.assertTrue(cron.matches(utc(2024, 3, 4, 2, 30)))
+        self.assertFalse(cron.matches(utc(2024, 3, 4, 2, 31)))
+        self.assertFalse(cron.matches(utc(2024, 3, 4, 3, 30)))
+
+    def test_weekday_matches(self):
+        # 2024-03-04 is a Monday and 2024-03-10 a Sunday.
+        cron = CronExpression("0 0 * * 1")
+        self.assertTrue(cron.matches(utc(2024, 3, 4)))
+        self.assertFalse(cron.matches(utc(2024, 3, 5)))
+        self.assertTrue(CronExpression("0 0 * * 0").matches(utc(2024, 3, 10)))
+
+    def test_restricted_day_and_weekday_match_when_either_does(self):
+        cron = CronExpression("0 0 1 * 1")
+        self.assertTrue(cron.matches(utc(2024, 3, 1)))
+        self.assertTrue(cron.matches(utc(2024, 3, 4)))
+        self.assertFalse(cron.matches(utc(2024, 3, 5)))
+
+
+class PrewarmWindowTest(unittest.TestCase):
+    def test_active_from_lead_time_before_until_duration_after_a_run(self):
+        window = PrewarmWindow({"cron": "0 12 * * *", "min_mm_count": 3, "lead_time": 300, "duration": 600})
+        run = utc(2024, 3, 4, 12)
+        self.assertFalse(window.is_active(run - 301))
+        self.assertTrue(window.is_active(run - 300))
+        self.assertTrue(window.is_active(run + 600))
+        self.assertFalse(window.is_active(run + 660))
+
+
+if __name__ == "__main__":
+    unittest.main()
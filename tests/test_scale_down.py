@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+from druid_autoscaler import AutoscalerMeta, ScaleDown
+from druid_conf import DruidConfig
+from fakes import FakeDruidApiHelper, FakeKubernetesApiClient, FakeStateStores
+
+NOW = 1_700_000_000.0
+
+
+class ScaleDownTest(unittest.TestCase):
+    def setUp(self):
+        self.conf = DruidConfig()
+        self.stores = FakeStateStores()
+        self.statefulset_path = f"/apis/apps/v1/namespaces/{self.conf.namespace}/statefulsets/{self.conf.middle_manager}"
+        self.k8s_objects = {self.statefulset_path: {"metadata": {"resourceVersion": "1"}, "spec": {"replicas": 8}}}
+        for patcher in (mock.patch("druid_autoscaler.get_state_store", self.stores), mock.patch("drain_tracker.get_state_store", self.stores),
+                        mock.patch.dict(AutoscalerMeta._instances, clear=True),
+                        mock.patch("kubectl_executer.KubernetesApiClient", lambda: FakeKubernetesApiClient(self.k8s_objects))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.druid = FakeDruidApiHelper(8)
+        self.scale_down = ScaleDown(druid_api_helper=self.druid)
+        self.meta = self.scale_down.meta
+
+    def disabled_mm_ids(self):
+        return [mm_id for mm_id, middle_manager in self.druid.middle_managers.items() if not middle_manager.is_enabled]
+
+    def replicas(self):
+        return self.k8s_objects[self.statefulset_path]["spec"]["replicas"]
+
+    def test_middle_managers_disabled_below_a_failed_one_are_enabled_again(self):
+        self.druid.failing_writes = {("disable_mm", 6)}
+        self.assertEqual(self.scale_down._disable_mm_handler([7, 6, 5, 4], self.druid.snapshot(NOW)), 1)
+        self.assertEqual(self.disabled_mm_ids(), [7])
+        self.assertEqual(self.meta.get_disable_mm_count(), 1)
+        self.assertEqual(self.meta.get_stray_mm_ids(), [])
+
+    def test_stray_that_stays_disabled_is_tracked_and_retried(self):
+        self.druid.failing_writes = {("disable_mm", 6), ("enable_mm", 5)}
+        self.scale_down._disable_mm_handler([7, 6, 5, 4], self.druid.snapshot(NOW))
+        self.assertEqual(self.disabled_mm_ids(), [5, 7])
+        self.assertEqual(self.meta.get_stray_mm_ids(), [5])
+        self.assertEqual(self.stores().load()["stray_mm_ids"], [5])
+
+        self.druid.failing_writes = set()
+        self.scale_down.enable_stray_mms(self.druid.snapshot(NOW + 5))
+        self.assertEqual(self.disabled_mm_ids(), [7])
+        self.assertEqual(self.meta.get_stray_mm_ids(), [])
+
+    def test_stray_of_a_removed_pod_is_dropped(self):
+        self.meta.set_stray_mm_ids([7])
+        del self.druid.middle_managers[7]
+        self.scale_down.enable_stray_mms(self.druid.snapshot(NOW))
+        self.assertEqual(self.meta.get_stray_mm_ids(), [])
+        self.assertEqual(self.druid.writes, [])
+
+    def test_removes_only_the_unbroken_run_of_drained_middle_managers_from_the_top(self):
+        # A full scale-down window has been seen, so the stabilizer lets the consolidation through, capped at scale_down_max_delta.
+        self.scale_down.stabilizer.hold(self.druid.snapshot(NOW - self.conf.scale_down_window - 1))
+        self.druid.add_task(0, "steady", NOW)
+        self.druid.add_task(7, "almost-done", NOW - self.conf.expected_task_duration + 60)
+        self.assertTrue(self.scale_down.execute(self.druid.snapshot(NOW)))
+        self.assertEqual(self.disabled_mm_ids(), [6, 7])
+        self.assertEqual(self.meta.get_disable_mm_count(), 2)
+        # MM-6 has drained, but the StatefulSet can't remove it while MM-7 above it still runs a task.
+        self.assertEqual(self.scale_down.drain_tracker.update(self.druid.snapshot(NOW)), [6])
+        self.assertEqual(self.replicas(), 8)
+
+        self.druid.finish_task("almost-done")
+        self.assertTrue(self.scale_down.execute(self.druid.snapshot(NOW + 60)))
+        self.assertEqual(self.replicas(), 6)
+        self.assertEqual(self.meta.get_disable_mm_count(), 0)
+        self.assertEqual(self.scale_down.drain_tracker.drains, {})
+
+    def test_held_back_scale_down_disables_nothing(self):
+        self.assertFalse(self.scale_down.execute(self.druid.snapshot(NOW)))
+        self.assertEqual(self.disabled_mm_ids(), [])
+        self.assertEqual(self.replicas(), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DruidConfig
+from metrics import MM_SPEND
+from slo_policy import SloPolicy, percentile
+
+NOW = 1_700_000_000.0
+
+
+def task(task_id, created_at):
+    return {"id": task_id, "createdTime": datetime.fromtimestamp(created_at, timezone.utc).isoformat().replace("+00:00", "Z")}
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        self.assertEqual(percentile([], 95), 0.0)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+
+
+class SloPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = SloPolicy()
+
+    def window_waits(self):
+        return sorted(self.policy._SloPolicy__window_waits)
+
+    def test_waits_count_every_task_running_for_the_first_time(self):
+        self.policy.observe(ClusterSnapshot([], [task("queued", NOW - 20)], [task("running", NOW - 500)], NOW))
+        # "between" was created and started between the two ticks, so it was never seen pending.
+        running = [task("running", NOW - 500), task("queued", NOW - 20), task("between", NOW + 4)]
+        self.policy.observe(ClusterSnapshot([], [], running, NOW + 10))
+        self.assertEqual(self.window_waits(), [6.0, 30.0])
+
+    def test_first_observation_counts_no_waits(self):
+        self.policy.observe(ClusterSnapshot([], [], [task("running", NOW - 500)], NOW))
+        self.assertEqual(self.window_waits(), [])
+
+    def test_completion_rate_falls_back_to_the_expected_task_duration(self):
+        snapshot = ClusterSnapshot([], [], [task("a", NOW), task("b", NOW)], NOW)
+        self.policy.observe(snapshot)
+        self.assertEqual(self.policy.calc_completion_rate(snapshot), 2 / DruidConfig().expected_task_duration)
+
+    def test_completion_rate_from_observed_completions(self):
+        self.policy.observe(ClusterSnapshot([], [], [task("a", NOW), task("b", NOW)], NOW))
+        snapshot = ClusterSnapshot([], [], [task("b", NOW)], NOW + 60)
+        self.policy.observe(snapshot)
+        self.assertAlmostEqual(self.policy.calc_completion_rate(snapshot), 1 / 60)
+
+    def spend(self):
+        return MM_SPEND.labels(self.policy.pool)._value.get()
+
+    def test_standby_accrues_no_spend_and_reports_no_window(self):
+        window = DruidConfig().slo_report_window
+        workers = [{"worker": {"host": "mm-0"}, "currCapacityUsed": 0}]
+        spend = self.spend()
+        self.policy.observe(ClusterSnapshot(workers, [], [], NOW), is_acting=False)
+        with mock.patch.object(self.policy, "_report") as report:
+            self.policy.observe(ClusterSnapshot(workers, [], [task("running", NOW + 5)], NOW + window), is_acting=False)
+            report.assert_not_called()
+        self.assertEqual(self.window_waits(), [])
+        self.assertEqual(self.spend(), spend)
+        # Standbys still see tasks start, so a takeover doesn't count them again.
+        self.policy.observe(ClusterSnapshot(workers, [], [task("running", NOW + 5)], NOW + window + 10))
+        self.assertEqual(self.window_waits(), [])
+        self.assertGreater(self.spend(), spend)
+
+
+if __name__ == "__main__":
+    unittest.main()
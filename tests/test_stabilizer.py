@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+from cluster_snapshot import ClusterSnapshot
+from druid_conf import DruidConfig
+from stabilizer import ScaleStabilizer
+
+START = 1_000_000.0
+
+
+def snapshot(mm_count, taken_at):
+    workers = [{"worker": {"host": f"mm-{mm_id}", "capacity": 1}, "currCapacityUsed": 0} for mm_id in range(mm_count)]
+    return ClusterSnapshot(workers, [], [], taken_at)
+
+
+class ScaleStabilizerTest(unittest.TestCase):
+    def setUp(self):
+        self.conf = DruidConfig()
+        self.stabilizer = ScaleStabilizer()
+
+    def past_window(self, mm_count):
+        """Returns a time after a full scale-down window of recommendations to keep mm_count."""
+        self.stabilizer.hold(snapshot(mm_count, START))
+        return START + self.conf.scale_down_window
+
+    def test_default_config_lets_a_burst_scale_up_at_once(self):
+        self.assertEqual(self.stabilizer.stabilize_scale_up(40, snapshot(2, START)), 40)
+        self.stabilizer.record_change(2, 40, snapshot(2, START))
+        self.assertEqual(self.stabilizer.stabilize_scale_up(60, snapshot(40, START + 1)), 60)
+        self.assertEqual(self.stabilizer.suppressed, {})
+
+    @mock.patch.object(DruidConfig, "scale_up_max_delta", 4)
+    def test_scale_up_is_capped_per_period(self):
+        max_delta = self.conf.scale_up_max_delta
+        self.assertEqual(self.stabilizer.stabilize_scale_up(2 + max_delta + 3, snapshot(2, START)), 2 + max_delta)
+        self.stabilizer.record_change(2, 4, snapshot(2, START))
+        self.assertEqual(self.stabilizer.stabilize_scale_up(4 + max_delta, snapshot(4, START + 1)), 4 + max_delta - 2)
+        later = START + self.conf.stabilization_period + 1
+        self.assertEqual(self.stabilizer.stabilize_scale_up(4 + max_delta, snapshot(4, later)), 4 + max_delta)
+        self.assertEqual(self.stabilizer.suppressed, {"scale_up_max_delta": 2})
+
+    def test_scale_down_waits_for_a_full_window(self):
+        self.assertEqual(self.stabilizer.stabilize_scale_down(2, snapshot(4, START)), 4)
+        self.assertEqual(self.stabilizer.stabilize_scale_down(2, snapshot(4, START + self.conf.scale_down_window - 1)), 4)
+        self.assertEqual(self.stabilizer.stabilize_scale_down(3, snapshot(4, START + self.conf.scale_down_window)), 3)
+
+    def test_scale_down_takes_the_highest_recommendation_in_the_window(self):
+        now = self.past_window(5)
+        self.assertEqual(self.stabilizer.stabilize_scale_down(4, snapshot(5, now)), 5)
+        self.assertEqual(self.stabilizer.stabilize_scale_down(4, snapshot(5, now + 1)), 4)
+
+    def test_scale_down_is_capped_per_period(self):
+        self.stabilizer.stabilize_scale_down(1, snapshot(8, START))
+        target = self.stabilizer.stabilize_scale_down(1, snapshot(8, START + self.conf.scale_down_window))
+        self.assertEqual(target, 8 - self.conf.scale_down_max_delta)
+
+    def test_scale_down_cools_down_after_any_change(self):
+        now = self.past_window(4)
+        self.stabilizer.record_change(5, 4, snapshot(5, now))
+        self.assertEqual(self.stabilizer.stabilize_scale_down(3, snapshot(4, now + 1)), 4)
+        self.assertIn("scale_down_cooldown", self.stabilizer.suppressed)
+
+    def test_state_round_trips(self):
+        self.stabilizer.hold(snapshot(3, START))
+        self.stabilizer.record_change(2, 3, snapshot(2, START))
+        restored = ScaleStabilizer()
+        restored.set_state(self.stabilizer.get_state())
+        self.assertEqual(restored.get_state(), self.stabilizer.get_state())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import unittest
+from unittest import mock
+
+from druid_api_helper import DruidApiHelper
+from druid_conf import DruidConfig
+from tick_trace import TickTracer
+
+NOW = 1_700_000_000.0
+
+
+def call_from_thread(fn):
+    thread = threading.Thread(target=fn)
+    thread.start()
+    thread.join()
+
+
+@mock.patch.object(DruidConfig, "trace_enabled", False)
+class TickTracerTest(unittest.TestCase):
+    def api_call(self, route):
+        TickTracer.api_call("kubernetes", "GET", route, route, 0.01, True)
+
+    def routes(self, record):
+        return [call["route"] for call in record["api_calls"]]
+
+    def test_calls_from_other_threads_are_left_out(self):
+        TickTracer.start(NOW)
+        self.api_call("tick")
+        call_from_thread(lambda: self.api_call("lease"))
+        self.assertEqual(self.routes(TickTracer.finish(0, True)), ["tick"])
+
+    def test_calls_from_fanned_out_workers_are_kept(self):
+        TickTracer.start(NOW)
+        DruidApiHelper()._fan_out(lambda mm_id: self.api_call(f"mm-{mm_id}"), [0, 1, 2])
+        self.assertEqual(sorted(self.routes(TickTracer.finish(0, True))), ["mm-0", "mm-1", "mm-2"])
+
+    def test_calls_after_the_tick_finished_are_dropped(self):
+        TickTracer.start(NOW)
+        TickTracer.finish(0, True)
+        TickTracer.join_tick()
+        self.api_call("late")
+        self.assertIsNone(TickTracer.finish(0, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
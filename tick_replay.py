@@ -0,0 +1,216 @@
+"""Re-runs the scaling decision of one traced tick offline and compares it with the recorded one.
+
+Reads the ring of files trace.path rotates through (ticks.jsonl, ticks.jsonl.1,
+...). The tick's snapshot, per middle-manager API responses, autoscaler state
+and the values its stateful models derived are put back, and PoolAutoscaler
+runs against them without touching the cluster. Calls the recorded tick didn't
+make are answered as failed reads and successful writes. The replay runs under
+the configuration recorded with the tick, over the current druid_conf.yaml for
+settings added since, and --config is layered on top to try another setting on
+the same tick. Example:
+
+    python tick_replay.py /tmp/druid-mm-autoscaler/ticks.jsonl --list
+    python tick_replay.py /tmp/druid-mm-autoscaler/ticks.jsonl --tick 42 --config '{"scale_down": {"max_step": 1}}'
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from cluster_snapshot import ClusterSnapshot
+from druid_api_helper import DruidApiHelper
+from druid_conf import DEFAULT_POOL, DruidConfig
+from k8s_client import ReplicaState
+from logging_config import logger
+from typing import Dict, List, Tuple, Union
+
+SNAPSHOT_VERSION = "replay"
+
+
+def load_records(path: str) -> List[dict]:
+    records = []
+    for ring_path in [path] + [f"{path}.{i}" for i in range(1, DruidConfig().trace_files)]:
+        if not os.path.isfile(ring_path):
+            continue
+        with open(ring_path) as fp:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    return sorted(records, key=lambda record: record["started_at"])
+
+
+class ReplayHttpRequest:
+    """Answers Druid API calls from the responses recorded for them, in the order they were made."""
+
+    def __init__(self, api_calls: List[dict]):
+        self.responses: Dict[Tuple[str, str], List[dict]] = {}
+        for call in api_calls:
+            if call["service"] == "druid":
+                self.responses.setdefault((call["method"], call["url"]), []).append(call)
+        self.unrecorded: List[str] = []
+        self._lock = threading.Lock()
+
+    def _answer(self, method: str, url: str, default):
+        with self._lock:
+            calls = self.responses.get((method, url))
+            if not calls:
+                self.unrecorded.append(f"{method} {url}")
+                return default
+            call = calls.pop(0) if len(calls) > 1 else calls[0]
+        return call.get("response") if call["ok"] else None
+
+    def get(self, url):
+        return self._answer("GET", url, None)
+
+    def post(self, url, json={}, route=None):
+        return self._answer("POST", url, {})
+
+
+class ReplayKubectlExecuter:
+    def __init__(self, pool: str, replica_state: Union[dict, None]):
+        self.conf = DruidConfig(pool)
+        self.replica_state = replica_state
+        self.desired_replicas: Union[int, None] = None
+
+    def change_replicas(self, desired_replicas: int):
+        self.desired_replicas = desired_replicas
+        return True
+
+    def get_replica_state(self) -> Union[ReplicaState, None]:
+        if self.replica_state is None:
+            return None
+        return ReplicaState(self.replica_state["replicas"], self.replica_state["ready_replicas"])
+
+
+def overlay_disabled_mms(snapshot: ClusterSnapshot, pool: str, disabled_mm_ids: List[int]) -> None:
+    """Lays the disabled middle-managers a shadow autoscaler saw over the recorded overlord workers."""
+    pool_snapshot = snapshot.for_pool(pool)
+    mm_ids = {id(pool_snapshot.get_worker(mm_id)): mm_id for mm_id in range(pool_snapshot.running_mm_count)}
+    for payload, worker in zip(pool_snapshot.raw_workers, pool_snapshot.workers):
+        if id(worker) not in mm_ids:
+            continue
+        worker_payload = payload.setdefault("worker", {})
+        if mm_ids[id(worker)] in disabled_mm_ids:
+            worker_payload["version"] = ""
+        elif not worker_payload.get("version"):
+            worker_payload["version"] = SNAPSHOT_VERSION
+
+
+def replay_pool(record: dict, pool: str) -> dict:
+    # Imported here so configuration overrides are in place before the autoscaler reads them.
+    from druid_autoscaler import AutoscalerMeta, PoolAutoscaler, ReplicaCalculator
+    from tick_trace import TickTracer
+
+    pool_record = record["pools"][pool]
+    inputs, derived = pool_record["inputs"], pool_record["derived"]
+
+    class PinnedReplicaCalculator(ReplicaCalculator):
+        """Returns what the stateful demand models derived on the recorded tick, their history isn't in the trace."""
+
+        def calc_pending_demand(self, snapshot: ClusterSnapshot) -> int:
+            return derived["pending_demand"] if "pending_demand" in derived else super().calc_pending_demand(snapshot)
+
+        def calc_forecast_demand(self, snapshot: ClusterSnapshot) -> float:
+            return derived["forecast_demand"] if "forecast_demand" in derived else super().calc_forecast_demand(snapshot)
+
+        def calc_prewarm_mm_count(self, snapshot: ClusterSnapshot) -> int:
+            return derived["prewarm_mm_count"] if "prewarm_mm_count" in derived else super().calc_prewarm_mm_count(snapshot)
+
+        def calc_completion_rate(self, snapshot: ClusterSnapshot) -> float:
+            return derived["completion_rate"] if "completion_rate" in derived else super().calc_completion_rate(snapshot)
+
+    recorded = record["snapshot"]
+    snapshot = ClusterSnapshot(recorded["workers"], recorded["pending_tasks"], recorded["running_tasks"], record["taken_at"])
+    if inputs.get("shadow"):
+        overlay_disabled_mms(snapshot, pool, inputs["disabled_mm_ids"])
+
+    AutoscalerMeta._instances = {}
+    druid_api_helper = DruidApiHelper(pool)
+    druid_api_helper.http_requester = ReplayHttpRequest([call for call in record["api_calls"] if call["pool"] == pool])
+    pool_autoscaler = PoolAutoscaler(pool, druid_api_helper, ReplayKubectlExecuter(pool, derived.get("replica_state")))
+    pool_autoscaler.replica_calculator = PinnedReplicaCalculator(pool)
+    for autoscaler in (pool_autoscaler.scale_up, pool_autoscaler.scale_down):
+        autoscaler.replica_calculator = pool_autoscaler.replica_calculator
+    pool_autoscaler.restore_trace_inputs(inputs)
+
+    TickTracer.start(record["started_at"])
+    pool_autoscaler.execute(snapshot)
+    replayed = TickTracer.finish(0, True)["pools"][pool]
+    return {
+        "recorded": {"branches": pool_record["branches"], "actions": pool_record["actions"]},
+        "replayed": {"branches": replayed["branches"], "actions": replayed["actions"]},
+        "is_same": replayed["branches"] == pool_record["branches"] and replayed["actions"] == pool_record["actions"],
+        "unrecorded_calls": druid_api_helper.http_requester.unrecorded,
+    }
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay the scaling decision of a traced MIDAS tick")
+    parser.add_argument("path", help="tick trace file, trace.path; its rotated files are read too")
+    parser.add_argument("--tick", type=int, help="tick_id of the record to replay")
+    parser.add_argument("--pool", help="only replay this pool")
+    parser.add_argument("--config", help="JSON object deep-merged over the tick's configuration before the replay")
+    parser.add_argument("--current-config", action="store_true", help="replay under the current druid_conf.yaml instead of the tick's configuration")
+    parser.add_argument("--list", action="store_true", help="list the traced ticks instead")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the autoscaler's own logging")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.path)
+    if args.list:
+        for record in records:
+            pools = ", ".join(f"{pool}: {'/'.join(branch['branch'] for branch in pool_record['branches']) or '-'} "
+                              f"{len(pool_record['actions'])} actions" for pool, pool_record in record["pools"].items())
+            print(f"{record['tick_id']:>8}  {record['started_at']:.0f}  {record['duration']:.3f}s  "
+                  f"{'leader' if record['is_leader'] else 'standby'}  {len(record['api_calls'])} calls  {pools}")
+        return 0
+    # A restarted autoscaler numbers its ticks from 1 again, the latest record with the id wins.
+    matching = [record for record in records if record["tick_id"] == args.tick]
+    if not matching:
+        print(f"No traced tick {args.tick} in {args.path}", file=sys.stderr)
+        return 1
+    record = matching[-1]
+    if "snapshot" not in record:
+        print(f"Tick {args.tick} has no snapshot, it was traced with trace.include_snapshot off or the overlord was unreachable", file=sys.stderr)
+        return 1
+
+    recorded_config = record.get("config")
+    if recorded_config and not args.current_config:
+        os.environ["env"] = recorded_config["env"]
+        DruidConfig.override(recorded_config["values"])
+    overrides = json.loads(args.config) if args.config else {}
+    overrides.setdefault("state", {})["backend"] = "memory"
+    overrides.setdefault("metrics", {})["enabled"] = False
+    overrides.setdefault("trace", {})["enabled"] = False
+    overrides.setdefault("leader_election", {})["enabled"] = False
+    overrides["shadow"] = {**overrides.get("shadow", {}), "enabled": False, "decision_log": ""}
+    DruidConfig.override(overrides)
+    if not args.verbose:
+        logger.setLevel(logging.ERROR)
+
+    pools = [pool for pool in record["pools"] if args.pool in (None, pool)]
+    if not pools:
+        print(f"Tick {args.tick} has no decision for pool {args.pool or DEFAULT_POOL}", file=sys.stderr)
+        return 1
+    reports = {pool: replay_pool(record, pool) for pool in pools}
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return 0 if all(report["is_same"] for report in reports.values()) else 1
+
+    for pool, report in reports.items():
+        print(f"pool {pool}, tick {record['tick_id']}: {'same decision' if report['is_same'] else 'DIFFERENT decision'}")
+        for side in ("recorded", "replayed"):
+            print(f"  {side}")
+            for branch in report[side]["branches"]:
+                print(f"    branch {json.dumps(branch)}")
+            for action in report[side]["actions"]:
+                print(f"    action {json.dumps(action)}")
+        for call in report["unrecorded_calls"]:
+            print(f"  not in the trace, answered as {'failed' if call.startswith('GET') else 'successful'}: {call}")
+    return 0 if all(report["is_same"] for report in reports.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
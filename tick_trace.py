@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+from logging.handlers import RotatingFileHandler
+from druid_conf import DEFAULT_POOL, DruidConfig
+from logging_config import logger
+from typing import Any, Set, Union
+
+
+class TickTracer:
+    """Builds one structured record per tick and appends it to a size-bounded ring of files for tick_replay.py.
+
+    A record holds the merged configuration the tick ran under, the snapshot,
+    every Druid and Kubernetes API call with its latency and outcome, and per
+    pool the inputs the decision started from, the values derived from state
+    the snapshot doesn't carry, the decision branches taken and the resulting
+    actions. Responses of per middle-manager calls are kept so the decision
+    can be replayed offline.
+
+    Only API calls made on the thread running the tick, or on the worker
+    threads it fans out to, are kept. The leader-election and statefulset
+    watcher threads call the same clients concurrently.
+    """
+
+    _record: Union[dict, None] = None
+    _thread_ids: Set[int] = set()
+    _pool = DEFAULT_POOL
+    _tick_id = 0
+    _writer: Union[logging.Logger, None] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_writer(cls) -> logging.Logger:
+        if cls._writer is None:
+            conf = DruidConfig()
+            os.makedirs(os.path.dirname(os.path.abspath(conf.trace_path)), exist_ok=True)
+            handler = RotatingFileHandler(conf.trace_path, maxBytes=conf.trace_max_bytes, backupCount=conf.trace_files - 1)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            writer = logging.getLogger("midas.tick_trace")
+            writer.propagate = False
+            writer.setLevel(logging.INFO)
+            writer.addHandler(handler)
+            cls._writer = writer
+        return cls._writer
+
+    @classmethod
+    def start(cls, started_at: float) -> None:
+        cls._tick_id += 1
+        cls._pool = DEFAULT_POOL
+        conf = DruidConfig()
+        config = {"env": conf.env, "generation": conf.generation, "values": DruidConfig.to_dict()}
+        with cls._lock:
+            cls._record = {"tick_id": cls._tick_id, "started_at": started_at, "config": config, "api_calls": [], "pools": {}}
+            cls._thread_ids = {threading.get_ident()}
+
+    @classmethod
+    def join_tick(cls) -> None:
+        """Counts the calling worker thread as part of the open tick, for use as a thread pool initializer."""
+        with cls._lock:
+            if cls._record is not None:
+                cls._thread_ids.add(threading.get_ident())
+
+    @classmethod
+    def set_snapshot(cls, snapshot) -> None:
+        if cls._record is None:
+            return
+        cls._record["taken_at"] = snapshot.taken_at
+        if DruidConfig().trace_include_snapshot:
+            cls._record["snapshot"] = {"workers": snapshot.raw_workers, "pending_tasks": snapshot.pending_tasks, "running_tasks": snapshot.running_tasks}
+
+    @classmethod
+    def start_pool(cls, pool: str, inputs: dict) -> None:
+        if cls._record is None:
+            return
+        cls._pool = pool
+        cls._record["pools"][pool] = {"inputs": inputs, "derived": {}, "branches": [], "actions": []}
+
+    @classmethod
+    def _pool_record(cls) -> Union[dict, None]:
+        if cls._record is None:
+            return None
+        return cls._record["pools"].get(cls._pool)
+
+    @classmethod
+    def api_call(cls, service: str, method: str, route: str, url: str, seconds: float, is_ok: bool, response: Any = None) -> None:
+        with cls._lock:
+            if cls._record is None or threading.get_ident() not in cls._thread_ids:
+                return
+            call = {"service": service, "pool": cls._pool, "method": method, "route": route, "url": url, "seconds": round(seconds, 4), "ok": is_ok}
+            if response is not None:
+                call["response"] = response
+            cls._record["api_calls"].append(call)
+
+    @classmethod
+    def record_derived(cls, name: str, value: Any) -> Any:
+        """Keeps the first value a stateful model derived this tick, so replay can pin it, and returns it unchanged."""
+        pool_record = cls._pool_record()
+        if pool_record is not None:
+            pool_record["derived"].setdefault(name, value)
+        return value
+
+    @classmethod
+    def branch(cls, name: str, **details) -> None:
+        pool_record = cls._pool_record()
+        if pool_record is not None:
+            pool_record["branches"].append({"branch": name, **details})
+
+    @classmethod
+    def action(cls, action: str, **details) -> None:
+        pool_record = cls._pool_record()
+        if pool_record is not None:
+            pool_record["actions"].append({"action": action, **details})
+
+    @classmethod
+    def finish(cls, duration: float, is_leader: bool) -> Union[dict, None]:
+        with cls._lock:
+            record = cls._record
+            cls._record = None
+            cls._thread_ids = set()
+        if record is None:
+            return None
+        record["duration"] = round(duration, 4)
+        record["is_leader"] = is_leader
+        if DruidConfig().trace_enabled:
+            try:
+                cls._get_writer().info(json.dumps(record, separators=(",", ":")))
+            except (OSError, TypeError, ValueError) as err:
+                logger.error(f"Couldn't write tick trace {record['tick_id']}: {err}")
+        return record